@@ -27,14 +27,18 @@ from donkeycar.parts.actuator import TwoWheelSteeringThrottle
 # from donkeycar.parts.cv import CvCam
 
 # from manage import add_drivetrain
-from parts.cameras import Jetson_CSI_Camera, CV_USB_Camera
+from parts.cameras import Jetson_CSI_Camera, CV_USB_Camera, Replay_Camera, Synced_Camera_Pair
+from parts.cameras import Frame_Sequence_Gate, Frame_Rate_Logger, Frame_Age_Probe, Stale_Camera_Flag
+from parts.frame_pool import Frame_Buffer_Pool
+from parts.jpeg_frame import Jpeg_Decoder, Jpeg_Tub_Image
+from parts.latency import Frame_Age_Monitor
 from parts.web_controller.web import LocalWebController
 
-from parts.actuators import autobot_platform
+from parts.actuators import get_autobot_platform
 from parts.actuators import AutoBot_Actuator, AutoBot_Flashlight, AutoBot_UV_Flashlight, AutoBot_Camera_Servo
-from parts.actuators import Sensor_RFID, Sensor_Battery, Sensor_US, Sensor_IR
+from parts.actuators import Sensor_RFID, Sensor_Telemetry, AutoBot_Obstacle_Stop
 
-from parts.aruco import ArucoSignDetector
+from parts.aruco import ArucoSignDetector, ArucoSignTable, Async_Aruco_Detector
 
 
 def remove_collected_data(dir_path: str):
@@ -44,10 +48,14 @@ def remove_collected_data(dir_path: str):
 
 
 
-def add_controller(V, cfg):
-	ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE)
+def add_controller(V, cfg, frame_age_monitor=None):
+	ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE, frame_age_monitor=frame_age_monitor)
+	# cam_top/image_array and cam_top/detected_aruco come from the aruco detector;
+	# the async detector returns them for an older frame than cam_top/frame_time
+	aruco_frame_time = 'aruco/frame_time' if cfg.ARUCO_ASYNC else 'cam_top/frame_time'
 	V.add(ctr,
-		  inputs=[f'cam_top/image_array', f'cam_bot/image_array', f'cam_top/detected_aruco', 'tub/num_records', 'user/mode', 'recording'],
+		  inputs=[f'cam_top/image_array', f'cam_bot/image_array', f'cam_top/detected_aruco', 'tub/num_records', 'user/mode', 'recording',
+				  'telemetry/vector', aruco_frame_time, 'cam_bot/frame_time', aruco_frame_time],
 		  outputs=['user/angle', 'user/throttle', 'user/mode', 'recording', 'web/buttons'],
 		  threaded=True)
 
@@ -99,7 +107,27 @@ class DriveMode:
 			user_angle, user_throttle, pilot_angle,
 			pilot_throttle,
 			aruco_angle, aruco_throttle,
+			obstacle_stop=False,
+			camera_stale=False,
 			):
+		angle, throttle = self.select(mode,
+									  user_angle, user_throttle,
+									  pilot_angle, pilot_throttle,
+									  aruco_angle, aruco_throttle)
+		# колеса уже ограничены в потоке serial, здесь только не даем циклу снова разогнаться вперед
+		if obstacle_stop and throttle is not None and throttle > 0:
+			throttle = 0.0
+		# пилот и aruco не едут по последнему кадру камеры, которая переподключается
+		if camera_stale and mode != 'user':
+			throttle = 0.0
+		return angle, throttle
+
+	def select(self,
+			   mode,
+			   user_angle, user_throttle,
+			   pilot_angle, pilot_throttle,
+			   aruco_angle, aruco_throttle,
+			   ):
 		if mode == 'user':
 			return user_angle, user_throttle
 
@@ -132,6 +160,7 @@ class ArucoDriveController(object):
 		if len(signs_dict) == 0:
 			signs_dict = {0: {'name':	'stop', 'exec_time': 10, 'distance_to_marker': 300}}
 		self.signs = signs_dict
+		self.sign_table = ArucoSignTable(signs_dict)
 
 		self.last_detected_sign_id = None
 
@@ -158,21 +187,24 @@ class ArucoDriveController(object):
 	def run_threaded(self,
 					 markerCorners: np.ndarray,
 					 markerIds: np.ndarray,
-					 distances: list) -> (float, float):
-		if type(markerIds) == np.ndarray and type(markerIds) == np.ndarray and type(distances) == list:
+					 distances: np.ndarray) -> (float, float):
+		if type(markerIds) == np.ndarray and type(distances) == np.ndarray:
 			# ids = markerIds.tolist()
 
 			this_time = time.time()
 			if this_time - self.last_sign_detect_time > self.maneuver_execution_time_sec:
 				self.last_sign_detect_time = this_time
 
-				if len(markerIds):
-					selected_id = markerIds[0]
+				# знак, к которому машина ближе всего относительно его порога distance_to_marker
+				known = self.sign_table.known_mask(markerIds)
+				if known.any():
+					known_ids = markerIds[known]
+					ratios = distances[known] / self.sign_table.distance_to_marker[known_ids]
+					nearest = int(np.argmin(ratios))
+					selected_id = int(known_ids[nearest])
 					# if selected_id != self.last_detected_sign_id:
 						# self.last_detected_sign_id = selected_id
-					current_dist_to_marker = distances[0]
-					min_dist_to_marker = self.signs[selected_id]['distance_to_marker']
-					if current_dist_to_marker <= min_dist_to_marker:
+					if ratios[nearest] <= 1:
 						if selected_id == 0:
 							# stop
 							self.angle = 0
@@ -194,8 +226,8 @@ class ArucoDriveController(object):
 							self.angle = 0.8
 							self.throttle = 1
 
-						self.maneuver_execution_time_sec = self.signs[selected_id]['exec_time']
-						self.logger.info(f'[selected_id]: [{selected_id} - {self.signs[selected_id]["name"]}]')
+						self.maneuver_execution_time_sec = self.sign_table.exec_time[selected_id]
+						self.logger.info(f'[selected_id]: [{selected_id} - {self.sign_table.names[selected_id]}]')
 
 		return self.angle, self.throttle
 
@@ -237,34 +269,105 @@ def dual_cam_drive(cfg,
 		ch.setFormatter(logging.Formatter(cfg.LOGGING_FORMAT))
 		logger.addHandler(ch)
 
-	V.add(AutoBot_Actuator(), inputs=['left/throttle', 'right/throttle'])
-
-	control_flashlight = AutoBot_Flashlight()
-	control_uv_flashlight = AutoBot_UV_Flashlight()
-	control_camera_servo = AutoBot_Camera_Servo()
+	autobot_platform = get_autobot_platform()
+	if cfg.AUTOBOT_SERIAL_LATENCY:
+		autobot_platform.hardware.enable_latency_monitor(log_interval=cfg.AUTOBOT_SERIAL_LATENCY_LOG_INTERVAL)
+	if cfg.AUTOBOT_OBSTACLE_STOP:
+		autobot_platform.hardware.enable_obstacle_stop(thresholds=cfg.AUTOBOT_OBSTACLE_STOP_US_THRESHOLDS,
+													   max_forward=cfg.AUTOBOT_OBSTACLE_STOP_MAX_FORWARD)
+	V.add(AutoBot_Obstacle_Stop(platform=autobot_platform), inputs=[], outputs=['obstacle/stop'], threaded=False)
+
+	V.add(AutoBot_Actuator(platform=autobot_platform), inputs=['left/throttle', 'right/throttle'])
+
+	control_flashlight = AutoBot_Flashlight(platform=autobot_platform)
+	control_uv_flashlight = AutoBot_UV_Flashlight(platform=autobot_platform)
+	control_camera_servo = AutoBot_Camera_Servo(platform=autobot_platform)
+
+	# age of the frames processed by each consumer of the cameras
+	frame_age_monitor = None
+	if cfg.CAMERA_FRAME_AGE:
+		frame_age_monitor = Frame_Age_Monitor(log_interval=cfg.CAMERA_FRAME_AGE_LOG_INTERVAL)
+
+	# frame buffers shared by the cameras, the aruco detector and the web stream
+	frame_pool = None
+	cam_top_frame_pool = None
+	if cfg.CAMERA_FRAME_POOL_SIZE:
+		frame_pool = Frame_Buffer_Pool(shape=(cfg.IMAGE_H, cfg.IMAGE_W, 3), size=cfg.CAMERA_FRAME_POOL_SIZE)
+		cam_top_frame_pool = frame_pool
+		if cfg.CSIC_CAM_OUTPUT_FORMAT == 'GRAY8':
+			cam_top_frame_pool = Frame_Buffer_Pool(shape=(cfg.IMAGE_H, cfg.IMAGE_W), size=cfg.CAMERA_FRAME_POOL_SIZE)
+		elif cfg.CSIC_CAM_OUTPUT_FORMAT == 'Y':
+			# whole I420 frames, cam_top publishes their luma plane
+			cam_top_frame_pool = Frame_Buffer_Pool(shape=(cfg.IMAGE_H * 3 // 2, cfg.IMAGE_W), size=cfg.CAMERA_FRAME_POOL_SIZE)
 
 	# setup top camera
-	cam_top = Jetson_CSI_Camera(sensor_id=0,
-								image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H,
-								capture_width=cfg.IMAGE_W, capture_height=cfg.IMAGE_H,
-								framerate=cfg.CAMERA_FRAMERATE, gstreamer_flip=cfg.CSIC_CAM_GSTREAMER_FLIP_PARM)
-	V.add(cam_top, inputs=[], outputs=[f'cam_top/pure_image'], threaded=True)
+	if cfg.CAMERA_REPLAY_TOP:
+		# the Y pool holds whole I420 captures, replayed luma frames are allocated
+		cam_top = Replay_Camera(path=cfg.CAMERA_REPLAY_TOP, mode=cfg.CAMERA_REPLAY_MODE, loop=cfg.CAMERA_REPLAY_LOOP,
+								framerate=cfg.CAMERA_FRAMERATE, image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H,
+								output_format=cfg.CSIC_CAM_OUTPUT_FORMAT,
+								frame_pool=cam_top_frame_pool if cfg.CSIC_CAM_OUTPUT_FORMAT != 'Y' else None)
+		cam_top_outputs = [f'cam_top/pure_image']
+	elif cfg.CSIC_CAM_BRANCHES:
+		# one capture, a frame per branch under a shared cam_top/frame_seq
+		cam_top = Jetson_CSI_Camera(sensor_id=0,
+									capture_width=max(branch[1] for branch in cfg.CSIC_CAM_BRANCHES),
+									capture_height=max(branch[2] for branch in cfg.CSIC_CAM_BRANCHES),
+									framerate=cfg.CAMERA_FRAMERATE, gstreamer_flip=cfg.CSIC_CAM_GSTREAMER_FLIP_PARM,
+									branches=cfg.CSIC_CAM_BRANCHES, branch_pool_size=cfg.CAMERA_FRAME_POOL_SIZE,
+									watchdog_periods=cfg.CAMERA_WATCHDOG_FRAME_PERIODS)
+		cam_top_outputs = [f'cam_top/{branch[0]}' for branch in cfg.CSIC_CAM_BRANCHES]
+	else:
+		cam_top = Jetson_CSI_Camera(sensor_id=0,
+									image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H,
+									capture_width=cfg.IMAGE_W, capture_height=cfg.IMAGE_H,
+									framerate=cfg.CAMERA_FRAMERATE, gstreamer_flip=cfg.CSIC_CAM_GSTREAMER_FLIP_PARM,
+									frame_pool=cam_top_frame_pool, output_format=cfg.CSIC_CAM_OUTPUT_FORMAT,
+									watchdog_periods=cfg.CAMERA_WATCHDOG_FRAME_PERIODS)
+		cam_top_outputs = [f'cam_top/pure_image']
+	V.add(cam_top, inputs=[], outputs=cam_top_outputs + ['cam_top/frame_seq', 'cam_top/frame_time'], threaded=True)
 
 	# setup bottom camera
-	cam_bot = CV_USB_Camera(camera_path='/dev/cams/usb', capture_width=cfg.IMAGE_W, capture_height=cfg.IMAGE_H)
+	if cfg.CAMERA_REPLAY_BOT:
+		cam_bot = Replay_Camera(path=cfg.CAMERA_REPLAY_BOT, mode=cfg.CAMERA_REPLAY_MODE, loop=cfg.CAMERA_REPLAY_LOOP,
+								framerate=cfg.CAMERA_FRAMERATE, image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H,
+								frame_pool=frame_pool)
+	else:
+		cam_bot = CV_USB_Camera(camera_path='/dev/cams/usb', capture_width=cfg.IMAGE_W, capture_height=cfg.IMAGE_H,
+								frame_pool=frame_pool, framerate=cfg.CAMERA_FRAMERATE,
+								watchdog_periods=cfg.CAMERA_WATCHDOG_FRAME_PERIODS, mjpeg=cfg.USB_CAM_MJPEG)
 	# V.add(cam_bot, inputs=[], outputs=[f'cam_bot/pure_image'], threaded=True)
-	V.add(cam_bot, inputs=[], outputs=[f'cam_bot/image_array'], threaded=True)
+	V.add(cam_bot, inputs=[], outputs=[f'cam_bot/image_array', 'cam_bot/frame_seq', 'cam_bot/frame_time'], threaded=True)
 
 	time.sleep(0.4)
 
+	# the watchdogs rebuild dead captures, meanwhile the autopilot modes stop
+	V.add(Stale_Camera_Flag(cameras=[cam_top, cam_bot]), inputs=[], outputs=['cameras/stale'])
+
+	# top and bottom frames closest in capture time, without copies
+	if cfg.CAMERA_SYNC_PAIR:
+		V.add(Synced_Camera_Pair(first=cam_top, second=cam_bot,
+								 max_skew=cfg.CAMERA_SYNC_MAX_SKEW_MS / 1000., history=cfg.CAMERA_SYNC_HISTORY,
+								 log_interval=cfg.FPS_DEBUG_INTERVAL),
+			  inputs=[],
+			  outputs=['pair/cam_top', 'pair/cam_bot', 'pair/cam_top_time', 'pair/cam_bot_time', 'pair/skew_ms', 'pair/new'])
+
 	# fps console counter
 	if cfg.SHOW_FPS:
-		from donkeycar.parts.fps import FrequencyLogger
-		V.add(FrequencyLogger(cfg.FPS_DEBUG_INTERVAL), outputs=["fps/current", "fps/fps_list"])
+		V.add(Frame_Rate_Logger(camera_names=['cam_top', 'cam_bot'], debug_interval=cfg.FPS_DEBUG_INTERVAL),
+			  inputs=['cam_top/frame_seq', 'cam_bot/frame_seq'],
+			  outputs=["fps/current", "fps/loop"])
 
 	aruco_sign_detector = ArucoSignDetector(signs_dict=cfg.ARUCO_SIGNS_DICT,
 											calib_data_path=cfg.ARUCO_CAMERA_CALIB_DATA_PATH,
-											marker_size_mm=cfg.ARUCO_SIGN_SIZE_MM)
+											marker_size_mm=cfg.ARUCO_SIGN_SIZE_MM,
+											frame_pool=frame_pool,
+											frame_age_monitor=frame_age_monitor,
+											tracking=cfg.ARUCO_TRACKING,
+											full_detect_interval=cfg.ARUCO_FULL_DETECT_INTERVAL,
+											roi_margin=cfg.ARUCO_ROI_MARGIN,
+											pyramid_downscale=cfg.ARUCO_PYRAMID_DOWNSCALE,
+											refine_window=cfg.ARUCO_REFINE_WINDOW)
 											# marker_size_mm=38/2)
 	if cfg.ARUCO_SIGNS_SAVE_TO_DIR:
 		aruco_sign_detector.save_signs_to_dir()
@@ -287,15 +390,23 @@ def dual_cam_drive(cfg,
 	# 	  threaded=False)
 
 
-	V.add(aruco_sign_detector,
-		  # inputs=[f'{cfg.ROAD_CAM}/pure_image', f'{cfg.SIGNS_CAM}/pure_image'],
-		  # outputs=[f'{cfg.ROAD_CAM}/image_array', f'{cfg.SIGNS_CAM}/image_array', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
-
-		  # inputs=[f'cam_top/pure_image', f'cam_bot/pure_image'],
-		  inputs=[f'cam_top/pure_image'],
-		  # outputs=[f'cam_top/image_array', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
-		  outputs=[f'cam_top/image_array', f'cam_top/detected_aruco', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
-		  threaded=False)
+	if cfg.ARUCO_ASYNC:
+		# detection on its own thread: the loop takes the latest result, tagged with the frame it came from
+		V.add(Async_Aruco_Detector(detector=aruco_sign_detector, log_interval=cfg.FPS_DEBUG_INTERVAL),
+			  inputs=[cfg.ARUCO_INPUT_IMAGE, 'cam_top/frame_seq', 'cam_top/frame_time'],
+			  outputs=[f'cam_top/image_array', f'cam_top/detected_aruco', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances',
+					   'aruco/frame_seq', 'aruco/frame_time', 'aruco/result_age_ms'],
+			  threaded=True)
+	else:
+		V.add(aruco_sign_detector,
+			  # inputs=[f'{cfg.ROAD_CAM}/pure_image', f'{cfg.SIGNS_CAM}/pure_image'],
+			  # outputs=[f'{cfg.ROAD_CAM}/image_array', f'{cfg.SIGNS_CAM}/image_array', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
+
+			  # inputs=[f'cam_top/pure_image', f'cam_bot/pure_image'],
+			  inputs=[cfg.ARUCO_INPUT_IMAGE, 'cam_top/frame_seq', 'cam_top/frame_time'],
+			  # outputs=[f'cam_top/image_array', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
+			  outputs=[f'cam_top/image_array', f'cam_top/detected_aruco', 'aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
+			  threaded=False)
 
 	V.add(ArucoDriveController(signs_dict=cfg.ARUCO_SIGNS_DICT),
 		  inputs=['aruco/markerCorners', 'aruco/markerIds', 'aruco/distances'],
@@ -307,7 +418,7 @@ def dual_cam_drive(cfg,
 	# - this will add the web controller
 	# - it will optionally add any configured 'joystick' controller
 	#
-	ctr = add_controller(V, cfg)
+	ctr = add_controller(V, cfg, frame_age_monitor=frame_age_monitor)
 
 	# explode the buttons into their own key/values in memory
 	V.add(ExplodeDict(V.mem, "web/"), inputs=['web/buttons'])
@@ -338,6 +449,8 @@ def dual_cam_drive(cfg,
 	# See if we should even run the pilot module.
 	# This is only needed because the part run_condition only accepts boolean
 	V.add(PilotCondition(), inputs=['user/mode'], outputs=['run_pilot'])
+	# the pilot only runs on a new road camera frame
+	V.add(Frame_Sequence_Gate(), inputs=[f'{cfg.ROAD_CAM}/frame_seq', 'run_pilot'], outputs=['run_pilot'])
 
 	def get_record_alert_color(num_records):
 		col = (0, 0, 0)
@@ -487,7 +600,13 @@ def dual_cam_drive(cfg,
 		# 		  inputs=[f'{cfg.ROAD_CAM}/pure_image'],
 		# 		  outputs=[f'{cfg.ROAD_CAM}/pure_image_trans'])
 		# 	inputs = [f'{cfg.ROAD_CAM}/pure_image_trans'] + inputs[1:]
+		if cfg.USB_CAM_MJPEG and cfg.ROAD_CAM == 'cam_bot':
+			# decode the compressed road frame only for the pilot
+			V.add(Jpeg_Decoder(), inputs=['cam_bot/image_array'], outputs=['cam_bot/pure_image'], run_condition='run_pilot')
 		V.add(kl, inputs=inputs, outputs=outputs, run_condition='run_pilot')
+		if frame_age_monitor is not None:
+			V.add(Frame_Age_Probe(monitor=frame_age_monitor, consumer='pilot'),
+				  inputs=[f'{cfg.ROAD_CAM}/frame_time'], outputs=['pilot/frame_age_ms'], run_condition='run_pilot')
 
 	# NOTE: when launch throttle is in effect, pilot speed is set to None
 	#
@@ -499,6 +618,7 @@ def dual_cam_drive(cfg,
 	V.add(DriveMode(), inputs=['user/mode', 'user/angle', 'user/throttle',
 							   'pilot/angle', 'pilot/throttle',
 							   'aruco/angle', 'aruco/throttle',
+							   'obstacle/stop', 'cameras/stale',
 							   ], outputs=['angle', 'throttle'])
 
 	if isinstance(ctr, JoystickController):
@@ -528,38 +648,40 @@ def dual_cam_drive(cfg,
 		types += ['int', 'str', 'vector']
 
 	if cfg.ENABLE_AUTOBOT_TELEMETRY:
-		#V.add(Sensor_RFID(), inputs=[], outputs=['telemetry/rfid'], threaded=False)
+		#V.add(Sensor_RFID(platform=autobot_platform), inputs=[], outputs=['telemetry/rfid'], threaded=False)
 		# inputs += ['telemetry/rfid']
 		# types += ['str']
 
-		V.add(Sensor_Battery(), inputs=[], outputs=['telemetry/battery'], threaded=False)
-		inputs += ['telemetry/battery']
-		types += ['int']
-
-		V.add(Sensor_US(),
-			  inputs=[],
-			  outputs=['telemetry/us1', 'telemetry/us2', 'telemetry/us3', 'telemetry/us4', 'telemetry/us5'],
-			  threaded=False)
-		inputs += ['telemetry/us1', 'telemetry/us2', 'telemetry/us3', 'telemetry/us4', 'telemetry/us5']
-		types += ['int', 'int', 'int', 'int', 'int']
-
-		V.add(Sensor_IR(),
+		# telemetry/vector: [us1..us5, ir1..ir5], telemetry/age_ms: [us, ir, battery]
+		V.add(Sensor_Telemetry(platform=autobot_platform),
 			  inputs=[],
-			  outputs=['telemetry/ir1', 'telemetry/ir2', 'telemetry/ir3', 'telemetry/ir4', 'telemetry/ir5'],
+			  outputs=['telemetry/vector', 'telemetry/battery', 'telemetry/age_ms'],
 			  threaded=False)
-		inputs += ['telemetry/ir1', 'telemetry/ir2', 'telemetry/ir3', 'telemetry/ir4', 'telemetry/ir5']
-		types += ['int', 'int', 'int', 'int', 'int']
+		inputs += ['telemetry/vector', 'telemetry/battery', 'telemetry/age_ms']
+		types += ['nparray', 'int', 'nparray']
 
 	current_tub_path = cfg.DATA_PATH
 	if cfg.AUTO_CREATE_NEW_TUB:
 		current_tub_path = TubHandler(path=cfg.DATA_PATH).create_tub_path()
 	meta += getattr(cfg, 'METADATA', [])
 
+	# an MJPEG road camera is recorded as captured: the JPEG file is written here, the record keeps its name
+	road_cam_jpeg = cfg.USB_CAM_MJPEG and cfg.ROAD_CAM == 'cam_bot'
 	cam_top_tub_writer = TubWriter(f'{current_tub_path}',
 								   inputs=inputs + ['cam/image_array', ],
-								   types=types + ['image_array', ], metadata=meta)
+								   types=types + ['str' if road_cam_jpeg else 'image_array', ], metadata=meta)
 	# V.add(cam_top_tub_writer, inputs=inputs + [f'{cfg.ROAD_CAM}/pure_image'], outputs=["tub/num_records"], run_condition='recording')
-	V.add(cam_top_tub_writer, inputs=inputs + [f'{cfg.ROAD_CAM}/pure_image'], outputs=["tub/num_records"], run_condition='recording')
+	# one record per new road camera frame
+	V.add(Frame_Sequence_Gate(), inputs=[f'{cfg.ROAD_CAM}/frame_seq', 'recording'], outputs=['recording/new_frame'])
+	road_cam_image = f'{cfg.ROAD_CAM}/pure_image'
+	if road_cam_jpeg:
+		V.add(Jpeg_Tub_Image(tub=cam_top_tub_writer.tub, key='cam/image_array'),
+			  inputs=['cam_bot/image_array'], outputs=['cam_bot/jpeg_file'], run_condition='recording/new_frame')
+		road_cam_image = 'cam_bot/jpeg_file'
+	V.add(cam_top_tub_writer, inputs=inputs + [road_cam_image], outputs=["tub/num_records"], run_condition='recording/new_frame')
+	if frame_age_monitor is not None:
+		V.add(Frame_Age_Probe(monitor=frame_age_monitor, consumer='tub'),
+			  inputs=[f'{cfg.ROAD_CAM}/frame_time'], outputs=['tub/frame_age_ms'], run_condition='recording/new_frame')
 
 	print(f"{'-' * 20}\n{'-' * 20}\n{'-' * 20}\n")
 	print(f"You can now go to:\n\n<your hostname.local>:{cfg.WEB_CONTROL_PORT}\nto drive your car.\n")
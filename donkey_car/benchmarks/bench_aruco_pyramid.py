@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска ArUco-меток на уменьшенном кадре против поиска в полном разрешении.
+
+Кадры берутся из записи: видеофайл или каталог с изображениями (например, images
+из tub). Эталон - прежний путь ArucoSignDetector, detectMarkers по всему кадру.
+Для каждого коэффициента уменьшения (parts.aruco.ArucoSignDetector, pyramid_downscale)
+печатаются:
+	- recall: доля меток эталона (кадр, id), найденных на уменьшенном кадре;
+	- лишние: метки, которых нет в эталоне;
+	- ошибка углов после cornerSubPix относительно эталона, пикс, среднее и p95
+	  (углы эталона не уточняются, разница включает и их погрешность, около 0.5 пикс);
+	- кадры в секунду детекции (без декодирования кадров).
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_aruco_pyramid data/tub_1/images --downscale 2 4
+	python3 -m benchmarks.bench_aruco_pyramid drive.mp4 --frames 500 --refine-window 7
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from parts.aruco import ArucoSignDetector
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_frames(path: str, max_frames: int) -> list:
+	"""
+	Прочитать кадры записи в память в оттенках серого.
+	:param path:       Видеофайл или каталог с изображениями.
+	:param max_frames: Максимум кадров.
+	:return:           Список кадров.
+	"""
+	frames = []
+	if os.path.isdir(path):
+		names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+		for name in names[:max_frames]:
+			frame = cv2.imread(os.path.join(path, name), cv2.IMREAD_GRAYSCALE)
+			if frame is not None:
+				frames.append(frame)
+		return frames
+
+	capture = cv2.VideoCapture(path)
+	while len(frames) < max_frames:
+		grabbed, frame = capture.read()
+		if not grabbed:
+			break
+		frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+	capture.release()
+	return frames
+
+
+def detect_all(detector: ArucoSignDetector, frames: list) -> (list, float):
+	"""
+	Найти метки на всех кадрах.
+	:return: Список {id: углы (4, 2)} по кадрам и время детекции, сек.
+	"""
+	results = []
+	start = time.perf_counter()
+	for frame in frames:
+		marker_corners, marker_IDs = detector.detect(frame)
+		found = {}
+		if marker_IDs is not None:
+			for marker_id, corners in zip(marker_IDs, marker_corners):
+				found[int(marker_id)] = np.reshape(corners, (4, 2))
+		results.append(found)
+	return results, time.perf_counter() - start
+
+
+def compare(reference: list, results: list) -> dict:
+	"""
+	Сравнить найденные метки с эталоном.
+	:return: {'recall': ..., 'extra': ..., 'error_mean': ..., 'error_p95': ...}.
+	"""
+	expected = matched = extra = 0
+	errors = []
+	for reference_found, found in zip(reference, results):
+		expected += len(reference_found)
+		for marker_id, corners in found.items():
+			if marker_id not in reference_found:
+				extra += 1
+				continue
+			matched += 1
+			errors.extend(np.linalg.norm(corners - reference_found[marker_id], axis=1))
+	return {'recall': matched / expected if expected else float('nan'),
+			'extra': extra,
+			'error_mean': float(np.mean(errors)) if errors else float('nan'),
+			'error_p95': float(np.percentile(errors, 95)) if errors else float('nan')}
+
+
+def report(name: str, frames: list, elapsed: float, stats: dict = None) -> None:
+	line = f'{name:16s} {len(frames) / elapsed:8.1f} fps  {elapsed / len(frames) * 1000:7.3f} ms/frame'
+	if stats is not None:
+		line += f"  recall {stats['recall']:6.3f}  extra {stats['extra']:4d}  " \
+				f"corner error px mean {stats['error_mean']:6.3f} p95 {stats['error_p95']:6.3f}"
+	print(line)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('source', help='video file or directory of images')
+	parser.add_argument('--frames', type=int, default=1000, help='max frames to read')
+	parser.add_argument('--downscale', type=int, nargs='+', default=[2, 4], help='pyramid downscale factors')
+	parser.add_argument('--refine-window', type=int, default=5, help='half side of the cornerSubPix window, px')
+	parser.add_argument('--repeat', type=int, default=3, help='passes over the frames, the fastest counts')
+	parser.add_argument('--calib', default='./camera_calibartion/calib_data/MultiMatrix.npz',
+						help='camera calibration, required by ArucoSignDetector')
+	args = parser.parse_args()
+
+	frames = load_frames(args.source, args.frames)
+	if not frames:
+		sys.exit(f'no frames in {args.source}')
+	print(f'{len(frames)} frames {frames[0].shape[1]}x{frames[0].shape[0]} from {args.source}')
+
+	# эталон - поиск в полном разрешении
+	detector = ArucoSignDetector(calib_data_path=args.calib)
+	reference, elapsed = min((detect_all(detector, frames) for _ in range(args.repeat)), key=lambda r: r[1])
+	report('single scale', frames, elapsed)
+	print(f'{"":16s} {sum(len(found) for found in reference)} markers in the reference')
+
+	for downscale in args.downscale:
+		detector = ArucoSignDetector(calib_data_path=args.calib,
+									 pyramid_downscale=downscale,
+									 refine_window=args.refine_window)
+		results, elapsed = min((detect_all(detector, frames) for _ in range(args.repeat)), key=lambda r: r[1])
+		report(f'downscale {downscale}', frames, elapsed, compare(reference, results))
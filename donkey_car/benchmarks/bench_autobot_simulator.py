@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сквозной бенчмарк RobotHardware на симуляторе контроллера (parts.autobot_simulator):
+	- скорость постановки команд set_device_value (с подсчетом отправленных и замененных команд);
+	- пропускная способность команд: команды, примененные симулятором, при отправке каждой команды до следующей;
+	- задержка телеметрии: от отправки строки `SU` симулятором до появления значения в get_sensor_value.
+
+Симулятор работает в отдельном процессе. time.monotonic() в Linux общий для всех процессов,
+поэтому моменты отправки и получения сравниваются напрямую.
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_autobot_simulator --us-rate 100 --jitter 0.1
+"""
+
+import time
+import argparse
+import multiprocessing
+
+from parts.autobot_simulator import AutoBot_Simulator
+from parts.actuators import RobotHardware
+
+
+SEQUENCE_MODULO = 1000
+
+
+class Bench_Simulator(AutoBot_Simulator):
+	"""
+	Симулятор, который пишет номер сообщения в первое поле `SU`
+	и сохраняет момент отправки в разделяемую память.
+	"""
+
+	def __init__(self, emit_times, commands_received, **kwargs):
+		super().__init__(**kwargs)
+		self.emit_times = emit_times
+		self.shared_commands_received = commands_received
+
+	def make_value(self, sensor_name: str, sequence: int):
+		value = super().make_value(sensor_name=sensor_name, sequence=sequence)
+		if sensor_name == 'US':
+			return (sequence % SEQUENCE_MODULO, ) + value[1:]
+		return value
+
+	def on_emit(self, sensor_name: str, sequence: int, value, emit_time: float) -> None:
+		if sensor_name == 'US':
+			self.emit_times[sequence % SEQUENCE_MODULO] = emit_time
+
+	def on_command(self, device_name: str, value) -> None:
+		super().on_command(device_name=device_name, value=value)
+		self.shared_commands_received.value += 1
+
+
+def percentile(values: list, q: float) -> float:
+	values = sorted(values)
+	if not values:
+		return float('nan')
+	return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def bench_submit_rate(hardware, simulator_commands, count: int) -> None:
+	"""
+	Скорость постановки команд без ожидания отправки. Это не пропускная способность:
+	команды одного устройства, не успевшие уйти, заменяются более новыми (dropped).
+	"""
+	start_counters = hardware.get_writer_counters()
+	start_received = simulator_commands.value
+	start = time.monotonic()
+	for i in range(count):
+		power = i % 200 - 100
+		hardware.set_device_value(device_name='WHEELS', value={'left': power, 'right': -power})
+		if i % 10 == 0:
+			hardware.set_device_value(device_name='CAMERA_SERVO', value=i % 90 + 2)
+	submit_elapsed = time.monotonic() - start
+	hardware.flush_commands(timeout=5)
+	# даем симулятору разобрать последнюю запись
+	time.sleep(0.1)
+	received = simulator_commands.value - start_received
+	counters = hardware.get_writer_counters()
+	sent = counters['sent'] - start_counters['sent']
+	dropped = counters['dropped'] - start_counters['dropped']
+	calls = count + (count + 9) // 10
+
+	print(f'submit rate (not throughput): {calls / submit_elapsed:12.0f} calls/s  '
+		  f'{submit_elapsed / calls * 1e6:8.2f} us/call')
+	print(f'{"":30s}{calls} calls: {sent} sent, {dropped} dropped, {received} applied by the simulator')
+
+
+def bench_applied_commands(hardware, simulator_commands, count: int) -> None:
+	"""
+	Пропускная способность команд: после каждой команды ждем ее отправки (flush_commands),
+	так что ни одна команда не заменяется. Считаются команды, примененные симулятором.
+	"""
+	start_received = simulator_commands.value
+	start = time.monotonic()
+	for i in range(count):
+		power = i % 200 - 100
+		hardware.set_device_value(device_name='WHEELS', value={'left': power, 'right': -power})
+		hardware.flush_commands(timeout=5)
+	elapsed = time.monotonic() - start
+	# даем симулятору разобрать последнюю запись
+	time.sleep(0.1)
+	received = simulator_commands.value - start_received
+
+	print(f'applied command throughput:   {received / elapsed:12.0f} commands/s  '
+		  f'{received} of {count} applied by the simulator')
+	print(f'writer counters:              {hardware.get_writer_counters()}')
+
+
+def bench_telemetry_latency(hardware, emit_times, duration: float, poll_interval: float) -> None:
+	latencies_ms = []
+	last_sequence = None
+	end = time.monotonic() + duration
+	while time.monotonic() < end:
+		value = hardware.get_sensor_value('US')
+		now = time.monotonic()
+		sequence = value[0]
+		if sequence is not None and sequence != last_sequence:
+			if last_sequence is not None:
+				latencies_ms.append((now - emit_times[sequence]) * 1000)
+			last_sequence = sequence
+		time.sleep(poll_interval)
+
+	print(f'US lines observed:           {len(latencies_ms)}')
+	print(f'telemetry -> get_sensor_value latency, ms: '
+		  f'p50 {percentile(latencies_ms, 50):.3f}  '
+		  f'p95 {percentile(latencies_ms, 95):.3f}  '
+		  f'p99 {percentile(latencies_ms, 99):.3f}  '
+		  f'max {max(latencies_ms) if latencies_ms else float("nan"):.3f}')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--us-rate', type=float, default=100.)
+	parser.add_argument('--ir-rate', type=float, default=100.)
+	parser.add_argument('--jitter', type=float, default=0.1)
+	parser.add_argument('--commands', type=int, default=20000, help='commands for the submit rate')
+	parser.add_argument('--applied-commands', type=int, default=1000, help='commands for the applied throughput')
+	parser.add_argument('--duration', type=float, default=5., help='seconds of telemetry latency sampling')
+	parser.add_argument('--poll-interval', type=float, default=0.0002)
+	args = parser.parse_args()
+
+	emit_times = multiprocessing.Array('d', SEQUENCE_MODULO, lock=False)
+	commands_received = multiprocessing.Value('L', 0)
+	simulator = Bench_Simulator(emit_times=emit_times,
+								commands_received=commands_received,
+								rates_hz={'US': args.us_rate, 'IR': args.ir_rate, 'BATTERY': 1.},
+								jitter=args.jitter)
+	simulator_process = multiprocessing.Process(target=simulator.serve, daemon=True)
+	simulator_process.start()
+
+	hardware = RobotHardware(device=simulator.device, autostart=True, daemon=True, start_delay=0.)
+
+	try:
+		bench_submit_rate(hardware=hardware, simulator_commands=commands_received, count=args.commands)
+		bench_applied_commands(hardware=hardware, simulator_commands=commands_received, count=args.applied_commands)
+		bench_telemetry_latency(hardware=hardware, emit_times=emit_times,
+								duration=args.duration, poll_interval=args.poll_interval)
+	finally:
+		hardware.stop()
+		simulator_process.terminate()
+		simulator_process.join()
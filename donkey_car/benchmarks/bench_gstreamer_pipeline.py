@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк преобразования цвета в GStreamer против cv2.cvtColor в Python.
+
+Источник - videotestsrc, поэтому бенчмарк запускается на любом Linux с OpenCV,
+собранным с GStreamer. Варианты:
+	- BGR + cvtColor: прежний путь Jetson_CSI_Camera, BGR из пайплайна и cvtColor(BGR2RGB) на каждый кадр;
+	- RGB / BGR / GRAY8: кадры сразу в нужном формате (parts.cameras.construct_gstreamer_pipeline).
+
+Для каждого варианта печатаются кадры в секунду и процессорное время процесса
+(включая потоки GStreamer) на кадр.
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_gstreamer_pipeline --frames 600 --width 320 --height 240
+	python3 -m benchmarks.bench_gstreamer_pipeline --nvvidconv     # на Jetson
+"""
+
+import re
+import sys
+import time
+import argparse
+
+import cv2
+
+from parts.cameras import construct_gstreamer_pipeline
+
+
+def bench(name: str, output_format: str, convert_in_python: bool, args) -> None:
+	pipeline = construct_gstreamer_pipeline(capture_width=args.width,
+											capture_height=args.height,
+											display_width=args.width,
+											display_height=args.height,
+											framerate=args.framerate,
+											flip_method=args.flip,
+											output_format=output_format,
+											use_nvvidconv=args.nvvidconv,
+											source=f'videotestsrc is-live=false num-buffers={args.frames + 1} '
+												   f'pattern={args.pattern}')
+	capture = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+	if not capture.isOpened():
+		print(f'{name:16s} failed to open: {pipeline}')
+		return
+
+	frame = None
+	rgb = None
+	# первый кадр - запуск пайплайна
+	grabbed, frame = capture.read()
+	frames = 0
+	start_cpu = time.process_time()
+	start = time.monotonic()
+	while frames < args.frames:
+		grabbed, frame = capture.read(image=frame)
+		if not grabbed:
+			break
+		if convert_in_python:
+			rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+		frames += 1
+	elapsed = time.monotonic() - start
+	cpu = time.process_time() - start_cpu
+	capture.release()
+
+	shape = frame.shape if frame is not None else None
+	print(f'{name:16s} frames {frames:6d}  {frames / elapsed:8.1f} fps  '
+		  f'cpu {cpu / max(frames, 1) * 1000:7.3f} ms/frame  shape {shape}')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--frames', type=int, default=600)
+	parser.add_argument('--width', type=int, default=320)
+	parser.add_argument('--height', type=int, default=240)
+	parser.add_argument('--framerate', type=int, default=30, help='caps framerate, the source is not live')
+	parser.add_argument('--flip', type=int, default=2, help='nvvidconv flip-method')
+	parser.add_argument('--pattern', default='ball', help='videotestsrc pattern')
+	parser.add_argument('--nvvidconv', action='store_true', help='use the Jetson nvvidconv stage')
+	args = parser.parse_args()
+
+	if not re.search(r'GStreamer:\s+YES', cv2.getBuildInformation()):
+		sys.exit('OpenCV is built without GStreamer support')
+
+	bench('BGR + cvtColor', output_format='BGR', convert_in_python=True, args=args)
+	bench('RGB', output_format='RGB', convert_in_python=False, args=args)
+	bench('BGR', output_format='BGR', convert_in_python=False, args=args)
+	bench('GRAY8', output_format='GRAY8', convert_in_python=False, args=args)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк обслуживания нескольких контроллеров на симуляторах (parts.autobot_simulator):
+	- threads: RobotHardware на каждый порт (поток чтения и поток записи на контроллер);
+	- hub:     один RobotHardwareHub на все порты.
+
+Для каждого варианта печатаются запущенные им потоки, процессорное время на строку телеметрии
+и команды, принятые симуляторами.
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_hardware_hub --boards 12 --rate 50 --duration 5
+"""
+
+import time
+import argparse
+import threading
+import multiprocessing
+
+from parts.autobot_simulator import AutoBot_Simulator
+from parts.actuators import RobotHardware
+from parts.hardware_hub import RobotHardwareHub
+
+
+class Counting_Simulator(AutoBot_Simulator):
+	"""
+	Симулятор, который считает принятые команды в разделяемой памяти.
+	"""
+
+	def __init__(self, commands_received, **kwargs):
+		super().__init__(**kwargs)
+		self.shared_commands_received = commands_received
+
+	def on_command(self, device_name: str, value) -> None:
+		super().on_command(device_name=device_name, value=value)
+		with self.shared_commands_received.get_lock():
+			self.shared_commands_received.value += 1
+
+
+def drive(hardware_list: list, duration: float, command_rate: float) -> None:
+	period = 1. / command_rate
+	end = time.monotonic() + duration
+	i = 0
+	while time.monotonic() < end:
+		power = i % 200 - 100
+		for hardware in hardware_list:
+			hardware.set_device_value(device_name='WHEELS', value={'left': power, 'right': -power})
+		i += 1
+		time.sleep(period)
+
+
+def bench(name: str, boards: int, rate: float, command_rate: float, duration: float) -> None:
+	commands_received = multiprocessing.Value('L', 0)
+	simulators = [Counting_Simulator(commands_received=commands_received,
+									 rates_hz={'US': rate, 'IR': rate, 'BATTERY': 1.})
+				  for _ in range(boards)]
+	processes = [multiprocessing.Process(target=simulator.serve, daemon=True) for simulator in simulators]
+	for process in processes:
+		process.start()
+
+	devices = [simulator.device for simulator in simulators]
+	# считаем только потоки, запущенные этим вариантом
+	threads_before = threading.active_count()
+	if name == 'hub':
+		hub = RobotHardwareHub(devices=devices, start_delay=0.)
+		hardware_list = [hub.get_hardware(device) for device in devices]
+	else:
+		hub = None
+		hardware_list = [RobotHardware(device=device, autostart=True, daemon=True, start_delay=0.) for device in devices]
+
+	try:
+		threads = threading.active_count() - threads_before
+		start_lines = sum(hardware.state.version for hardware in hardware_list)
+		start_cpu = time.process_time()
+		drive(hardware_list=hardware_list, duration=duration, command_rate=command_rate)
+		cpu = time.process_time() - start_cpu
+		# версия снимка растет на каждую строку телеметрии и каждую команду
+		updates = sum(hardware.state.version for hardware in hardware_list) - start_lines
+		for hardware in hardware_list:
+			hardware.flush_commands(timeout=1.)
+		time.sleep(0.1)
+	finally:
+		if hub is not None:
+			hub.stop()
+		else:
+			for hardware in hardware_list:
+				hardware.stop()
+			for hardware in hardware_list:
+				hardware.join(timeout=1.)
+				hardware.command_writer.join(timeout=1.)
+		for process in processes:
+			process.terminate()
+			process.join()
+
+	print(f'{name:8s} boards {boards:3d}  threads {threads:3d}  updates {updates:8d}  '
+		  f'cpu {cpu / duration * 100:6.1f}%  {cpu / max(updates, 1) * 1e6:7.2f} us/update  '
+		  f'commands applied {commands_received.value}')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--boards', type=int, default=12)
+	parser.add_argument('--rate', type=float, default=50., help='US and IR lines per second per board')
+	parser.add_argument('--command-rate', type=float, default=20., help='WHEELS commands per second per board')
+	parser.add_argument('--duration', type=float, default=5.)
+	args = parser.parse_args()
+
+	for name in ('threads', 'hub'):
+		bench(name=name, boards=args.boards, rate=args.rate, command_rate=args.command_rate, duration=args.duration)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк чтения телеметрии с serial через локальную пару pty:
+	- readline:   прежний путь Base_Serial, `serial.readline()` читает по одному байту на системный вызов;
+	- bulk:       Base_Serial._read_lines, чтение всех доступных байтов (`in_waiting`) и разбиение
+				  на строки в parts.telemetry_parser.Line_Framer.
+
+Системные вызовы читающей стороны (os.read, select.select, fcntl.ioctl внутри pyserial)
+считаются обертками на время замера.
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_serial_reader --lines 20000 --rate 2000
+"""
+
+import os
+import pty
+import tty
+import time
+import fcntl
+import select
+import argparse
+import threading
+
+import serial
+
+from benchmarks.bench_telemetry_parser import make_lines
+from parts.telemetry_parser import parse_telemetry_line, Line_Framer
+
+
+class Syscall_Counter(object):
+	"""
+	Подменяет os.read, select.select и fcntl.ioctl обертками со счетчиком.
+	"""
+
+	def __init__(self):
+		self.count = 0
+		self.__originals = []
+
+	def __wrap(self, module, name: str) -> None:
+		original = getattr(module, name)
+		self.__originals.append((module, name, original))
+
+		def counted(*args, **kwargs):
+			self.count += 1
+			return original(*args, **kwargs)
+		setattr(module, name, counted)
+
+	def __enter__(self):
+		self.__wrap(os, 'read')
+		self.__wrap(select, 'select')
+		self.__wrap(fcntl, 'ioctl')
+		return self
+
+	def __exit__(self, *exc):
+		for module, name, original in reversed(self.__originals):
+			setattr(module, name, original)
+		self.__originals = []
+
+
+def feed_pty(master_fd: int, lines: list, rate: float) -> None:
+	"""
+	Отправить строки в ведущую сторону pty, как это делает контроллер.
+	:param rate: Строк в секунду, 0 - без пауз.
+	"""
+	if not rate:
+		data = b''.join(lines)
+		for start in range(0, len(data), 4096):
+			os.write(master_fd, data[start:start + 4096])
+		return
+	period = 1. / rate
+	due = time.monotonic()
+	for line in lines:
+		os.write(master_fd, line)
+		due += period
+		delay = due - time.monotonic()
+		if delay > 0:
+			time.sleep(delay)
+
+
+def read_readline(connection: serial.Serial, count: int) -> int:
+	parsed = 0
+	while parsed < count:
+		line = connection.readline()
+		if not line:
+			break
+		if parse_telemetry_line(line) is not None:
+			parsed += 1
+	return parsed
+
+
+def read_bulk(connection: serial.Serial, count: int) -> int:
+	framer = Line_Framer()
+	parsed = 0
+	while parsed < count:
+		data = connection.read(connection.in_waiting or 1)
+		if not data:
+			break
+		for line in framer.feed(data):
+			if parse_telemetry_line(line) is not None:
+				parsed += 1
+	return parsed
+
+
+def bench(name: str, reader, lines: list, rate: float) -> None:
+	master_fd, slave_fd = pty.openpty()
+	tty.setraw(slave_fd)
+	connection = serial.Serial(os.ttyname(slave_fd), baudrate=115200, timeout=1)
+
+	feeder = threading.Thread(target=feed_pty, args=(master_fd, lines, rate), daemon=True)
+	with Syscall_Counter() as counter:
+		start_cpu = time.process_time()
+		start = time.monotonic()
+		feeder.start()
+		parsed = reader(connection, len(lines))
+		elapsed = time.monotonic() - start
+		cpu = time.process_time() - start_cpu
+	feeder.join()
+	connection.close()
+	os.close(master_fd)
+	os.close(slave_fd)
+
+	print(f'{name:10s} lines {parsed:8d}  {parsed / elapsed:10.0f} lines/s  '
+		  f'syscalls/line {counter.count / max(parsed, 1):7.2f}  '
+		  f'cpu {cpu / max(parsed, 1) * 1e6:8.2f} us/line')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--lines', type=int, default=20000)
+	parser.add_argument('--rate', type=float, default=2000., help='lines per second sent to the pty, 0 - no pacing')
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	lines = make_lines(count=args.lines, seed=args.seed)
+	bench('readline', read_readline, lines=lines, rate=args.rate)
+	bench('bulk', read_bulk, lines=lines, rate=args.rate)
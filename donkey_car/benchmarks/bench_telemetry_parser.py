@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк разбора телеметрии: сколько строк в секунду разбирает
+parts.telemetry_parser по сравнению с прежним RobotHardware.parse_message.
+
+Запуск из каталога donkey_car:
+	python3 -m benchmarks.bench_telemetry_parser --lines 200000
+"""
+
+import argparse
+import datetime
+import random
+import time
+from textwrap import wrap
+
+from parts.telemetry_parser import parse_telemetry_line
+
+
+def make_lines(count: int, seed: int = 0) -> list:
+	"""
+	Сгенерировать поток строк в пропорциях, близких к реальному контроллеру:
+	в основном УЗ и ИК, изредка аккумулятор и RFID.
+	"""
+	rnd = random.Random(seed)
+	lines = []
+	for _ in range(count):
+		kind = rnd.random()
+		if kind < 0.45:
+			lines.append(('SU' + ''.join(f'{rnd.randint(0, 255):03d}' for _ in range(5)) + 'E\r\n').encode())
+		elif kind < 0.9:
+			lines.append(('SI' + ''.join(f'{rnd.randint(0, 255):03d}' for _ in range(5)) + 'E\r\n').encode())
+		elif kind < 0.99:
+			lines.append(f'SA{rnd.randint(0, 100)}E\r\n'.encode())
+		else:
+			lines.append(f'SF{rnd.randint(0, 0xFFFFFF):06X}E\r\n'.encode())
+	return lines
+
+
+class Legacy_Parser(object):
+	"""
+	Прежняя реализация: декодирование строки, перебор всех масок сенсоров,
+	textwrap.wrap и строковая метка времени на каждую строку.
+	"""
+
+	def __init__(self):
+		init_datetime = str(datetime.datetime.now())
+		self.sensors = {
+			name: {'message_mask': mask,
+				   'update_datetime': init_datetime,
+				   'last_change_datetime': init_datetime,
+				   'value': None}
+			for name, mask in (('IR', 'SI'), ('US', 'SU'), ('BATTERY', 'SA'), ('RFID', 'SF'))
+		}
+
+	def parse(self, bytes_message: bytes):
+		message = bytes_message.decode(encoding='utf-8', errors='ignore')
+		if len(message):
+			message = message.replace('\r', '').replace('\n', '')
+		this_datetime = str(datetime.datetime.now())
+		for _sensor_name, _sensor_data in self.sensors.items():
+			message_mask = self.sensors[_sensor_name]['message_mask']
+			if type(message) == str and len(message):
+				if message[:2] == message_mask[:2]:
+					message = str(message)[2:].replace('E', '')
+					if _sensor_name in ['IR', 'US']:
+						raw_values = [int(_value) for _value in wrap(message, 3)]
+						new_value = {_sensor_idx: raw_values[_sensor_idx] for _sensor_idx in range(5)}
+					elif _sensor_name in ['BATTERY', ]:
+						new_value = int(message)
+					else:
+						new_value = str(message)
+					if new_value != self.sensors[_sensor_name]['value']:
+						self.sensors[_sensor_name]['last_change_datetime'] = this_datetime
+					self.sensors[_sensor_name]['update_datetime'] = this_datetime
+					self.sensors[_sensor_name]['value'] = new_value
+
+
+class Prefix_Dispatch_Parser(object):
+	"""
+	Новая реализация в том виде, в каком ее вызывает RobotHardware.parse_message.
+	"""
+
+	def __init__(self):
+		init_time = time.monotonic()
+		self.sensors = {
+			name: {'update_time': init_time, 'last_change_time': init_time, 'value': None}
+			for name in ('IR', 'US', 'BATTERY', 'RFID')
+		}
+
+	def parse(self, message: bytes):
+		parsed = parse_telemetry_line(message)
+		if parsed is None:
+			return
+		sensor_name, new_value = parsed
+		this_time = time.monotonic()
+		sensor = self.sensors[sensor_name]
+		if new_value != sensor['value']:
+			sensor['last_change_time'] = this_time
+		sensor['update_time'] = this_time
+		sensor['value'] = new_value
+
+
+def measure(parser, lines: list, repeats: int) -> float:
+	"""
+	Лучший результат из нескольких прогонов, строк в секунду.
+	"""
+	best = 0.0
+	for _ in range(repeats):
+		start = time.perf_counter()
+		for line in lines:
+			parser.parse(line)
+		elapsed = time.perf_counter() - start
+		best = max(best, len(lines) / elapsed)
+	return best
+
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	arg_parser.add_argument('--lines', type=int, default=200000)
+	arg_parser.add_argument('--repeats', type=int, default=5)
+	args = arg_parser.parse_args()
+
+	lines = make_lines(args.lines)
+	legacy = measure(Legacy_Parser(), lines, args.repeats)
+	prefix = measure(Prefix_Dispatch_Parser(), lines, args.repeats)
+
+	print(f'lines:                {len(lines)}')
+	print(f'legacy parse_message: {legacy:12.0f} lines/s  {1e6 / legacy:6.2f} us/line')
+	print(f'prefix dispatch:      {prefix:12.0f} lines/s  {1e6 / prefix:6.2f} us/line')
+	print(f'speedup:              {prefix / legacy:12.2f}x')
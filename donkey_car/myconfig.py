@@ -32,8 +32,28 @@ CAMERA_FRAMERATE = 20
 CAMERA_TYPE = "JETSON_CSIC"			# (MOCK | JETSON_CSIC | CSIC | PICAM | WEBCAM | CVCAM | V4L | D435 | IMAGE_LIST)
 CAMERA_SENSOR_ID = 0				# in double_cam.py mode specifies camera idx to write frames
 CSIC_CAM_GSTREAMER_FLIP_PARM = 2	# (0 => none , 4 => Flip horizontally, 6 => Flip vertically)
+CSIC_CAM_OUTPUT_FORMAT = 'RGB'		# (RGB | BGR | GRAY8 | Y) converted inside the GStreamer pipeline, Y => luma plane without conversion
+# one sensor, several outputs of a tee pipeline as (name, width, height, format), published as 'cam_top/<name>'
+# with a shared cam_top/frame_seq; 'pure_image' feeds the pilot, the tub and the web stream (None => single output)
+# CSIC_CAM_BRANCHES = [('pure_image', 320, 240, 'RGB'), ('aruco_image', 640, 480, 'Y')]
+CSIC_CAM_BRANCHES = None
 # IMAGE_W, IMAGE_H = 224, 224		# default
 IMAGE_W, IMAGE_H = 320, 240			# custom
+CAMERA_FRAME_POOL_SIZE = 12			# preallocated IMAGE_W x IMAGE_H frames shared by both cameras, the aruco detector and the web stream (0 => allocate per frame)
+CAMERA_WATCHDOG_FRAME_PERIODS = 15		# reopen a camera after this many frame periods without a frame, autopilot modes stop meanwhile (0 => off)
+USB_CAM_MJPEG = False					# USB camera sends MJPEG, frames are decoded only for consumers that need arrays, the web stream and the tub get the JPEG as is
+
+# replay recorded frames instead of a camera: video file, directory of images or tub (None => camera)
+CAMERA_REPLAY_TOP = None
+CAMERA_REPLAY_BOT = None
+CAMERA_REPLAY_MODE = 'realtime'		# (realtime => recorded pace | fixed => CAMERA_FRAMERATE | fast => next frame once the loop took the previous)
+CAMERA_REPLAY_LOOP = True
+
+# pair top and bottom frames by capture time into pair/cam_top, pair/cam_bot, pair/skew_ms, pair/new
+# (each camera keeps CAMERA_SYNC_HISTORY frames, raise CAMERA_FRAME_POOL_SIZE accordingly)
+CAMERA_SYNC_PAIR = False
+CAMERA_SYNC_MAX_SKEW_MS = 20
+CAMERA_SYNC_HISTORY = 4
 
 ROAD_CAM, SIGNS_CAM = 'cam_top', 'cam_bot'
 # ROAD_CAM, SIGNS_CAM = 'cam_bot', 'cam_top'
@@ -50,6 +70,20 @@ JOYSTICK_MAX_THROTTLE = 1
 ### AUTOBOT ODOMETRY ---------------------------------------------------------------------------------------------------
 # ENABLE_AUTOBOT_TELEMETRY = False
 ENABLE_AUTOBOT_TELEMETRY = True
+# rolling p50/p95/p99 of serial write time, command queue delay, telemetry inter-arrival and read age
+# AUTOBOT_SERIAL_LATENCY = True
+AUTOBOT_SERIAL_LATENCY = False
+AUTOBOT_SERIAL_LATENCY_LOG_INTERVAL = 10    # the interval in seconds for printing the latency percentiles into the log
+# stop the wheels from the serial thread when an ultrasonic sensor reads closer than its threshold
+# AUTOBOT_OBSTACLE_STOP = True
+AUTOBOT_OBSTACLE_STOP = False
+AUTOBOT_OBSTACLE_STOP_US_THRESHOLDS = (20, 25, 30, 25, 20)    # US sensors 0-4 in telemetry units, None disables a sensor
+AUTOBOT_OBSTACLE_STOP_MAX_FORWARD = 0    # max forward wheel power (0-100) while the stop is active
+# the asyncio transport (parts.async_serial.Async_RobotHardware) and the web page's /wsTelemetry stream are not used
+# by Autobot_Platform: its parts drive the controller through RobotHardware, which owns the serial port.
+# To use them, open the port with the asyncio transport instead and hand it to the web controller, e.g. in a script
+# without the vehicle's actuator parts:
+#   ctr = LocalWebController(port=WEB_CONTROL_PORT, hardware=Async_RobotHardware(device=os.getenv('HW_SERIAL')))
 
 ### GAMEPAD ------------------------------------------------------------------------------------------------------------
 # USE_JOYSTICK_AS_DEFAULT = False
@@ -61,6 +95,10 @@ USE_JOYSTICK_AS_DEFAULT = True
 SHOW_FPS = True
 FPS_DEBUG_INTERVAL = 10    # the interval in seconds for printing the frequency info into the shell
 
+### FRAME AGE ----------------------------------------------------------------------------------------------------------
+CAMERA_FRAME_AGE = False					# record the age of the frame processed by aruco, the pilot, the tub writer and the MJPEG streams
+CAMERA_FRAME_AGE_LOG_INTERVAL = 10		# the interval in seconds for printing the frame age percentiles into the log
+
 
 ### AUTOPILOT MODELS ---------------------------------------------------------------------------------------------------
 # tensorflow models: (linear | categorical | tflite_linear | tensorrt_linear)
@@ -99,6 +137,17 @@ PI_HOSTNAME = '192.168.42.220'
 # ARUCO_SIGN_SIZE_MM = 38/2
 ARUCO_SIGN_SIZE_MM = 80/2.3
 ARUCO_CAMERA_CALIB_DATA_PATH = './camera_calibartion/calib_data/MultiMatrix.npz'
+ARUCO_INPUT_IMAGE = 'cam_top/pure_image'	# detector input, e.g. 'cam_top/aruco_image' with CSIC_CAM_BRANCHES
+# search found markers only in windows around their predicted position, the whole frame
+# every ARUCO_FULL_DETECT_INTERVAL frames and when a marker is lost
+ARUCO_TRACKING = False
+ARUCO_FULL_DETECT_INTERVAL = 10
+ARUCO_ROI_MARGIN = 0.6				# search window margin around the marker, in marker sizes
+# find markers on a frame downscaled by this factor (2 | 4) and refine their corners with cornerSubPix
+# at full resolution, 1 => single scale; compare with: python3 -m benchmarks.bench_aruco_pyramid <recording>
+ARUCO_PYRAMID_DOWNSCALE = 1
+ARUCO_REFINE_WINDOW = 5				# half side of the cornerSubPix window, px
+ARUCO_ASYNC = False					# detect on a separate thread, the loop uses the latest result instead of waiting for it
 
 ARUCO_SIGNS_SAVE_TO_DIR = True
 ARUCO_SIGNS_DICT = {
@@ -5,13 +5,19 @@ import time
 import json
 import datetime
 import threading
-from textwrap import wrap
 from typing import List, Tuple, Any, Dict
 import logging
 
+import numpy as np
+
 import donkeycar as dk
 from donkeycar.utils import clamp
 
+from parts.telemetry_parser import parse_telemetry_line, Line_Framer
+from parts.hardware_state import Hardware_State, Hardware_Snapshot, Value_State
+from parts.latency import Serial_Latency_Monitor
+from parts.obstacle_stop import Obstacle_Stop
+
 
 
 
@@ -26,14 +32,21 @@ class Base_Serial():
 	"""
 
 	def __init__(self,
-				 device: str = os.getenv('HW_SERIAL', '/dev/ttyUSB0'),
+				 device: str = None,
 				 baudrate: int = 115200,
 				 ):
+		"""
+		:param device:   Порт контроллера. По умолчанию берется из переменной окружения HW_SERIAL.
+		:param baudrate: Скорость порта.
+		"""
+		if device is None:
+			device = os.getenv('HW_SERIAL', '/dev/ttyUSB0')
 		self.device = device
 		self.baudrate = baudrate
 
 		self.serial = serial.Serial(self.device)
 		self.serial.baudrate = self.baudrate
+		self.line_framer = Line_Framer()
 
 	def __encode_message(self,
 						 message: str) -> bytes:
@@ -88,6 +101,30 @@ class Base_Serial():
 		#     data_from_serial = None
 		return data_from_serial
 
+	def _read_bytes(self) -> bytes:
+		"""
+		Считать с контроллера self.serial строку без декодирования.
+
+		:return:
+		"""
+		encoded_message = self.__read_bytes_from_serial()
+		if type(encoded_message) == type(None):
+			return b""
+		return encoded_message
+
+	def _read_lines(self) -> List[bytes]:
+		"""
+		Считать с контроллера self.serial все доступные байты одним чтением и выделить завершенные строки.
+		Если данных нет, блокируется до прихода хотя бы одного байта.
+		В отличие от `serial.readline()` не читает по одному байту на системный вызов.
+
+		:return: Завершенные строки без декодирования, возможно пустой список.
+		"""
+		data = self.serial.read(self.serial.in_waiting or 1)
+		if not data:
+			return []
+		return self.line_framer.feed(data)
+
 	def _read(self) -> str:
 		"""
 		Считать с контроллера self.serial сообщение и декодировать.
@@ -120,7 +157,7 @@ class Threaded_Serial(Base_Serial, threading.Thread):
 	"""
 
 	def __init__(self,
-				 device: str = os.getenv('HW_SERIAL', '/dev/ttyUSB0'),
+				 device: str = None,
 				 baudrate: int = 115200,
 				 daemon=False,
 				 ):
@@ -131,40 +168,236 @@ class Threaded_Serial(Base_Serial, threading.Thread):
 		self.is_active = True
 		threading.Thread.__init__(self, daemon=daemon)
 
-	def parse_message(self, message: str):
+	def parse_message(self, message: bytes):
 		pass
 
 	def stop(self):
 		"""
-		Остановить чтение данных, выполняемое в отдельном потоке (смотри self.run)
+		Остановить чтение данных, выполняемое в отдельном потоке (смотри self.run).
+		Прерывает ожидание в serial.read, поэтому поток завершается, даже если контроллер молчит.
 		:return:
 		"""
 		self.is_active = False
+		self.serial.cancel_read()
 
 	def run(self):
 		"""
 		Читает сообщения с self.serial,
-			декодирует,
+			разбирает,
 			добавляет в self.sensors,
 			в отдельном потоке.
 		:return:
 		"""
 		while self.is_active:
-			message = self._read()
-			self.parse_message(message=message)
+			for message in self._read_lines():
+				self.parse_message(message=message)
 
-class RobotHardware(Threaded_Serial):
+class Command_Slots(object):
 	"""
-	- Клас для взаимодействия с контроллером serial.
-	- Работает в обособленном потоке.
+	- Ячейки команд по устройствам, общие для всех транспортов (Serial_Command_Writer,
+	  Hub_RobotHardware, Async_RobotHardware).
+	- Новая команда заменяет еще не отправленную старую того же устройства.
+	- take() забирает все ожидающие команды одной записью в порядке device_names.
+	- Счетчики записи и ожидание отправки всех команд (wait_idle).
+	"""
+
+	def __init__(self, device_names: List[str]):
+		"""
+		:param device_names: Имена устройств. Порядок задает порядок команд внутри одной записи.
+		"""
+		self.device_names = tuple(device_names)
+
+		self.__lock = threading.Lock()
+		self.__pending = {}
+		self.__submit_times = {}
+		self.__is_idle = threading.Event()
+		self.__is_idle.set()
+
+		self.commands_submitted = 0
+		self.commands_sent = 0
+		# команды, замененные более новой до отправки
+		self.commands_dropped = 0
+		# команды, ушедшие одной записью вместе с другими
+		self.commands_coalesced = 0
+		self.writes = 0
+
+	@property
+	def has_pending(self) -> bool:
+		return bool(self.__pending)
+
+	def submit(self, device_name: str, command: str) -> None:
+		"""
+		Поставить команду в ячейку устройства. Не блокирует вызывающий поток.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		with self.__lock:
+			if device_name in self.__pending:
+				self.commands_dropped += 1
+			self.__pending[device_name] = command
+			self.__submit_times[device_name] = time.monotonic()
+			self.commands_submitted += 1
+			self.__is_idle.clear()
+
+	def take(self) -> Tuple[List[str], List[float]]:
+		"""
+		Забрать все ожидающие команды.
+		:return: Команды в порядке device_names и время их постановки. Пустые списки, если команд нет.
+		"""
+		with self.__lock:
+			pending, submit_times = self.__pending, self.__submit_times
+			self.__pending, self.__submit_times = {}, {}
+			if not pending:
+				self.__is_idle.set()
+		commands = [pending[device_name] for device_name in self.device_names if device_name in pending]
+		return commands, list(submit_times.values())
+
+	def count_write(self, commands: List[str]) -> None:
+		"""
+		Учесть запись команд, полученных из take().
+		:param commands: Команды одной записи.
+		:return:         None.
+		"""
+		self.writes += 1
+		self.commands_sent += len(commands)
+		if len(commands) > 1:
+			self.commands_coalesced += len(commands)
+
+	def write_done(self) -> None:
+		"""
+		Запись закончена: если новых команд нет, wait_idle возвращает True.
+		:return: None.
+		"""
+		with self.__lock:
+			if not self.__pending:
+				self.__is_idle.set()
+
+	def wait_idle(self, timeout: float = 0.5) -> bool:
+		"""
+		Дождаться отправки всех ожидающих команд.
+		:param timeout: Максимальное время ожидания, сек.
+		:return:        True, если все команды отправлены.
+		"""
+		return self.__is_idle.wait(timeout=timeout)
+
+	def get_counters(self) -> Dict[str, int]:
+		"""
+		Получить счетчики записи.
+		:return: Словарь со счетчиками.
+		"""
+		return {
+			'submitted': self.commands_submitted,
+			'sent': self.commands_sent,
+			'dropped': self.commands_dropped,
+			'coalesced': self.commands_coalesced,
+			'writes': self.writes,
+		}
+
+class Serial_Command_Writer(threading.Thread):
 	"""
+	- Поток записи команд на контроллер serial.
+	- Для каждого устройства хранится одна ячейка (Command_Slots): новая команда заменяет ещё не отправленную старую.
+	- Все ожидающие команды отправляются одним вызовом `serial.write` за цикл записи.
+	"""
+
 	def __init__(self,
-				 device: str = os.getenv('HW_SERIAL', '/dev/ttyUSB0'),
-				 baudrate: int = 115200,
-				 autostart: bool = True,
-				 daemon: bool = False,
+				 serial_connection: Base_Serial,
+				 device_names: List[str],
+				 write_interval: float = 0.01,
+				 start_delay: float = 0.,
 				 ):
-		init_datetime = str(datetime.datetime.now())
+		"""
+		:param serial_connection: Соединение, через которое отправляются команды.
+		:param device_names:      Имена устройств. Порядок задает порядок команд внутри одной записи.
+		:param write_interval:    Пауза после каждой записи, сек. Раньше выполнялась в потоке вызывающего.
+		:param start_delay:       Пауза перед первой записью, сек. Контроллер перезагружается при открытии порта,
+								  команды, поставленные за это время, не теряются, а ждут в ячейках.
+		"""
+		threading.Thread.__init__(self, daemon=True)
+		self.serial_connection = serial_connection
+		self.device_names = tuple(device_names)
+		self.write_interval = write_interval
+		self.start_delay = start_delay
+
+		self.slots = Command_Slots(device_names=device_names)
+		self.__has_pending = threading.Event()
+
+		# Serial_Latency_Monitor, если включено измерение задержек
+		self.latency_monitor = None
+
+		self.is_active = True
+
+	def submit(self, device_name: str, command: str) -> None:
+		"""
+		Поставить команду в ячейку устройства. Не блокирует вызывающий поток.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		self.slots.submit(device_name=device_name, command=command)
+		self.__has_pending.set()
+
+	def flush(self, timeout: float = 0.5) -> bool:
+		"""
+		Дождаться отправки всех ожидающих команд.
+		:param timeout: Максимальное время ожидания, сек.
+		:return:        True, если все команды отправлены.
+		"""
+		if not self.is_alive():
+			return not self.slots.has_pending
+		return self.slots.wait_idle(timeout=timeout)
+
+	def get_counters(self) -> Dict[str, int]:
+		"""
+		Получить счетчики записи.
+		:return: Словарь со счетчиками.
+		"""
+		return self.slots.get_counters()
+
+	def stop(self):
+		"""
+		Остановить поток записи.
+		:return:
+		"""
+		self.is_active = False
+		self.__has_pending.set()
+
+	def run(self):
+		"""
+		Забирает все ожидающие команды и отправляет их на контроллер одной записью.
+		:return:
+		"""
+		if self.start_delay:
+			time.sleep(self.start_delay)
+		while self.is_active:
+			self.__has_pending.wait(timeout=0.1)
+			self.__has_pending.clear()
+			commands, submit_times = self.slots.take()
+			if not commands:
+				continue
+
+			message = ''.join(commands)
+			write_start_time = time.monotonic()
+			self.serial_connection.write(message=message)
+			if self.latency_monitor is not None:
+				self.latency_monitor.record_write(start_time=write_start_time,
+												  end_time=time.monotonic(),
+												  payload_size=len(message),
+												  submit_times=submit_times)
+			self.slots.count_write(commands)
+
+			time.sleep(self.write_interval)
+			self.slots.write_done()
+
+class AutoBot_Protocol(object):
+	"""
+	- Команды и телеметрия контроллера AutoBot без привязки к транспорту.
+	- Хранит маски команд и состояние сенсоров и устройств (self.state).
+	- Транспорт реализует submit_command и передает принятые строки в parse_message.
+	"""
+	def __init__(self):
+		init_time = time.monotonic()
 		self.__sensor_mask_placeholder = '@'
 
 		self.sensors = {
@@ -172,52 +405,31 @@ class RobotHardware(Threaded_Serial):
 				# SI 014 012 012 013 013 E
 				'IR': {
 					'message_mask': "SI",
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': {int(ir_sensor_idx): None for ir_sensor_idx in range(5)},  # всего 5 сенсоров
 				},
 
 				# SI  0   1   2   3   4  E
 				# SU 175 065 023 048 047 E
 				'US': {
 					'message_mask': "SU",
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': {int(us_sensor_idx): None for us_sensor_idx in range(5)},  # всего 5 сенсоров
 				},
 
 				'BATTERY': {
 					'message_mask': "SA",
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': None,
 				},
 				'RFID': {
 					'message_mask': "SF",
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': None,
 				},
 			}
 		self.devices = {
 				'FLASHLIGHT': {
 					'message_mask': f'ZSU{"++"}000{self.__sensor_mask_placeholder}00000E',
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': None,
 				},
 				'UV_FLASHLIGHT': {
 					'message_mask': f'ZSU{"++"}{self.__sensor_mask_placeholder}00000000E',
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': None,
 				},
 				# todo: Изменить команды согласно новой прошивке от Игоря
 				'CAMERA_SERVO': {
 					'message_mask': f'ZSS{self.__sensor_mask_placeholder}0000000000E',
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': None,
 				},
 				# todo: Изменить команды согласно новой прошивке от Игоря
 				'WHEELS': {
@@ -226,60 +438,108 @@ class RobotHardware(Threaded_Serial):
 					# rwdir - right wheel direction ['+', '-']
 					# rwval - right wheel power 0 to 100
 					'message_mask': f'ZST0{"lwdir"}00{"lwval"}{"rwdir"}00{"rwval"}E',
-					'update_datetime': init_datetime,
-					'last_change_datetime': init_datetime,
-					'value': {'left': None,
-							  'right': None},
 				},
 			}
-
-		super().__init__(device=device, baudrate=baudrate, daemon=daemon)
-		if autostart:
-			self.start()
-			time.sleep(0.8)
-
-	def parse_message(self, message: str) -> None:
-		"""
-		Распарсить принятое с serial сообщение.
-		В случае совпадения сообщения с маской из self.sensors['sensor_name']['message_mask']
-		обновляет значение сенсора в self.sensors.
-		:param message: Декодированное сообщение с serial.
-		:return:        None.
-		"""
-		this_datetime = str(datetime.datetime.now())
-
-		# print(message)
-
-		# Проходимся по по каждой маске для каждого сенсора
-		for _sensor_name, _sensor_data in self.sensors.items():
-			message_mask = self.sensors[_sensor_name]['message_mask']
-			if type(message) == str and len(message):
-				if message[:2] == message_mask[:2]:
-					message = str(message)[2:].replace('E', '')
-					# парсинг многосоставных датчиков типа УЗ или ИК, данные с которых приходят в одной строке
-					if _sensor_name in ['IR', 'US']:
-						raw_values = [int(_value) for _value in wrap(message, 3)]
-						new_value = {_sensor_idx: raw_values[_sensor_idx] for _sensor_idx in range(5)}
-					elif _sensor_name in ['BATTERY', ]:
-						new_value = int(message)
-					# RFID
-					else:
-						new_value = str(message)
-
-					if new_value != self.sensors[_sensor_name]['value']:
-						self.sensors[_sensor_name]['last_change_datetime'] = this_datetime
-
-					# if _sensor_name not in ['IR', 'US']: print(self.sensors[_sensor_name])
-					self.sensors[_sensor_name]['update_datetime'] = this_datetime
-					self.sensors[_sensor_name]['value'] = new_value
-
-		# print(self.sensors)
-
+		# значения сенсоров и устройств публикуются неизменяемыми снимками (смотри parts.hardware_state)
+		self.state = Hardware_State(
+			sensors={
+				'IR': (None, ) * 5,  # всего 5 сенсоров
+				'US': (None, ) * 5,  # всего 5 сенсоров
+				'BATTERY': None,
+				'RFID': None,
+			},
+			devices={
+				'FLASHLIGHT': None,
+				'UV_FLASHLIGHT': None,
+				'CAMERA_SERVO': None,
+				'WHEELS': {'left': None, 'right': None},
+			},
+			init_time=init_time)
+		self.__united_version = None
+		self.__united = {}
+		# Serial_Latency_Monitor, если включено измерение задержек (смотри self.enable_latency_monitor)
+		self.latency_monitor = None
+		# Obstacle_Stop, если включена остановка перед препятствием (смотри self.enable_obstacle_stop)
+		self.obstacle_stop = None
+		# команда колесам от потока Vehicle не должна уйти после команды остановки из потока serial
+		self.__command_lock = threading.Lock()
+
+	def parse_message(self, message: bytes) -> Tuple[str, Any] or None:
+		"""
+		Распарсить принятую с serial строку.
+		Декодер выбирается по двухбайтовому префиксу (смотри parts.telemetry_parser),
+		новое значение сенсора публикуется в self.state с монотонной меткой времени.
+		:param message: Байты, принятые с serial.
+		:return:        (имя сенсора, значение) или None, если строка не распознана.
+		"""
+		parsed = parse_telemetry_line(message)
+		if parsed is None:
+			return None
+		sensor_name, new_value = parsed
+		update_time = time.monotonic()
+		self.state.publish_sensor(name=sensor_name, value=new_value, update_time=update_time)
+		if self.latency_monitor is not None:
+			self.latency_monitor.record_line(sensor_name=sensor_name, line_time=update_time)
+		if sensor_name == 'US' and self.obstacle_stop is not None:
+			if self.obstacle_stop.update(us_values=new_value, update_time=update_time):
+				self.on_obstacle_stop()
+		return parsed
+
+	def enable_obstacle_stop(self,
+							 thresholds: Tuple[int or None, ...],
+							 max_forward: int = 0,
+							 release_margin: int = 5,
+							 release_count: int = 3) -> Obstacle_Stop:
+		"""
+		Включить остановку перед препятствием по УЗ сенсорам (смотри parts.obstacle_stop).
+		Проверка выполняется при разборе каждой строки `SU`, команда колесам ставится в очередь транспорта сразу,
+		без цикла Vehicle (задержка до записи - смотри on_obstacle_stop).
+		:param thresholds:     Пороги УЗ сенсоров 0-4. None - сенсор не проверяется.
+		:param max_forward:    Максимальная мощность колеса вперед во время сработки, от 0 до 100.
+		:param release_margin: Запас над порогом для сброса сработки.
+		:param release_count:  Сколько строк `SU` подряд без препятствия нужно для сброса.
+		:return:               Obstacle_Stop, флаг сработки - его is_triggered.
+		"""
+		self.obstacle_stop = Obstacle_Stop(thresholds=thresholds,
+										   max_forward=max_forward,
+										   release_margin=release_margin,
+										   release_count=release_count)
+		return self.obstacle_stop
+
+	def on_obstacle_stop(self) -> None:
+		"""
+		Вызывается в потоке чтения при сработке self.obstacle_stop.
+		Повторно отправляет текущее значение колес, которое при активной сработке ограничивается
+		в encode_device_command.
+		Команда не пишется в порт из потока чтения, а заменяет ячейку WHEELS транспорта и уходит
+		следующей записью: в худшем случае через write_interval (0.01 сек по умолчанию) плюс время
+		текущей записи, а в первые start_delay сек после открытия порта (0.8 сек) - не раньше их окончания.
+		:return: None.
+		"""
+		wheels = self.get_device_value(device_name='WHEELS')
+		if wheels['left'] is None or wheels['right'] is None:
+			wheels = {'left': 0, 'right': 0}
+		self.set_device_value(device_name='WHEELS', value=wheels)
+		logger.warning(f"[{self.__class__.__name__}]: obstacle stop, US: {self.obstacle_stop.trigger_values}, "
+					   f"thresholds: {self.obstacle_stop.thresholds}")
+
+	def enable_latency_monitor(self, log_interval: float = 10., window: int = 1024) -> Serial_Latency_Monitor:
+		"""
+		Включить измерение задержек обмена с контроллером (смотри parts.latency).
+		:param log_interval: Период строки со статистикой в логе, сек. None - не писать в лог.
+		:param window:       Размер окна перцентилей.
+		:return:             Serial_Latency_Monitor, статистика доступна через его get_stats().
+		"""
+		if self.latency_monitor is None:
+			self.latency_monitor = Serial_Latency_Monitor(baudrate=getattr(self, 'baudrate', 115200),
+														  window=window,
+														  log_interval=log_interval)
+		return self.latency_monitor
 
 	def get_sensor_value(self, sensor_name: str) -> None \
 													or str \
 													or int \
-													or Dict[int, None or int]:
+													or Tuple[None or int, ...]:
 		"""
 		Получить значение сенсора.
 		:param sensor_name: Имя-ключ сенсора из self.sensors.
@@ -287,7 +547,7 @@ class RobotHardware(Threaded_Serial):
 		"""
 		sensor_name = sensor_name.upper()
 		assert sensor_name in self.sensors.keys(), Exception(f"Bad name for `sensor_name`. Must be one of {[i for i in self.sensors.keys()]}")
-		return self.sensors[sensor_name]['value']
+		return self.state.snapshot.sensors[sensor_name].value
 
 	def get_device_value(self, device_name: str) -> int or Dict[str, None or int]:
 		"""
@@ -297,14 +557,16 @@ class RobotHardware(Threaded_Serial):
 		"""
 		device_name = device_name.upper()
 		assert device_name in self.devices.keys(), Exception(f"Bad name for `device_name`. Must be one of {[i for i in self.devices.keys()]}")
-		return self.devices[device_name]['value']
+		return self.state.snapshot.devices[device_name].value
 
-	def set_device_value(self, device_name: str, value: int or Tuple[int, int] or List[int]) -> int or Dict[str, int]:
+	def encode_device_command(self,
+							  device_name: str,
+							  value: int or Tuple[int, int] or List[int]) -> Tuple[str, str, int or Dict[str, int]]:
 		"""
-		Установить значение для устройства.
+		Проверить значение устройства и сформировать команду для serial.
 		:param device_name: Имя устройства.
 		:param value:       Значение устройства.
-		:return:            Новое значение устройства.
+		:return:            (имя устройства, команда, новое значение устройства).
 		"""
 		device_name = device_name.upper()
 		assert device_name in self.devices.keys(), \
@@ -348,6 +610,8 @@ class RobotHardware(Threaded_Serial):
 													  f"Must be Tuple[left: int, right: int] "
 													  f"where `left` and `right` in range form -100 to 100.\n"
 													  f"GOT:\t{type(value)}\t{value}")
+			if self.obstacle_stop is not None and self.obstacle_stop.is_triggered:
+				value = self.obstacle_stop.clamp_wheels(value)
 			left_wheel_value = str(1000 + abs(value["left"]))[1:]
 			right_wheel_value = str(1000 + abs(value["right"]))[1:]
 
@@ -361,39 +625,179 @@ class RobotHardware(Threaded_Serial):
 		else:
 			raise NotImplementedError
 
-		# print(self.write(message=command_for_serial), command_for_serial)
-		self.write(message=command_for_serial)
-		time.sleep(0.01)
+		return device_name, command_for_serial, new_device_value
 
-		this_datetime = str(datetime.datetime.now())
-		if new_device_value != self.devices[device_name]['value']:
-			self.devices[device_name]['last_change_datetime'] = this_datetime
-		self.devices[device_name]['update_datetime'] = this_datetime
+	def submit_command(self, device_name: str, command: str) -> None:
+		"""
+		Передать команду транспорту. Реализуется транспортом.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		raise NotImplementedError
 
-		self.devices[device_name]['value'] = new_device_value
+	def set_device_value(self, device_name: str, value: int or Tuple[int, int] or List[int]) -> int or Dict[str, int]:
+		"""
+		Установить значение для устройства.
+		:param device_name: Имя устройства.
+		:param value:       Значение устройства.
+		:return:            Новое значение устройства.
+		"""
+		with self.__command_lock:
+			device_name, command_for_serial, new_device_value = self.encode_device_command(device_name=device_name, value=value)
+			self.submit_command(device_name=device_name, command=command_for_serial)
+			# публикация под той же блокировкой: порядок состояний совпадает с порядком команд
+			self.state.publish_device(name=device_name, value=new_device_value, update_time=time.monotonic())
 		return new_device_value
 
+	def get_snapshot(self) -> Hardware_Snapshot:
+		"""
+		Получить согласованный снимок всех сенсоров и устройств за O(1) без блокировок.
+		:return: Последний опубликованный снимок.
+		"""
+		return self.state.snapshot
+
+	def get_snapshot_changed_since(self, version: int) -> Hardware_Snapshot or None:
+		"""
+		Получить снимок, только если он новее версии `version`.
+		:param version: Номер уже обработанного снимка (Hardware_Snapshot.version).
+		:return:        Новый снимок или None, если новых данных нет.
+		"""
+		return self.state.changed_since(version=version)
+
+	def get_sensors_and_devices_states(self) -> Dict[str, Value_State]:
+		"""
+		Получить объединенный словарь сенсоров и устройств из последнего снимка.
+		Словарь собирается один раз на версию снимка и не должен изменяться вызывающим.
+		:return: Имя -> Value_State(value, update_time, last_change_time), время - time.monotonic().
+		"""
+		snapshot = self.state.snapshot
+		if snapshot.version != self.__united_version:
+			united = dict(snapshot.sensors)
+			united.update(snapshot.devices)
+			self.__united, self.__united_version = united, snapshot.version
+		return self.__united
+
 	def get_sensors_and_devices(self) -> dict:
 		"""
-		Получить объединенный словарь из self.sensors и self.devices.
-		:return:
+		Получить объединенный словарь сенсоров и устройств в прежнем виде:
+		имя -> {'value', 'update_datetime', 'last_change_datetime'}, значения IR и US - словари {номер: значение},
+		время - строка str(datetime). Собирается из снимка при каждом вызове,
+		без копирования удобнее get_sensors_and_devices_states.
+		:return: Словарь сенсоров и устройств.
 		"""
+		# time.monotonic() -> время по часам системы
+		wall_offset = time.time() - time.monotonic()
+
+		def to_datetime(monotonic_time: float) -> str:
+			return str(datetime.datetime.fromtimestamp(monotonic_time + wall_offset))
+
 		united = {}
-		united.update({sensor_name: {
-			'value': sensor_value['value'],
-			'update_datetime': sensor_value['update_datetime'],
-			'last_change_datetime': sensor_value['last_change_datetime'],
-		} for (sensor_name, sensor_value) in self.sensors.items()})
-		united.update({device_name: {
-			'value': device_value['value'],
-			'update_datetime': device_value['update_datetime'],
-			'last_change_datetime': device_value['last_change_datetime'],
-		} for (device_name, device_value) in self.devices.items()})
+		for name, state in self.get_sensors_and_devices_states().items():
+			value = state.value
+			if name in ('IR', 'US') and value is not None:
+				value = {idx: sensor_value for idx, sensor_value in enumerate(value)}
+			united[name] = {
+				'value': value,
+				'update_datetime': to_datetime(state.update_time),
+				'last_change_datetime': to_datetime(state.last_change_time),
+			}
 		return united
 
+class RobotHardware(AutoBot_Protocol, Threaded_Serial):
+	"""
+	- Клас для взаимодействия с контроллером serial.
+	- Работает в обособленном потоке.
+	"""
+	def __init__(self,
+				 device: str = None,
+				 baudrate: int = 115200,
+				 autostart: bool = True,
+				 daemon: bool = False,
+				 write_interval: float = 0.01,
+				 start_delay: float = 0.8,
+				 ):
+		"""
+		:param device:         Порт контроллера. По умолчанию берется из переменной окружения HW_SERIAL.
+		:param baudrate:       Скорость порта.
+		:param autostart:      Сразу запустить потоки чтения и записи.
+		:param daemon:         Поток чтения - демон.
+		:param write_interval: Пауза после каждой записи команд, сек.
+		:param start_delay:    Пауза перед первой записью команд, пока контроллер загружается, сек.
+							   Выдерживается потоком записи и не блокирует вызывающего.
+		"""
+		AutoBot_Protocol.__init__(self)
+		Threaded_Serial.__init__(self, device=device, baudrate=baudrate, daemon=daemon)
+		self.command_writer = Serial_Command_Writer(serial_connection=self,
+													device_names=['WHEELS', 'FLASHLIGHT', 'UV_FLASHLIGHT', 'CAMERA_SERVO'],
+													write_interval=write_interval,
+													start_delay=start_delay)
+		if autostart:
+			self.start()
+
+	def start(self):
+		"""
+		Запустить поток чтения и поток записи команд.
+		:return:
+		"""
+		self.command_writer.start()
+		Threaded_Serial.start(self)
+
+	def stop(self):
+		"""
+		Остановить поток чтения и поток записи команд.
+		:return:
+		"""
+		self.command_writer.stop()
+		Threaded_Serial.stop(self)
+
+	def flush_commands(self, timeout: float = 0.5) -> bool:
+		"""
+		Дождаться отправки всех поставленных в очередь команд.
+		:param timeout: Максимальное время ожидания, сек.
+		:return:        True, если все команды отправлены.
+		"""
+		return self.command_writer.flush(timeout=timeout)
+
+	def get_writer_counters(self) -> Dict[str, int]:
+		"""
+		Получить счетчики потока записи: отправленные, замененные до отправки и объединенные команды.
+		:return: Словарь со счетчиками.
+		"""
+		return self.command_writer.get_counters()
+
+	def enable_latency_monitor(self, log_interval: float = 10., window: int = 1024) -> Serial_Latency_Monitor:
+		"""
+		Включить измерение задержек чтения телеметрии и записи команд (смотри parts.latency).
+		:param log_interval: Период строки со статистикой в логе, сек. None - не писать в лог.
+		:param window:       Размер окна перцентилей.
+		:return:             Serial_Latency_Monitor, статистика доступна через его get_stats().
+		"""
+		monitor = AutoBot_Protocol.enable_latency_monitor(self, log_interval=log_interval, window=window)
+		self.command_writer.latency_monitor = monitor
+		return monitor
+
+	def submit_command(self, device_name: str, command: str) -> None:
+		"""
+		Поставить команду в ячейку устройства потока записи.
+		Устаревшая неотправленная команда заменяется.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		self.command_writer.submit(device_name=device_name, command=command)
+
 class Robot:
-	def __init__(self):
-		self.hardware = RobotHardware(autostart=True, daemon=True)
+	def __init__(self,
+				 device: str = None,
+				 hardware: RobotHardware = None):
+		"""
+		:param device:   Порт контроллера. По умолчанию берется из переменной окружения HW_SERIAL.
+		:param hardware: Готовое подключение к контроллеру. Если передано, `device` не используется.
+		"""
+		if hardware is None:
+			hardware = RobotHardware(device=device, autostart=True, daemon=True)
+		self.hardware = hardware
 		# self.wheels_stop()
 		# self.flashlight_turn_off()
 		# self.uv_flashlight_turn_off()
@@ -402,6 +806,14 @@ class Robot:
 	def get_all_telemetry(self) -> dict:
 		return self.hardware.get_sensors_and_devices()
 
+	def flush_commands(self, timeout: float = 0.5) -> bool:
+		"""
+		Дождаться отправки на контроллер всех поставленных в очередь команд.
+		:param timeout: Максимальное время ожидания, сек.
+		:return:        True, если все команды отправлены.
+		"""
+		return self.hardware.flush_commands(timeout=timeout)
+
 	def battery_get(self) -> int or None:
 		"""
 		Получить состояние аккумулятора.
@@ -416,14 +828,14 @@ class Robot:
 		"""
 		return self.hardware.get_sensor_value('RFID')
 
-	def ir_get(self) -> Dict[int, None or int]:
+	def ir_get(self) -> Tuple[None or int, ...]:
 		"""
 		Получить состояние IR сенсора.
 		:return: Состояние IR сенсора.
 		"""
 		return self.hardware.get_sensor_value('IR')
 
-	def us_get(self) -> Dict[int, None or int]:
+	def us_get(self) -> Tuple[None or int, ...]:
 		"""
 		:return: Состояние US сенсора.
 		"""
@@ -673,14 +1085,49 @@ class Robot:
 
 
 
-# ADD AUTOBOT SERIAL PORT
-autobot_platform = Robot()
+# AUTOBOT SERIAL PORTS: порт -> Robot, создаются при первом обращении
+_autobot_platforms = {}
+_autobot_platforms_lock = threading.Lock()
 
 
-class AutoBot_Actuator(object):
+def get_autobot_platform(device: str = None) -> Robot:
+	"""
+	Получить Robot для порта контроллера. Подключение создается при первом обращении,
+	поэтому импорт модуля не открывает порт.
+	:param device: Порт контроллера. По умолчанию берется из переменной окружения HW_SERIAL.
+	:return:       Robot, общий для всех частей, работающих с этим портом.
+	"""
+	if device is None:
+		device = os.getenv('HW_SERIAL', '/dev/ttyUSB0')
+	with _autobot_platforms_lock:
+		platform = _autobot_platforms.get(device)
+		if platform is None:
+			platform = Robot(device=device)
+			_autobot_platforms[device] = platform
+	return platform
+
+
+class AutoBot_Part(object):
+	"""
+	- Базовый класс частей, работающих с контроллером.
+	- Robot передается в конструктор; если не передан, берется get_autobot_platform() при первом обращении.
+	"""
+
+	def __init__(self, platform: Robot = None):
+		self.__platform = platform
+
+	@property
+	def platform(self) -> Robot:
+		if self.__platform is None:
+			self.__platform = get_autobot_platform()
+		return self.__platform
+
+
+class AutoBot_Actuator(AutoBot_Part):
 	def __init__(self,
 				 zero_throttle: float = 0,
-				 max_duty: float = 1):
+				 max_duty: float = 1,
+				 platform: Robot = None):
 		"""
 		zero_throttle: values at or below zero_throttle are treated as zero.
 		max_duty: the maximum duty cycle that will be send to the motors
@@ -689,7 +1136,9 @@ class AutoBot_Actuator(object):
 			if pin_forward and pin_backward are both at duty_cycle == 1,
 			then the motor will be forcibly stopped (can be used for braking)
 		max_duty is from 0 to 1 (fully off to fully on). I've read 0.9 is a good max.
+		platform: Robot to drive, get_autobot_platform() by default.
 		"""
+		super().__init__(platform=platform)
 		self.running = True
 		self.zero_throttle = zero_throttle
 		self.max_duty = max_duty
@@ -700,8 +1149,6 @@ class AutoBot_Actuator(object):
 	def run(self,
 			left_throttle: float = 0,
 			right_throttle: float = 0) -> None:
-		global autobot_platform
-
 		if left_throttle is None:
 			logger.warn("`left_throttle` is None")
 			return
@@ -720,65 +1167,66 @@ class AutoBot_Actuator(object):
 		left_wheel = int(self.left_throttle * 100)
 		right_wheel = int(self.right_throttle * 100)
 
-		autobot_platform.wheels_set(left=left_wheel, right=right_wheel)
+		self.platform.wheels_set(left=left_wheel, right=right_wheel)
 
 	def shutdown(self):
-		global autobot_platform
-		autobot_platform.wheels_set(left=0, right=0)
+		self.platform.wheels_set(left=0, right=0)
+		self.platform.flush_commands()
 
 
 
-class AutoBot_Flashlight(object):
-	def __init__(self):
+class AutoBot_Flashlight(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = 0
 
 	def run(self, value: int = 0) -> int or None:
 		if value is None:
 			return None
-		global autobot_platform
-		autobot_platform.flashlight_set(value=value)
+		self.platform.flashlight_set(value=value)
 		self.value = value
 
 	def shutdown(self):
 		self.run(0)
 
 
-class AutoBot_UV_Flashlight(object):
-	def __init__(self):
+class AutoBot_UV_Flashlight(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = 0
 
 	def run(self, value: int = 0) -> int or None:
 		if value is None:
 			return None
-		global autobot_platform
 		assert 0 <= value <= 100
-		autobot_platform.uv_flashlight_set(value=value)
+		self.platform.uv_flashlight_set(value=value)
 		self.value = value
 
 	def shutdown(self):
 		self.run(0)
 
 
-class AutoBot_Camera_Servo(object):
-	def __init__(self):
+class AutoBot_Camera_Servo(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = 0
 
 	def run(self, value: int) -> int or None:
 		if value is None:
 			return None
-		global autobot_platform
-		autobot_platform.camera_servo_set(angle=value)
+		self.platform.camera_servo_set(angle=value)
 		self.value = value
 
 	def shutdown(self):
 		self.run(90)
 
 
-class Sensor_RFID(object):
-	def __init__(self):
+class Sensor_RFID(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = ""
 
@@ -787,8 +1235,7 @@ class Sensor_RFID(object):
 		return self.value
 
 	def get_data_from_device(self):
-		global autobot_platform
-		value = autobot_platform.rfid_get()
+		value = self.platform.rfid_get()
 		if type(value) == type(None):
 			value = ""
 		if value != self.value:
@@ -797,8 +1244,9 @@ class Sensor_RFID(object):
 
 
 
-class Sensor_Battery(object):
-	def __init__(self):
+class Sensor_Battery(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = 0
 
@@ -807,15 +1255,15 @@ class Sensor_Battery(object):
 		return self.value
 
 	def get_data_from_device(self):
-		global autobot_platform
-		value = autobot_platform.battery_get()
+		value = self.platform.battery_get()
 		if type(value) == type(None):
 			value = 0
 		self.value = value
 
 
-class Sensor_US(object):
-	def __init__(self):
+class Sensor_US(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = {int(ir_sensor_idx): 255 for ir_sensor_idx in range(5)}
 
@@ -825,17 +1273,17 @@ class Sensor_US(object):
 		return [self.value[sensor_idx] for sensor_idx in range(5)]
 
 	def get_data_from_device(self):
-		global autobot_platform
-		value = autobot_platform.us_get()
-		for _key, _item in value.items():
+		value = self.platform.us_get()
+		for _key, _item in enumerate(value):
 			if type(_item) == type(None):
 				self.value[_key] = 255
 			else:
 				self.value[_key] = _item
 
 
-class Sensor_IR(object):
-	def __init__(self):
+class Sensor_IR(AutoBot_Part):
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
 		self.running = True
 		self.value = {int(ir_sensor_idx): 255 for ir_sensor_idx in range(5)}
 
@@ -845,14 +1293,105 @@ class Sensor_IR(object):
 		return [self.value[sensor_idx] for sensor_idx in range(5)]
 
 	def get_data_from_device(self):
-		global autobot_platform
-		value = autobot_platform.ir_get()
-		for _key, _item in value.items():
+		value = self.platform.ir_get()
+		for _key, _item in enumerate(value):
 			if type(_item) == type(None):
 				self.value[_key] = 255
 			else:
 				self.value[_key] = _item
 
 
+class Sensor_Telemetry(AutoBot_Part):
+	"""
+	- Телеметрия УЗ и ИК сенсоров и аккумулятора одной частью вместо Sensor_US, Sensor_IR и Sensor_Battery.
+	- Массив значений пересобирается только при появлении новых данных, иначе возвращается тот же объект.
+	- Возвращенные массивы не изменяются: потребитель (очередь записи tub, пилот с буфером входов)
+	  может хранить их сколько угодно.
+	"""
+	VECTOR_SENSORS = ('US', 'IR')
+	AGE_SENSORS = ('US', 'IR', 'BATTERY')
 
+	def __init__(self, platform: Robot = None, missing_value: int = 255):
+		"""
+		:param platform:      Robot, get_autobot_platform() по умолчанию.
+		:param missing_value: Значение сенсора, от которого еще не было данных.
+		"""
+		super().__init__(platform=platform)
+		self.running = True
+		self.missing_value = missing_value
+
+		# US 0-4, IR 0-4
+		self.values = np.full(5 * len(self.VECTOR_SENSORS), missing_value, dtype=np.int16)
+		# возраст последнего значения US, IR, BATTERY в мс; -1 - данных еще не было
+		self.age_ms = np.full(len(self.AGE_SENSORS), -1, dtype=np.float32)
+		self.battery = 0
+
+		self.__version = None
+		self.__last_states = {sensor_name: None for sensor_name in self.AGE_SENSORS}
+
+	def run(self) -> Tuple[np.ndarray, int, np.ndarray]:
+		"""
+		:return: (значения US и IR, уровень аккумулятора, возраст значений US, IR и аккумулятора в мс).
+		"""
+		snapshot = self.platform.hardware.get_snapshot_changed_since(version=self.__version)
+		if snapshot is not None:
+			self.__version = snapshot.version
+			values = None
+			for sensor_name in self.AGE_SENSORS:
+				state = snapshot.sensors[sensor_name]
+				# снимок переиспользует состояние сенсора, по которому не было новых строк
+				if state is self.__last_states[sensor_name]:
+					continue
+				if sensor_name == 'BATTERY':
+					if state.value is None:
+						continue
+					self.battery = state.value
+				else:
+					if None in state.value:
+						continue
+					if values is None:
+						# копия: массив, отданный на прошлых тактах, остается прежним
+						values = self.values.copy()
+					offset = 5 * self.VECTOR_SENSORS.index(sensor_name)
+					values[offset:offset + 5] = state.value
+				self.__last_states[sensor_name] = state
+			if values is not None:
+				self.values = values
+
+		now = time.monotonic()
+		latency_monitor = self.platform.hardware.latency_monitor
+		# возраст меняется каждый такт - новый массив
+		self.age_ms = self.age_ms.copy()
+		for age_idx, sensor_name in enumerate(self.AGE_SENSORS):
+			state = self.__last_states[sensor_name]
+			if state is not None:
+				self.age_ms[age_idx] = (now - state.update_time) * 1000
+				if latency_monitor is not None:
+					latency_monitor.record_read_age(sensor_name=sensor_name, age_ms=float(self.age_ms[age_idx]))
+		return self.values, self.battery, self.age_ms
+
+
+class AutoBot_Obstacle_Stop(AutoBot_Part):
+	"""
+	- Флаг остановки перед препятствием для цикла Vehicle (например, для DriveMode).
+	- Сама остановка выполняется в потоке чтения RobotHardware (смотри RobotHardware.enable_obstacle_stop),
+	  часть только сообщает о ней и пишет в лог, на сколько мс реакция опередила цикл Vehicle.
+	"""
+
+	def __init__(self, platform: Robot = None):
+		super().__init__(platform=platform)
+		self.running = True
+		self.__triggers = 0
 
+	def run(self) -> bool:
+		"""
+		:return: True, пока сработка активна.
+		"""
+		obstacle_stop = self.platform.hardware.obstacle_stop
+		if obstacle_stop is None:
+			return False
+		if obstacle_stop.triggers != self.__triggers:
+			self.__triggers = obstacle_stop.triggers
+			lead_ms = (time.monotonic() - obstacle_stop.trigger_time) * 1000
+			logger.warning(f"[AutoBot_Obstacle_Stop]: wheels were clamped {lead_ms:.1f} ms ahead of the vehicle loop")
+		return obstacle_stop.is_triggered
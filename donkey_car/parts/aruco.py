@@ -10,8 +10,41 @@ import json
 import tqdm
 
 import time
+import logging
 import threading
 
+from parts.frame_pool import Frame_Buffer_Pool, retain_frame, release_frame
+from parts.latency import Rolling_Percentiles
+
+
+logger = logging.getLogger(__name__)
+
+
+class ArucoSignTable(object):
+    """
+    Sign settings as dense arrays indexed by marker id (DICT_6X6_250 ids are 0..249),
+    built once from the signs dict, so the settings of all detected markers are
+    looked up with one fancy index and unknown ids are filtered with `known`.
+    """
+    size = 250
+
+    def __init__(self, signs_dict: dict):
+        self.known = np.zeros(self.size, dtype=bool)
+        self.names = np.full(self.size, '', dtype=object)
+        self.distance_to_marker = np.full(self.size, np.nan)
+        self.exec_time = np.zeros(self.size)
+        for marker_id, sign in signs_dict.items():
+            self.known[marker_id] = True
+            self.names[marker_id] = sign['name']
+            self.distance_to_marker[marker_id] = sign['distance_to_marker']
+            self.exec_time[marker_id] = sign['exec_time']
+
+    def known_mask(self, marker_ids: np.ndarray) -> np.ndarray:
+        marker_ids = np.asarray(marker_ids)
+        mask = (marker_ids >= 0) & (marker_ids < self.size)
+        mask[mask] = self.known[marker_ids[mask]]
+        return mask
+
 
 
 class ArucoSignDetector():
@@ -23,7 +56,27 @@ class ArucoSignDetector():
                  calib_data_path: str = "../camera_calibartion//calib_data/MultiMatrix.npz",
                  signs_dict: dict = {},
                  image_size: int = 224,
-                 border_size: int = 1):
+                 border_size: int = 1,
+                 frame_pool: Frame_Buffer_Pool = None,
+                 frame_age_monitor=None,
+                 tracking: bool = False,
+                 full_detect_interval: int = 10,
+                 roi_margin: float = 0.6,
+                 min_roi_size: int = 48,
+                 pyramid_downscale: int = 1,
+                 refine_window: int = 5):
+        """
+        :param frame_pool: marked frames are drawn into buffers of this pool instead of np.copy
+        :param frame_age_monitor: parts.latency.Frame_Age_Monitor, records the age of every detected frame as 'aruco'
+        :param tracking: track-then-detect: once markers are found, search only windows around their
+            predicted corners; the whole frame is searched every `full_detect_interval` frames and
+            whenever a tracked marker is lost
+        :param roi_margin: search window margin around the predicted marker, in marker sizes
+        :param min_roi_size: smallest search window side, px
+        :param pyramid_downscale: full-frame detection runs on a frame downscaled by this factor (2 or 4),
+            the corners are then refined with cornerSubPix at full resolution; 1 - single scale
+        :param refine_window: half side of the cornerSubPix window at full resolution, px
+        """
         self.marker_size_mm  = marker_size_mm
         self.calib_data_path = os.path.abspath(calib_data_path)
         self.calib_data		 = self.load_calib_data()
@@ -31,6 +84,7 @@ class ArucoSignDetector():
         if len(signs_dict) == 0:
             signs_dict = {0: {'name':	'stop', 'exec_time': 10, 'distance_to_marker': 300}}
         self.signs = signs_dict
+        self.sign_table = ArucoSignTable(signs_dict)
 
         self.image_size = image_size
         self.border_size = border_size
@@ -39,6 +93,29 @@ class ArucoSignDetector():
         # self.detector = None
         self.detector_params = cv2.aruco.DetectorParameters_create()
 
+        # result for the last processed frame sequence number, returned again while the sequence does not advance
+        self.last_frame_sequence = None
+        self.last_result = None
+        self.frame_pool = frame_pool
+        # RGB frames to draw on when the input is a luma plane of another size than frame_pool
+        self.marked_frame_pool = None
+        self.frame_age_monitor = frame_age_monitor
+
+        self.tracking = tracking
+        self.full_detect_interval = full_detect_interval
+        self.roi_margin = roi_margin
+        self.min_roi_size = min_roi_size
+        # marker id -> (corners (4, 2) in full-frame coordinates, corner motion per frame (2,))
+        self.tracks = {}
+        self.frames_since_full_detect = 0
+        self.full_detections = 0
+        self.roi_detections = 0
+        self.tracks_lost = 0
+
+        self.pyramid_downscale = pyramid_downscale
+        self.refine_window = refine_window
+        self.refine_criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 0.01)
+
     def get_sign_name_by_id(self, id: int) -> str:
         assert type(id) is int
         assert 0 <= id <= 249
@@ -54,36 +131,128 @@ class ArucoSignDetector():
         return markerImage
 
     def detect(self, frame: np.ndarray):
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        marker_corners, marker_IDs, _ = cv2.aruco.detectMarkers(gray_frame, self.dictionary, parameters=self.detector_params)
+        # a 2-D frame is already the luma plane (Y / GRAY8 camera output), no colour work needed
+        if frame.ndim == 2:
+            gray_frame = np.ascontiguousarray(frame)
+        else:
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if self.tracking and self.tracks and self.frames_since_full_detect + 1 < self.full_detect_interval:
+            tracked = self.detect_tracked(gray_frame)
+            if tracked is not None:
+                self.frames_since_full_detect += 1
+                self.roi_detections += 1
+                return tracked
+
+        marker_corners, marker_IDs = self.detect_full_frame(gray_frame)
         if type(marker_IDs) == np.ndarray:
             marker_IDs = marker_IDs.flatten()
         if type(marker_corners) == np.ndarray:
             marker_corners = marker_corners.reshape(-1, 4, 2)
+        if self.tracking:
+            self.frames_since_full_detect = 0
+            self.full_detections += 1
+            self.update_tracks(marker_corners, marker_IDs)
         return marker_corners, marker_IDs
 
-    def estimate_pose(self, marker_corners: np.ndarray, markerIds: np.ndarray):
-        sign_names = []
-        distances = []
-
-        if type(marker_corners) == list and type(markerIds) == np.ndarray:
-            rVec, tVec, _ = cv2.aruco.estimatePoseSingleMarkers(corners=marker_corners,
-                                                                markerLength=self.marker_size_mm,
-                                                                cameraMatrix=self.calib_data["camMatrix"],
-                                                                distCoeffs=self.calib_data["distCoef"])
-            total_markers = range(len(markerIds))
-            for marker_id, corners, i in zip(markerIds, marker_corners, total_markers):
-                sign_name = self.signs[marker_id]['name']
-                distance = np.sqrt(tVec[i][0][2] ** 2 + tVec[i][0][0] ** 2 + tVec[i][0][1] ** 2)
-                sign_names.append(sign_name)
-                distances.append(distance)
-        return sign_names, marker_corners, distances
+    def detect_full_frame(self, gray_frame: np.ndarray):
+        if self.pyramid_downscale <= 1:
+            marker_corners, marker_IDs, _ = cv2.aruco.detectMarkers(gray_frame, self.dictionary, parameters=self.detector_params)
+            return marker_corners, marker_IDs
+
+        # candidates on the downscaled frame, the adaptive thresholding is the main cost
+        scale = 1. / self.pyramid_downscale
+        small_frame = cv2.resize(gray_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        marker_corners, marker_IDs, _ = cv2.aruco.detectMarkers(small_frame, self.dictionary, parameters=self.detector_params)
+        if marker_IDs is None or len(marker_IDs) == 0:
+            return marker_corners, marker_IDs
+
+        # back to full-frame pixel centres, then refine in small windows at full resolution
+        corners = np.concatenate([np.reshape(c, (4, 2)) for c in marker_corners]).astype(np.float32)
+        corners = (corners + 0.5) * self.pyramid_downscale - 0.5
+        cv2.cornerSubPix(gray_frame, corners, (self.refine_window, self.refine_window), (-1, -1), self.refine_criteria)
+        marker_corners = [c.reshape(1, 4, 2) for c in np.split(corners, len(marker_IDs))]
+        return marker_corners, marker_IDs
+
+    def detect_tracked(self, gray_frame: np.ndarray):
+        """
+        Search every tracked marker in a window around its predicted corners.
+        :return: (corners, ids) in full-frame coordinates like detect(), or None if a marker was lost
+        """
+        height, width = gray_frame.shape[:2]
+        found = {}
+        for marker_id, (corners, motion) in self.tracks.items():
+            if marker_id in found:
+                # already found in the window of another marker
+                continue
+            predicted = corners + motion
+            size = max(np.ptp(predicted[:, 0]), np.ptp(predicted[:, 1]))
+            margin = max(size * self.roi_margin, (self.min_roi_size - size) / 2, 0)
+            x0, y0 = np.floor(predicted.min(axis=0) - margin).astype(int)
+            x1, y1 = np.ceil(predicted.max(axis=0) + margin).astype(int)
+            x0, y0 = max(x0, 0), max(y0, 0)
+            x1, y1 = min(x1, width), min(y1, height)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                return None
+
+            # a window of the frame is a view, not a copy
+            roi_corners, roi_ids, _ = cv2.aruco.detectMarkers(gray_frame[y0:y1, x0:x1], self.dictionary,
+                                                               parameters=self.detector_params)
+            if roi_ids is not None:
+                offset = np.array([x0, y0], dtype=np.float32)
+                for roi_id, roi_marker_corners in zip(roi_ids.flatten(), roi_corners):
+                    found.setdefault(int(roi_id), roi_marker_corners.reshape(1, 4, 2) + offset)
+            if marker_id not in found:
+                self.tracks_lost += 1
+                return None
+
+        marker_IDs = np.array(list(found.keys()), dtype=np.int32)
+        marker_corners = list(found.values())
+        self.update_tracks(marker_corners, marker_IDs)
+        return marker_corners, marker_IDs
+
+    def update_tracks(self, marker_corners, marker_IDs) -> None:
+        tracks = {}
+        if marker_IDs is not None:
+            for marker_id, corners in zip(marker_IDs, marker_corners):
+                marker_id = int(marker_id)
+                corners = np.asarray(corners, dtype=np.float32).reshape(4, 2)
+                motion = np.zeros(2, dtype=np.float32)
+                if marker_id in self.tracks:
+                    motion = (corners - self.tracks[marker_id][0]).mean(axis=0)
+                tracks[marker_id] = (corners, motion)
+        self.tracks = tracks
+
+    def estimate_pose(self, marker_corners: list, markerIds: np.ndarray):
+        """
+        Pose of the known signs among the detected markers, markers with ids missing from signs_dict are dropped.
+        :return: (markerIds (N,), marker_corners [(1, 4, 2)] * N, rVecs (N, 3), tVecs (N, 3), distances (N,))
+        """
+        if markerIds is None or len(markerIds) == 0:
+            return np.empty(0, dtype=np.int32), [], np.empty((0, 3)), np.empty((0, 3)), np.empty(0)
+
+        markerIds = np.asarray(markerIds).reshape(-1)
+        known = self.sign_table.known_mask(markerIds)
+        if not known.all():
+            marker_corners = [corners for corners, is_known in zip(marker_corners, known) if is_known]
+            markerIds = markerIds[known]
+            if len(markerIds) == 0:
+                return markerIds, [], np.empty((0, 3)), np.empty((0, 3)), np.empty(0)
+
+        rVecs, tVecs, _ = cv2.aruco.estimatePoseSingleMarkers(corners=marker_corners,
+                                                              markerLength=self.marker_size_mm,
+                                                              cameraMatrix=self.calib_data["camMatrix"],
+                                                              distCoeffs=self.calib_data["distCoef"])
+        rVecs = rVecs.reshape(-1, 3)
+        tVecs = tVecs.reshape(-1, 3)
+        distances = np.linalg.norm(tVecs, axis=1)
+        return markerIds, marker_corners, rVecs, tVecs, distances
 
     def draw(self,
              frame: np.ndarray,
-             sign_names: list,
+             sign_names: np.ndarray,
              bboxes: list,
-             distances: list,
+             distances: np.ndarray,
              ):
         if type(frame) == np.ndarray:
             for sign_name, bbox, distance in zip(sign_names, bboxes, distances):
@@ -140,17 +309,52 @@ class ArucoSignDetector():
     #         print('!!!!!')
     #         print(type(road_frame), type(sign_frame))
 
-    def run(self, sign_frame: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    def run(self, sign_frame: np.ndarray, frame_sequence: int = None, frame_time: float = None) -> (np.ndarray, np.ndarray, np.ndarray):
         if type(sign_frame) == np.ndarray:
+            if frame_sequence is not None and frame_sequence == self.last_frame_sequence:
+                return self.last_result
             marker_corners, markerIds = self.detect(frame=sign_frame)
-            sign_names, bboxes, distances = self.estimate_pose(marker_corners=marker_corners, markerIds=markerIds)
+            markerIds, marker_corners, _, _, distances = self.estimate_pose(marker_corners=marker_corners, markerIds=markerIds)
+            if self.frame_age_monitor is not None:
+                self.frame_age_monitor.record('aruco', frame_time)
+
+            marked_sign_frame = self.copy_frame(sign_frame)
+            marked_sign_frame = self.draw(frame=marked_sign_frame, sign_names=self.sign_table.names[markerIds],
+                                          bboxes=marker_corners, distances=distances)
+            if self.last_result is not None:
+                release_frame(self.last_result[1])
+            self.last_frame_sequence = frame_sequence
+            self.last_result = sign_frame, marked_sign_frame, marker_corners, markerIds, distances
+            return self.last_result
+
+    def copy_frame(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Frame to draw the markers on. A 2-D luma plane (Y or GRAY8 detector
+        input) is converted to RGB here, so the marks stay coloured on the
+        web stream; the detection itself still runs on the plane.
+        """
+        if frame.ndim == 2:
+            shape = frame.shape + (3,)
+            pool = self.frame_pool
+            if pool is not None and pool.shape != shape:
+                # e.g. a tee branch of another size than the camera frame pool
+                if self.marked_frame_pool is None or self.marked_frame_pool.shape != shape:
+                    self.marked_frame_pool = Frame_Buffer_Pool(shape=shape, size=6)
+                pool = self.marked_frame_pool
+            buffer = pool.acquire() if pool is not None else None
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB, dst=buffer)
 
-            marked_sign_frame = np.copy(sign_frame)
-            marked_sign_frame = self.draw(frame=marked_sign_frame, sign_names=sign_names, bboxes=marker_corners, distances=distances)
-            return sign_frame, marked_sign_frame, marker_corners, markerIds, distances
+        if self.frame_pool is not None and frame.shape == self.frame_pool.shape:
+            buffer = self.frame_pool.acquire()
+            if buffer is not None:
+                np.copyto(buffer, frame)
+                return buffer
+        return np.copy(frame)
 
     def shutdown(self):
-        pass
+        if self.last_result is not None:
+            release_frame(self.last_result[1])
+            self.last_result = None
 
     def load_calib_data(self):
         assert os.path.exists(self.calib_data_path), Exception(f'The camera is not calibrated. The file does not exist:\t{os.path.abspath(self.calib_data_path)}')
@@ -160,6 +364,149 @@ class ArucoSignDetector():
 
 
 
+class Async_Aruco_Detector(object):
+    """
+    Runs an ArucoSignDetector on its own thread, so the vehicle loop never
+    waits for a detection. Add it with threaded=True.
+
+    run_threaded() only hands the newest frame to the worker and returns the
+    latest finished result; a frame that is still waiting when a newer one
+    comes in is dropped. The result carries the sequence number and capture
+    time of the frame it was computed from, and its age at the moment the
+    loop picks it up.
+
+    Like Frame_Publisher, the worker holds one reference to the frames of its
+    latest result and one to the result handed to the loop, so pool buffers
+    are not recycled while the loop or the web stream still use them.
+    """
+
+    def __init__(self, detector: ArucoSignDetector, log_interval: float = 10., window: int = 256):
+        """
+        :param log_interval: seconds between log lines with detections/s and result age, None - no log
+        """
+        self.detector = detector
+        self.log_interval = log_interval
+
+        self.running = True
+        self.detections = 0
+        self.frames_dropped = 0
+        self.result_age_ms = Rolling_Percentiles(window)
+
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__submitted = None
+        # (sign_frame, marked_sign_frame, marker_corners, markerIds, distances, frame_sequence, frame_time)
+        self.__result = None
+        self.__handed_out = None
+        self.__last_log_time = time.monotonic()
+        self.__last_log_detections = 0
+
+    def run_threaded(self, sign_frame: np.ndarray, frame_sequence: int = None, frame_time: float = None):
+        if type(sign_frame) == np.ndarray:
+            self.__submit(sign_frame, frame_sequence, frame_time)
+
+        with self.__condition:
+            result = self.__result
+            if result is not self.__handed_out:
+                if result is not None:
+                    retain_frame((result[0], result[1]))
+                if self.__handed_out is not None:
+                    release_frame((self.__handed_out[0], self.__handed_out[1]))
+                self.__handed_out = result
+        self.__maybe_log()
+        if result is None:
+            return None, None, None, None, None, None, None, None
+
+        age_ms = None
+        if result[6] is not None:
+            age_ms = (time.monotonic() - result[6]) * 1000
+            self.result_age_ms.add(age_ms)
+        return result + (age_ms, )
+
+    def run(self, sign_frame: np.ndarray, frame_sequence: int = None, frame_time: float = None):
+        raise Exception('Async_Aruco_Detector runs in its own thread, add it with threaded=True')
+
+    def __submit(self, sign_frame: np.ndarray, frame_sequence: int, frame_time: float) -> None:
+        submitted = frame_sequence if frame_sequence is not None else id(sign_frame)
+        if submitted == self.__submitted:
+            return
+        self.__submitted = submitted
+        retain_frame(sign_frame)
+        with self.__condition:
+            if self.__pending is not None:
+                release_frame(self.__pending[0])
+                self.frames_dropped += 1
+            self.__pending = sign_frame, frame_sequence, frame_time
+            self.__condition.notify()
+
+    def update(self):
+        while self.running:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__pending is not None or not self.running, timeout=0.5)
+                pending = self.__pending
+                self.__pending = None
+            if pending is None:
+                continue
+
+            sign_frame, frame_sequence, frame_time = pending
+            try:
+                result = self.detector.run(sign_frame, frame_sequence=frame_sequence, frame_time=frame_time)
+            except Exception as e:
+                logger.error(f'aruco detection failed: {e}')
+                result = None
+            if result is None:
+                release_frame(sign_frame)
+                continue
+
+            # the detector releases its marked frame on the next detection, keep one for the result
+            retain_frame(result[1])
+            with self.__condition:
+                previous = self.__result
+                if self.running:
+                    self.__result = result + (frame_sequence, frame_time)
+                    self.detections += 1
+                else:
+                    # shut down while detecting
+                    previous = result
+            if previous is not None:
+                release_frame((previous[0], previous[1]))
+        # the detector is only used on this thread
+        self.detector.shutdown()
+
+    def get_stats(self) -> dict:
+        stats = {'detections': self.detections, 'frames_dropped': self.frames_dropped}
+        stats.update(self.result_age_ms.percentiles())
+        return stats
+
+    def __maybe_log(self) -> None:
+        if not self.log_interval:
+            return
+        now = time.monotonic()
+        elapsed = now - self.__last_log_time
+        if elapsed < self.log_interval:
+            return
+        stats = self.get_stats()
+        rate = (stats['detections'] - self.__last_log_detections) / elapsed
+        self.__last_log_time = now
+        self.__last_log_detections = stats['detections']
+        logger.info(f"aruco: {rate:.1f} detections/s, {stats['frames_dropped']} frames dropped, "
+                    f"result age ms p50/p95/p99 {stats['p50']:.1f}/{stats['p95']:.1f}/{stats['p99']:.1f}")
+
+    def shutdown(self):
+        self.running = False
+        with self.__condition:
+            self.__condition.notify_all()
+            pending, self.__pending = self.__pending, None
+            result, self.__result = self.__result, None
+            handed_out, self.__handed_out = self.__handed_out, None
+        if pending is not None:
+            release_frame(pending[0])
+        for frames in (result, handed_out):
+            if frames is not None:
+                release_frame((frames[0], frames[1]))
+
+
+
 if __name__=='__main__':
 
     aruco = ArucoSignDetector(image_size=500)
@@ -0,0 +1,275 @@
+"""
+Асинхронный транспорт контроллера AutoBot поверх asyncio.
+
+Работает с тем же портом, теми же командами и тем же разбором телеметрии, что и RobotHardware
+(общая часть - AutoBot_Protocol), но без собственных потоков: чтение идет через `add_reader`
+на дескрипторе порта, запись - корутиной с ячейкой на устройство, неблокирующая: недописанный
+остаток дописывается по готовности порта (`add_writer`), медленный порт не останавливает цикл. Все методы, кроме
+*_threadsafe, вызываются из потока цикла asyncio (например, IOLoop веб-контроллера Tornado).
+"""
+
+import os
+import asyncio
+import logging
+import time
+from typing import Tuple, List, Dict, Any
+
+import serial
+
+from parts.actuators import AutoBot_Protocol, Command_Slots
+from parts.hardware_state import Hardware_Snapshot
+from parts.telemetry_parser import Line_Framer
+
+
+logger = logging.getLogger(__name__)
+
+
+class Async_RobotHardware(AutoBot_Protocol):
+	"""
+	- Клас для взаимодействия с контроллером serial из цикла asyncio.
+	- set_device_value возвращает future, который завершается после записи команды в порт.
+	- subscribe - асинхронный генератор снимков с новой телеметрией.
+	- После ошибки порта (отключение платы) чтение снимается с цикла, ожидающие получают
+	  исключение, error хранит его.
+	"""
+
+	def __init__(self,
+				 device: str = None,
+				 baudrate: int = 115200,
+				 write_interval: float = 0.01,
+				 start_delay: float = 0.8,
+				 ):
+		"""
+		:param device:         Порт контроллера. По умолчанию берется из переменной окружения HW_SERIAL.
+		:param baudrate:       Скорость порта.
+		:param write_interval: Пауза после каждой записи команд, сек.
+		:param start_delay:    Пауза перед первой записью команд, пока контроллер загружается, сек.
+		"""
+		AutoBot_Protocol.__init__(self)
+		if device is None:
+			device = os.getenv('HW_SERIAL', '/dev/ttyUSB0')
+		self.device = device
+		self.baudrate = baudrate
+		self.write_interval = write_interval
+		self.start_delay = start_delay
+		self.device_names = ('WHEELS', 'FLASHLIGHT', 'UV_FLASHLIGHT', 'CAMERA_SERVO')
+
+		# timeout=0 - неблокирующее чтение, данные забираются только когда дескриптор готов
+		self.serial = serial.Serial(self.device, baudrate=self.baudrate, timeout=0)
+		self.fd = self.serial.fileno()
+		os.set_blocking(self.fd, False)
+
+		self.loop = None
+		self.line_framer = Line_Framer()
+		self.slots = Command_Slots(device_names=self.device_names)
+		self.__waiters = {}
+		self.__has_pending = None
+		self.__changed = None
+		self.__writer_task = None
+		# ошибка порта, после которой чтение и запись остановлены
+		self.error = None
+
+	def start(self, loop: asyncio.AbstractEventLoop) -> None:
+		"""
+		Подключить чтение и запись к циклу asyncio. Вызывается из потока этого цикла.
+		:param loop: Цикл asyncio, в котором работает транспорт.
+		:return:     None.
+		"""
+		self.loop = loop
+		self.__has_pending = asyncio.Event()
+		self.__changed = asyncio.Event()
+		self.loop.add_reader(self.fd, self.__on_readable)
+		self.__writer_task = asyncio.ensure_future(self.__write_commands(), loop=self.loop)
+
+	def stop(self) -> None:
+		"""
+		Отключить чтение и запись от цикла asyncio.
+		:return: None.
+		"""
+		if self.loop is None:
+			return
+		self.loop.remove_reader(self.fd)
+		self.loop.remove_writer(self.fd)
+		if self.__writer_task is not None:
+			self.__writer_task.cancel()
+
+	def __fail(self, error: Exception) -> None:
+		"""
+		Остановить транспорт после ошибки порта: снять чтение, отменить запись,
+		передать ошибку всем ожидающим.
+		"""
+		if self.error is not None:
+			return
+		self.error = error
+		logger.warning(f"[Async_RobotHardware]: {self.device} failed: {error}")
+		self.stop()
+		waiters, self.__waiters = self.__waiters, {}
+		self.__resolve(waiters=waiters, exception=error)
+		self.__changed.set()
+
+	def __on_readable(self) -> None:
+		try:
+			# после отключения pyserial бросает SerialException (дескриптор готов, но данных нет)
+			# или OSError (EIO из in_waiting)
+			data = self.serial.read(self.serial.in_waiting or 1)
+		except (serial.SerialException, OSError) as e:
+			self.__fail(e)
+			return
+		updated = False
+		for line in self.line_framer.feed(data):
+			if self.parse_message(line) is not None:
+				updated = True
+		if updated:
+			# будим всех ожидающих и заводим новое событие для следующих
+			changed, self.__changed = self.__changed, asyncio.Event()
+			changed.set()
+
+	def submit_command(self, device_name: str, command: str) -> None:
+		"""
+		Поставить команду в ячейку устройства. Устаревшая неотправленная команда заменяется.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		self.slots.submit(device_name=device_name, command=command)
+		self.__has_pending.set()
+
+	def set_device_value(self, device_name: str, value: int or Tuple[int, int] or List[int]) -> asyncio.Future:
+		"""
+		Установить значение для устройства.
+		:param device_name: Имя устройства.
+		:param value:       Значение устройства.
+		:return:            Future с новым значением устройства. Завершается, когда команда
+							(или заменившая ее более новая) записана в порт, или с ошибкой порта.
+		"""
+		if self.error is not None:
+			future = self.loop.create_future()
+			future.set_exception(self.error)
+			return future
+		device_name, command_for_serial, new_device_value = self.encode_device_command(device_name=device_name,
+																					   value=value)
+		self.submit_command(device_name=device_name, command=command_for_serial)
+		self.state.publish_device(name=device_name, value=new_device_value, update_time=time.monotonic())
+
+		future = self.loop.create_future()
+		self.__waiters.setdefault(device_name, []).append((future, new_device_value))
+		return future
+
+	def set_device_value_threadsafe(self, device_name: str, value: int or Tuple[int, int] or List[int]):
+		"""
+		Установить значение для устройства из другого потока (например, из цикла Vehicle).
+		:param device_name: Имя устройства.
+		:param value:       Значение устройства.
+		:return:            concurrent.futures.Future с новым значением устройства.
+		"""
+		async def set_value():
+			return await self.set_device_value(device_name=device_name, value=value)
+		return asyncio.run_coroutine_threadsafe(set_value(), self.loop)
+
+	async def wait_for_change(self, version: int) -> Hardware_Snapshot:
+		"""
+		Дождаться снимка новее версии `version`.
+		:param version: Номер уже обработанного снимка.
+		:return:        Новый снимок. После ошибки порта бросает ее.
+		"""
+		while True:
+			snapshot = self.state.changed_since(version=version)
+			if snapshot is not None:
+				return snapshot
+			if self.error is not None:
+				raise self.error
+			await self.__changed.wait()
+
+	async def subscribe(self, sensor_names: Tuple[str, ...] = ('IR', 'US', 'BATTERY', 'RFID')):
+		"""
+		Асинхронный генератор снимков, в которых появилась новая строка телеметрии
+		хотя бы одного из сенсоров `sensor_names`.
+			async for snapshot in hardware.subscribe(('US', )):
+				snapshot.sensors['US'].value
+		:param sensor_names: Имена сенсоров.
+		:return:             Снимки Hardware_Snapshot.
+		"""
+		snapshot = self.state.snapshot
+		version = snapshot.version
+		last_states = [snapshot.sensors[sensor_name] for sensor_name in sensor_names]
+		while True:
+			snapshot = await self.wait_for_change(version=version)
+			version = snapshot.version
+			states = [snapshot.sensors[sensor_name] for sensor_name in sensor_names]
+			if any(state is not last_state for state, last_state in zip(states, last_states)):
+				last_states = states
+				yield snapshot
+
+	def get_writer_counters(self) -> Dict[str, int]:
+		"""
+		Получить счетчики записи: отправленные, замененные до отправки и объединенные команды.
+		:return: Словарь со счетчиками.
+		"""
+		return self.slots.get_counters()
+
+	async def __write_commands(self) -> None:
+		if self.start_delay:
+			await asyncio.sleep(self.start_delay)
+		while True:
+			await self.__has_pending.wait()
+			self.__has_pending.clear()
+			commands, submit_times = self.slots.take()
+			if not commands:
+				continue
+			waiters, self.__waiters = self.__waiters, {}
+
+			message = ''.join(commands).encode('utf-8')
+			write_start_time = time.monotonic()
+			try:
+				await self.__write(message)
+			except (serial.SerialException, OSError) as e:
+				self.__resolve(waiters=waiters, exception=e)
+				self.__fail(e)
+				return
+
+			if self.latency_monitor is not None:
+				self.latency_monitor.record_write(start_time=write_start_time,
+												  end_time=time.monotonic(),
+												  payload_size=len(message),
+												  submit_times=submit_times)
+			self.slots.count_write(commands)
+			self.__resolve(waiters=waiters)
+
+			await asyncio.sleep(self.write_interval)
+			self.slots.write_done()
+
+	async def __write(self, message: bytes) -> None:
+		"""
+		Записать сообщение, не блокируя цикл: что не ушло сразу, дописывается по готовности порта.
+		"""
+		out_buffer = bytearray(message)
+		while True:
+			try:
+				written = os.write(self.fd, out_buffer)
+			except BlockingIOError:
+				written = 0
+			del out_buffer[:written]
+			if not out_buffer:
+				return
+			writable = self.loop.create_future()
+			self.loop.add_writer(self.fd, self.__on_writable, writable)
+			try:
+				await writable
+			finally:
+				self.loop.remove_writer(self.fd)
+
+	@staticmethod
+	def __on_writable(writable: asyncio.Future) -> None:
+		if not writable.done():
+			writable.set_result(None)
+
+	@staticmethod
+	def __resolve(waiters: Dict[str, List[Tuple[asyncio.Future, Any]]], exception: Exception = None) -> None:
+		for device_waiters in waiters.values():
+			for future, new_device_value in device_waiters:
+				if future.done():
+					continue
+				if exception is not None:
+					future.set_exception(exception)
+				else:
+					future.set_result(new_device_value)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Симулятор контроллера AutoBot на псевдотерминале (pty).
+
+Принимает команды `ZSU…E` / `ZSS…E` / `ZST…E` и отправляет телеметрию
+`SI` / `SU` / `SA` / `SF` с настраиваемой частотой и разбросом периода.
+
+Запуск из каталога donkey_car:
+	python3 -m parts.autobot_simulator --us-rate 50 --ir-rate 50 --jitter 0.2
+
+После запуска печатается путь к pty, который передается в RobotHardware
+через переменную окружения HW_SERIAL.
+"""
+
+import os
+import pty
+import tty
+import time
+import random
+import argparse
+import selectors
+import logging
+from typing import Tuple, Any, Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+COMMAND_START = b'Z'
+COMMAND_END = b'E'
+# Z + 15 символов + E
+COMMAND_LENGTH = 17
+
+
+def parse_command(frame: bytes) -> Tuple[str, Any] or None:
+	"""
+	Разобрать одну команду контроллера в том виде, в каком ее формирует RobotHardware.set_device_value.
+		ZSU++{uv:3}{fl:3}00000E                  - фонарик и УФ фонарик
+		ZSS{angle:3}0000000000E                  - сервопривод камеры
+		ZST0{ldir}00{lval:3}{rdir}00{rval:3}E    - колеса
+	:param frame: Команда от `Z` до `E` включительно.
+	:return:      (имя устройства, значение) или None для поврежденной команды.
+	"""
+	if len(frame) != COMMAND_LENGTH or frame[:1] != COMMAND_START or frame[-1:] != COMMAND_END:
+		return None
+	kind = frame[1:3]
+	try:
+		if kind == b'SU':
+			return 'LIGHTS', {'UV_FLASHLIGHT': int(frame[5:8]), 'FLASHLIGHT': int(frame[8:11])}
+		elif kind == b'SS':
+			return 'CAMERA_SERVO', int(frame[3:6])
+		elif kind == b'ST':
+			left = int(frame[7:10]) * (-1 if frame[4:5] == b'-' else 1)
+			right = int(frame[13:16]) * (-1 if frame[10:11] == b'-' else 1)
+			return 'WHEELS', {'left': left, 'right': right}
+	except ValueError:
+		return None
+	return None
+
+
+class AutoBot_Simulator(object):
+	"""
+	- Симулятор контроллера AutoBot.
+	- Ведущая сторона pty остается у симулятора, ведомая (`self.device`) открывается RobotHardware.
+	"""
+
+	def __init__(self,
+				 rates_hz: Dict[str, float] = None,
+				 jitter: float = 0.0,
+				 seed: int = None,
+				 ):
+		"""
+		:param rates_hz: Частота отправки телеметрии по сенсорам: {'IR': 20, 'US': 20, 'BATTERY': 1, 'RFID': 0}.
+		:param jitter:   Разброс периода отправки, доля от периода (0.1 - ±10%).
+		:param seed:     Начальное значение генератора случайных чисел.
+		"""
+		self.rates_hz = {'IR': 20., 'US': 20., 'BATTERY': 1., 'RFID': 0.}
+		if rates_hz is not None:
+			self.rates_hz.update(rates_hz)
+		assert 0 <= jitter < 1, Exception(f"Bad value for argument `jitter`. Must be in [0, 1).\nGOT:\t{jitter}")
+		self.jitter = jitter
+		self.random = random.Random(seed)
+
+		self.master_fd, self.slave_fd = pty.openpty()
+		tty.setraw(self.slave_fd)
+		os.set_blocking(self.master_fd, False)
+		self.device = os.ttyname(self.slave_fd)
+
+		self.devices = {
+			'FLASHLIGHT': 0,
+			'UV_FLASHLIGHT': 0,
+			'CAMERA_SERVO': 90,
+			'WHEELS': {'left': 0, 'right': 0},
+		}
+		self.sequences = {sensor_name: 0 for sensor_name in self.rates_hz.keys()}
+
+		self.commands_received = 0
+		self.commands_malformed = 0
+		self.telemetry_sent = 0
+		self.telemetry_dropped = 0
+
+		self.__command_buffer = bytearray()
+		self.is_active = True
+
+	def make_value(self, sensor_name: str, sequence: int) -> Any:
+		"""
+		Сгенерировать значение сенсора.
+		:param sensor_name: Имя сенсора.
+		:param sequence:    Порядковый номер сообщения этого сенсора.
+		:return:            Значение сенсора.
+		"""
+		if sensor_name in ['IR', 'US']:
+			return tuple(self.random.randint(0, 255) for _ in range(5))
+		elif sensor_name == 'BATTERY':
+			return max(0, 100 - sequence // 60)
+		return f'{self.random.randint(0, 0xFFFFFF):06X}'
+
+	def format_telemetry(self, sensor_name: str, value: Any) -> bytes:
+		"""
+		Сформировать строку телеметрии.
+		:param sensor_name: Имя сенсора.
+		:param value:       Значение сенсора.
+		:return:            Строка для отправки.
+		"""
+		if sensor_name in ['IR', 'US']:
+			payload = ''.join(f'{_value:03d}' for _value in value)
+		else:
+			payload = str(value)
+		prefix = {'IR': 'SI', 'US': 'SU', 'BATTERY': 'SA', 'RFID': 'SF'}[sensor_name]
+		return f'{prefix}{payload}E\r\n'.encode('ascii')
+
+	def on_emit(self, sensor_name: str, sequence: int, value: Any, emit_time: float) -> None:
+		"""
+		Вызывается перед отправкой каждой строки телеметрии.
+		:param sensor_name: Имя сенсора.
+		:param sequence:    Порядковый номер сообщения этого сенсора.
+		:param value:       Значение сенсора.
+		:param emit_time:   time.monotonic() момента отправки.
+		:return:            None.
+		"""
+		pass
+
+	def on_command(self, device_name: str, value: Any) -> None:
+		"""
+		Применить принятую команду.
+		:param device_name: Имя устройства.
+		:param value:       Значение устройства.
+		:return:            None.
+		"""
+		if device_name == 'LIGHTS':
+			self.devices.update(value)
+		else:
+			self.devices[device_name] = value
+
+	def feed_commands(self, data: bytes) -> None:
+		"""
+		Выделить из потока байтов команды `Z…E` (все команды длиной COMMAND_LENGTH) и применить их.
+		Неполная команда остается в буфере до следующего чтения.
+		:param data: Байты, принятые от RobotHardware.
+		:return:     None.
+		"""
+		buffer = self.__command_buffer
+		buffer += data
+		while True:
+			start = buffer.find(COMMAND_START)
+			if start < 0:
+				buffer.clear()
+				return
+			del buffer[:start]
+			if len(buffer) < COMMAND_LENGTH:
+				return
+			parsed = parse_command(bytes(buffer[:COMMAND_LENGTH]))
+			if parsed is None:
+				# пропускаем `Z` и ищем начало следующей команды
+				self.commands_malformed += 1
+				del buffer[:1]
+				continue
+			del buffer[:COMMAND_LENGTH]
+			self.commands_received += 1
+			self.on_command(*parsed)
+
+	def __next_period(self, sensor_name: str) -> float:
+		period = 1. / self.rates_hz[sensor_name]
+		if self.jitter:
+			period *= 1 + self.random.uniform(-self.jitter, self.jitter)
+		return period
+
+	def __emit(self, sensor_name: str) -> None:
+		sequence = self.sequences[sensor_name]
+		self.sequences[sensor_name] = sequence + 1
+		value = self.make_value(sensor_name=sensor_name, sequence=sequence)
+		line = self.format_telemetry(sensor_name=sensor_name, value=value)
+		self.on_emit(sensor_name=sensor_name, sequence=sequence, value=value, emit_time=time.monotonic())
+		try:
+			os.write(self.master_fd, line)
+			self.telemetry_sent += 1
+		except BlockingIOError:
+			# никто не читает ведомую сторону, как и у настоящего UART данные теряются
+			self.telemetry_dropped += 1
+
+	def serve(self, duration: float = None) -> None:
+		"""
+		Принимать команды и отправлять телеметрию.
+		:param duration: Время работы, сек. None - до вызова self.stop().
+		:return:         None.
+		"""
+		selector = selectors.DefaultSelector()
+		selector.register(self.master_fd, selectors.EVENT_READ)
+
+		start_time = time.monotonic()
+		next_due = {sensor_name: start_time + self.__next_period(sensor_name)
+					for sensor_name, rate in self.rates_hz.items() if rate > 0}
+
+		while self.is_active:
+			now = time.monotonic()
+			if duration is not None and now - start_time >= duration:
+				break
+			timeout = max(0., min(next_due.values()) - now) if next_due else 0.1
+			for _key, _events in selector.select(timeout=timeout):
+				try:
+					self.feed_commands(os.read(self.master_fd, 4096))
+				except (BlockingIOError, OSError):
+					pass
+
+			now = time.monotonic()
+			for sensor_name, due in next_due.items():
+				if due <= now:
+					self.__emit(sensor_name)
+					# без накопления отставания, если цикл был занят
+					next_due[sensor_name] = max(due + self.__next_period(sensor_name), now)
+		selector.close()
+
+	def stop(self):
+		self.is_active = False
+
+	def close(self):
+		os.close(self.master_fd)
+		os.close(self.slave_fd)
+
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--ir-rate', type=float, default=20., help='SI lines per second')
+	parser.add_argument('--us-rate', type=float, default=20., help='SU lines per second')
+	parser.add_argument('--battery-rate', type=float, default=1., help='SA lines per second')
+	parser.add_argument('--rfid-rate', type=float, default=0., help='SF lines per second')
+	parser.add_argument('--jitter', type=float, default=0., help='period jitter as a fraction of the period')
+	parser.add_argument('--duration', type=float, default=None, help='seconds to run, forever by default')
+	parser.add_argument('--seed', type=int, default=None)
+	args = parser.parse_args()
+
+	simulator = AutoBot_Simulator(rates_hz={'IR': args.ir_rate,
+											'US': args.us_rate,
+											'BATTERY': args.battery_rate,
+											'RFID': args.rfid_rate},
+								  jitter=args.jitter,
+								  seed=args.seed)
+	print(f'HW_SERIAL={simulator.device}', flush=True)
+	try:
+		simulator.serve(duration=args.duration)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		logger.info(f'commands received: {simulator.commands_received}, '
+					f'malformed: {simulator.commands_malformed}, '
+					f'telemetry sent: {simulator.telemetry_sent}, '
+					f'dropped: {simulator.telemetry_dropped}')
+		simulator.close()
@@ -2,8 +2,10 @@ import os
 import serial
 import sys
 import time
+import queue
+from collections import deque
 
-from typing import List, Tuple, Any, Dict
+from typing import List, Tuple, Any, Dict, Callable
 
 import logging
 
@@ -15,8 +17,526 @@ import random
 
 from donkeycar.parts.cv import CvCam
 
+from parts.frame_pool import Frame_Buffer_Pool, retain_frame, release_frame
+from parts.latency import Rolling_Percentiles
+from parts.jpeg_frame import Jpeg_Frame, is_jpeg
+
+
+logger = logging.getLogger(__name__)
+
+
+GSTREAMER_OUTPUT_FORMATS = ('RGB', 'BGR', 'GRAY8', 'Y')
+
+# nvvidconv flip-method -> videoflip method (the two enums differ for the 90 degree and diagonal cases)
+_VIDEOFLIP_METHODS = {0: 0, 1: 3, 2: 2, 3: 1, 4: 4, 5: 7, 6: 6, 7: 5}
+
+
+def construct_gstreamer_pipeline(sensor_id:      int = 0,
+                                 capture_width:  int = 640,
+                                 capture_height: int = 480,
+                                 display_width:  int = 640,
+                                 display_height: int = 480,
+                                 framerate:      int = 30,
+                                 flip_method:    int = 0,
+                                 output_format:  str = 'RGB',
+                                 use_nvvidconv:  bool = True,
+                                 source:         str = None,
+                                 ) -> str:
+    """
+    GStreamer pipeline that delivers frames to OpenCV already in `output_format`,
+    so no cvtColor is needed on the Python side.
+
+    With nvvidconv (Jetson) flip, scaling and conversion run on the VIC:
+    GRAY8 comes straight out of nvvidconv, RGB/BGR leave it as RGBA/BGRx and
+    only the alpha byte is dropped by videoconvert on the CPU.
+    Without nvvidconv every stage runs on the CPU (videoflip, videoscale, videoconvert).
+
+    OpenCV's appsink only accepts BGR for 3-channel frames, so RGB frames are
+    relabelled as BGR by capssetter; the bytes stay in RGB order.
+
+    'Y' delivers planar I420 without any colour conversion: OpenCV returns it as
+    one (height * 3 / 2, width) array whose first `height` rows are the luma
+    plane, which the camera publishes as a 2-D view (see Jetson_CSI_Camera).
+
+    :param output_format: one of GSTREAMER_OUTPUT_FORMATS
+    :param use_nvvidconv: use the hardware nvvidconv stage (Jetson only)
+    :param source: source element instead of nvarguscamerasrc, e.g. 'videotestsrc is-live=true'
+    :return: pipeline for cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+    """
+    assert output_format in GSTREAMER_OUTPUT_FORMATS, \
+        Exception(f'Bad value for `output_format`. Must be one of {GSTREAMER_OUTPUT_FORMATS}.\nGOT:\t{output_format}')
+
+    source = _gstreamer_source(sensor_id, capture_width, capture_height, framerate, source)
+    convert = _gstreamer_convert(display_width, display_height, flip_method, output_format, use_nvvidconv)
+    if output_format == 'RGB':
+        convert += " ! capssetter caps=\"video/x-raw, format=(string)BGR\""
+
+    return f"{source} ! {convert} ! appsink"
+
+
+def construct_gstreamer_tee_pipeline(branches:       List[Tuple[str, int, int, str]],
+                                     sensor_id:      int = 0,
+                                     capture_width:  int = 1280,
+                                     capture_height: int = 720,
+                                     framerate:      int = 30,
+                                     flip_method:    int = 0,
+                                     use_nvvidconv:  bool = True,
+                                     source:         str = None,
+                                     ) -> str:
+    """
+    One sensor, several outputs: the source is flipped once and split by `tee`,
+    every branch scales and converts on its own and ends in an appsink named
+    `branch<i>`. Leaky queues keep a slow consumer of one branch from stalling
+    the others.
+
+    The appsinks are read with GStreamer_Tee_Capture, not cv2.VideoCapture
+    (OpenCV reads a single appsink per pipeline), so RGB needs no capssetter.
+
+    :param branches: (name, width, height, output_format) of every branch
+    :return: pipeline for GStreamer_Tee_Capture
+    """
+    assert len(branches) > 0, Exception('`branches` must not be empty.')
+    for name, width, height, output_format in branches:
+        assert output_format in GSTREAMER_OUTPUT_FORMATS, \
+            Exception(f'Bad output format of branch `{name}`. Must be one of {GSTREAMER_OUTPUT_FORMATS}.\nGOT:\t{output_format}')
+
+    source = _gstreamer_source(sensor_id, capture_width, capture_height, framerate, source)
+    if use_nvvidconv:
+        flip = f"nvvidconv flip-method={flip_method} ! video/x-raw(memory:NVMM), format=(string)NV12"
+    else:
+        flip = f"videoflip method={_VIDEOFLIP_METHODS[flip_method]}"
+
+    pipeline = f"{source} ! {flip} ! tee name=t"
+    for i, (name, width, height, output_format) in enumerate(branches):
+        convert = _gstreamer_convert(width, height, 0, output_format, use_nvvidconv)
+        pipeline += f" t. ! queue max-size-buffers=1 leaky=downstream ! {convert} ! " \
+                    f"appsink name=branch{i} max-buffers=2 drop=true sync=false"
+    return pipeline
+
+
+def _gstreamer_source(sensor_id: int, capture_width: int, capture_height: int, framerate: int, source: str) -> str:
+    if source is None:
+        return f"nvarguscamerasrc sensor-id={sensor_id} ! " \
+               f"video/x-raw(memory:NVMM), width=(int){capture_width}, height=(int){capture_height}, " \
+               f"format=(string)NV12, framerate=(fraction){framerate}/1"
+    return f"{source} ! " \
+           f"video/x-raw, width=(int){capture_width}, height=(int){capture_height}, " \
+           f"framerate=(fraction){framerate}/1"
+
+
+def _gstreamer_convert(display_width: int, display_height: int, flip_method: int,
+                       output_format: str, use_nvvidconv: bool) -> str:
+    display_caps = f"width=(int){display_width}, height=(int){display_height}"
+    if output_format == 'Y':
+        # the sensor's NV12 is repacked to I420, whose luma plane is a plain 2-D block
+        if use_nvvidconv:
+            return f"nvvidconv flip-method={flip_method} ! video/x-raw, {display_caps}, format=(string)I420"
+        return f"videoflip method={_VIDEOFLIP_METHODS[flip_method]} ! " \
+               f"videoscale ! videoconvert ! video/x-raw, {display_caps}, format=(string)I420"
+    if use_nvvidconv:
+        if output_format == 'GRAY8':
+            return f"nvvidconv flip-method={flip_method} ! " \
+                   f"video/x-raw, {display_caps}, format=(string)GRAY8"
+        return f"nvvidconv flip-method={flip_method} ! " \
+               f"video/x-raw, {display_caps}, format=(string){'RGBA' if output_format == 'RGB' else 'BGRx'} ! " \
+               f"videoconvert ! video/x-raw, format=(string){output_format}"
+    return f"videoflip method={_VIDEOFLIP_METHODS[flip_method]} ! " \
+           f"videoscale ! videoconvert ! " \
+           f"video/x-raw, {display_caps}, format=(string){output_format}"
+
+
+class GStreamer_Tee_Capture(object):
+    """
+    Reads every appsink of a construct_gstreamer_tee_pipeline pipeline through
+    the GStreamer Python bindings (python3-gi, gir1.2-gstreamer-1.0).
+
+    read() returns one frame per branch, all from the same source buffer:
+    branches are matched by presentation timestamp, a branch whose leaky queue
+    dropped a buffer is pulled again until it catches up.
+    """
+
+    _CHANNELS = {'RGB': 3, 'BGR': 3, 'GRAY8': 1, 'I420': 1}
+
+    def __init__(self, pipeline: str, branch_count: int, timeout: float = 1.):
+        try:
+            import gi
+            gi.require_version('Gst', '1.0')
+            from gi.repository import Gst
+        except (ImportError, ValueError) as e:
+            raise Exception(f'Tee capture needs the GStreamer Python bindings (python3-gi): {e}')
+        Gst.init(None)
+        self.Gst = Gst
+        self.timeout_ns = int(timeout * 1e9)
+
+        self.pipeline = Gst.parse_launch(pipeline)
+        self.appsinks = [self.pipeline.get_by_name(f'branch{i}') for i in range(branch_count)]
+        if self.pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            raise RuntimeError(f'Unable to start the pipeline: {pipeline}')
+
+        # samples dropped while matching branch timestamps
+        self.unmatched = 0
+
+    def isOpened(self) -> bool:
+        return self.pipeline is not None
+
+    def grab(self) -> bool:
+        return self.__pull_matched() is not None
+
+    def read(self, buffers: List[np.ndarray] = None) -> Tuple[List[np.ndarray], int]:
+        """
+        :param buffers: per branch array to copy the frame into, or None to allocate one
+        :return: (frames, presentation timestamp in ns) or (None, None) on timeout / end of stream
+        """
+        samples = self.__pull_matched()
+        if samples is None:
+            return None, None
+        if buffers is None:
+            buffers = [None] * len(samples)
+        frames = [self.__copy_sample(sample, buffer) for sample, buffer in zip(samples, buffers)]
+        return frames, samples[0].get_buffer().pts
+
+    def monotonic_time(self, pts: int) -> float or None:
+        """
+        time.monotonic() of a buffer timestamp: pipeline base time + running time,
+        if the pipeline runs on the monotonic system clock (the default when no
+        element provides a clock), otherwise None.
+        """
+        clock = self.pipeline.get_clock()
+        if pts is None or pts == self.Gst.CLOCK_TIME_NONE or \
+                not isinstance(clock, self.Gst.SystemClock) or \
+                clock.props.clock_type != self.Gst.ClockType.MONOTONIC:
+            return None
+        return (self.pipeline.get_base_time() + pts) / 1e9
+
+    def release(self) -> None:
+        if self.pipeline is not None:
+            self.pipeline.set_state(self.Gst.State.NULL)
+            self.pipeline = None
+
+    def __pull(self, i: int):
+        return self.appsinks[i].emit('try-pull-sample', self.timeout_ns)
+
+    def __pull_matched(self):
+        samples = [self.__pull(i) for i in range(len(self.appsinks))]
+        while all(sample is not None for sample in samples):
+            timestamps = [sample.get_buffer().pts for sample in samples]
+            newest = max(timestamps)
+            if min(timestamps) == newest:
+                return samples
+            for i, pts in enumerate(timestamps):
+                if pts < newest:
+                    self.unmatched += 1
+                    samples[i] = self.__pull(i)
+        return None
+
+    def __copy_sample(self, sample, buffer: np.ndarray = None) -> np.ndarray:
+        structure = sample.get_caps().get_structure(0)
+        width, height = structure.get_value('width'), structure.get_value('height')
+        sample_format = structure.get_value('format')
+        channels = self._CHANNELS[sample_format]
+        shape = (height, width, channels) if channels > 1 else (height, width)
+
+        gst_buffer = sample.get_buffer()
+        mapped, info = gst_buffer.map(self.Gst.MapFlags.READ)
+        if not mapped:
+            return buffer
+        try:
+            # rows may be padded to 4 bytes; of I420 only the luma plane is copied
+            if sample_format == 'I420':
+                stride = (width + 3) & ~3
+            else:
+                stride = info.size // height
+            rows = np.frombuffer(info.data, dtype=np.uint8, count=stride * height).reshape(height, stride)
+            frame = rows[:, :width * channels].reshape(shape)
+            if buffer is not None and buffer.shape == shape:
+                np.copyto(buffer, frame)
+                return buffer
+            return frame.copy()
+        finally:
+            gst_buffer.unmap(info)
+
+
+class Pts_Clock(object):
+    """
+    Maps buffer timestamps (seconds of pipeline running time) to time.monotonic().
+    cv2.VideoCapture does not expose the pipeline base time, so the offset is the
+    smallest (read time - timestamp) seen so far. The fixed latency of the pipeline
+    is not part of the capture time, the time a frame waited in the appsink and
+    for the reading thread is.
+    """
+
+    def __init__(self):
+        self.offset = None
+
+    def capture_time(self, timestamp: float, read_time: float) -> float:
+        """
+        :param timestamp: buffer timestamp, s; None or <= 0 if the pipeline does not report it
+        :param read_time: time.monotonic() when the frame was read
+        """
+        if timestamp is None or timestamp <= 0:
+            return read_time
+        offset = read_time - timestamp
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+        return timestamp + self.offset
+
+
+class Capture_Watchdog(object):
+    """
+    Notices when a camera has published no frame for `timeout` seconds and
+    requests a rebuild of its capture (Argus daemon restart, unplugged USB
+    camera). The camera is stale from the last frame until frames arrive
+    again; rebuilds are retried every `retry_interval`.
+
+    check() runs on the drive loop and only sets the request; the camera
+    thread calls rebuild_if_requested() between reads, so a capture is never
+    released while a read on it is in progress.
+
+    A read that hangs (dead CSI or USB device) can not be broken safely.
+    The camera brackets its reads with read_started() / read_finished(); when
+    a read has been in progress for longer than `timeout`, check() calls
+    `abandon` instead: the camera moves reading to a new thread and a new
+    capture and leaves the hung capture to its thread, which releases it if
+    the read ever returns. After `max_abandoned_reads` hung reads (each one
+    keeps a thread) the camera stays stale and needs a process restart; so
+    does a device that can not be reopened while the hung read holds it.
+    """
 
-class Jetson_CSI_Camera(object):
+    def __init__(self,
+                 name: str,
+                 reconnect: Callable[[], bool],
+                 timeout: float,
+                 startup_timeout: float = 5.,
+                 retry_interval: float = 1.,
+                 abandon: Callable[[], None] = None,
+                 max_abandoned_reads: int = 2):
+        """
+        :param reconnect: releases and reopens the capture on the camera thread, True if it is open again
+        :param timeout: seconds without a frame before the camera is stale
+        :param startup_timeout: seconds to wait for the first frame
+        :param abandon: called on the drive loop when a read hangs, starts a new camera thread
+            that rebuilds the capture; None - wait for the read to return
+        :param max_abandoned_reads: hung reads to abandon before giving up
+        """
+        self.name = name
+        self.reconnect = reconnect
+        self.abandon = abandon
+        self.max_abandoned_reads = max_abandoned_reads
+        self.timeout = timeout
+        self.startup_timeout = max(startup_timeout, timeout)
+        self.retry_interval = retry_interval
+
+        self.stale = False
+        self.rebuild_requested = False
+        self.last_frame_time = None
+        # start of the read in progress on the camera thread, None between reads
+        self.read_start_time = None
+        self.abandoned_reads = 0
+        # successful rebuilds, all rebuild attempts, seconds without frames
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.downtime = 0.
+
+        self.__start_time = time.monotonic()
+        self.__stale_since = None
+        self.__next_attempt_time = 0.
+
+    def read_started(self) -> None:
+        self.read_start_time = time.monotonic()
+
+    def read_finished(self) -> None:
+        self.read_start_time = None
+
+    def frame_published(self, now: float = None) -> None:
+        if now is None:
+            now = time.monotonic()
+        self.last_frame_time = now
+        if self.__stale_since is not None:
+            down = now - self.__stale_since
+            self.downtime += down
+            self.__stale_since = None
+            self.stale = False
+            logger.warning(f'{self.name}: frames again after {down:.1f} s, '
+                           f'{self.reconnects} reconnects, {self.downtime:.1f} s down in total')
+
+    def check(self, now: float = None) -> bool:
+        """
+        Called on every vehicle loop tick. Starts a rebuild of the capture if
+        the camera went quiet.
+        :return: True while the camera is stale
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.last_frame_time is None:
+            last_frame_time, timeout = self.__start_time, self.startup_timeout
+        else:
+            last_frame_time, timeout = self.last_frame_time, self.timeout
+        if now - last_frame_time <= timeout:
+            return self.stale
+
+        if not self.stale:
+            self.stale = True
+            self.__stale_since = last_frame_time
+            logger.warning(f'{self.name}: no frames for {now - last_frame_time:.1f} s, reconnecting')
+        if now >= self.__next_attempt_time:
+            read_start_time = self.read_start_time
+            if self.abandon is not None and read_start_time is not None and now - read_start_time > self.timeout:
+                self.__abandon_read(now, now - read_start_time)
+            else:
+                self.rebuild_requested = True
+        return self.stale
+
+    def __abandon_read(self, now: float, duration: float) -> None:
+        self.__next_attempt_time = now + self.retry_interval
+        if self.abandoned_reads >= self.max_abandoned_reads:
+            if self.abandoned_reads == self.max_abandoned_reads:
+                # log once
+                self.abandoned_reads += 1
+                logger.error(f'{self.name}: read hung for {duration:.1f} s, {self.max_abandoned_reads} hung reads '
+                             f'already abandoned, restart the process to recover the camera')
+            return
+        self.abandoned_reads += 1
+        self.read_start_time = None
+        logger.warning(f'{self.name}: read hung for {duration:.1f} s, '
+                       f'reading from a new capture on a new thread')
+        self.abandon()
+
+    def rebuild_if_requested(self) -> bool:
+        """
+        Called by the camera thread between reads.
+        :return: True if a rebuild was attempted
+        """
+        if not self.rebuild_requested:
+            return False
+        self.reconnect_attempts += 1
+        try:
+            if self.reconnect():
+                self.reconnects += 1
+        except Exception as e:
+            logger.warning(f'{self.name}: reconnect failed: {e}')
+        finally:
+            self.__next_attempt_time = time.monotonic() + self.retry_interval
+            self.rebuild_requested = False
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        downtime = self.downtime
+        if self.__stale_since is not None:
+            downtime += time.monotonic() - self.__stale_since
+        return {'stale': self.stale,
+                'reconnects': self.reconnects,
+                'reconnect_attempts': self.reconnect_attempts,
+                'abandoned_reads': min(self.abandoned_reads, self.max_abandoned_reads),
+                'downtime': downtime}
+
+
+class Frame_Publisher(object):
+    """
+    Publishes the last captured frame together with a monotonically increasing
+    sequence number and the capture time (time.monotonic()).
+    The (frame, sequence, capture_time) tuple is swapped as a whole, so a reader
+    never sees a frame with the sequence number of another one.
+
+    With a Frame_Buffer_Pool the publisher holds one reference to the latest frame
+    and one to the frame handed to the vehicle loop; both are released when
+    replaced, so a buffer is not recycled while the loop is still using it.
+    """
+
+    def __init__(self, frame_pool: Frame_Buffer_Pool = None):
+        self.frame_pool = frame_pool
+        self.frame = None
+        self.frame_sequence = 0
+        self.frame_time = None
+        self.latest = (None, 0, None)
+        # frames captured while the pool was exhausted
+        self.frames_dropped = 0
+        self.pool_mismatch_logged = False
+
+        self.__frame_lock = threading.Lock()
+        self.__handed_out = None
+        # recent (frame, sequence, capture_time), see enable_history()
+        self.__history = None
+        # Capture_Watchdog of cameras that can rebuild their capture
+        self.watchdog = None
+
+    def publish_frame(self, frame: np.ndarray, capture_time: float) -> None:
+        """
+        Takes over the caller's reference to a pool frame.
+        """
+        if self.watchdog is not None:
+            self.watchdog.frame_published()
+        with self.__frame_lock:
+            previous = self.frame
+            sequence = self.frame_sequence + 1
+            self.latest = (frame, sequence, capture_time)
+            self.frame, self.frame_sequence, self.frame_time = frame, sequence, capture_time
+            release_frame(previous)
+            if self.__history is not None:
+                if len(self.__history) == self.__history.maxlen:
+                    release_frame(self.__history.popleft()[0])
+                retain_frame(frame)
+                self.__history.append(self.latest)
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        True while the watchdog sees no new frames.
+        """
+        return self.watchdog is not None and self.watchdog.stale
+
+    def enable_history(self, size: int) -> None:
+        """
+        Keep the last `size` published frames (retained) for history_snapshot().
+        """
+        with self.__frame_lock:
+            self.__history = deque(maxlen=size)
+
+    def history_snapshot(self) -> List[Tuple[np.ndarray, int, float]]:
+        """
+        Recent (frame, sequence, capture_time), oldest first. Every frame is
+        retained for the caller, who releases them with release_frame().
+        """
+        with self.__frame_lock:
+            if self.__history is None:
+                snapshot = [self.latest] if self.latest[0] is not None else []
+            else:
+                snapshot = list(self.__history)
+            for frame, sequence, capture_time in snapshot:
+                retain_frame(frame)
+            return snapshot
+
+    def publish_rgb(self, frame: np.ndarray, capture_time: float, buffer: np.ndarray = None) -> None:
+        """
+        Convert a BGR capture to RGB into the pool buffer and publish it.
+        Falls back to a new array if the capture size does not match the pool.
+        """
+        if buffer is not None and buffer.shape[:2] == frame.shape[:2]:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+            self.publish_frame(buffer, capture_time)
+            return
+        if buffer is not None:
+            release_frame(buffer)
+            if not self.pool_mismatch_logged:
+                self.pool_mismatch_logged = True
+                logger.warning(f'capture size {frame.shape} does not match the frame pool {buffer.shape}')
+        self.publish_frame(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), capture_time)
+
+    def hand_out(self) -> Tuple[np.ndarray, int, float]:
+        """
+        Latest frame for the vehicle loop; the frame handed out on the previous call is released.
+        """
+        if self.watchdog is not None:
+            self.watchdog.check()
+        with self.__frame_lock:
+            latest = self.latest
+            if latest[0] is not self.__handed_out:
+                retain_frame(latest[0])
+                release_frame(self.__handed_out)
+                self.__handed_out = latest[0]
+            return latest
+
+
+class Jetson_CSI_Camera(Frame_Publisher):
     def __init__(self,
                  sensor_id: int = 0,
                  capture_width: int = 1280,
@@ -24,12 +544,41 @@ class Jetson_CSI_Camera(object):
                  framerate: int = 60,
                  gstreamer_flip: int = 2,
                  image_w: int = None,
-                 image_h: int = None):
+                 image_h: int = None,
+                 frame_pool: Frame_Buffer_Pool = None,
+                 pool_timeout: float = 0.05,
+                 output_format: str = 'RGB',
+                 use_nvvidconv: bool = True,
+                 branches: List[Tuple[str, int, int, str]] = None,
+                 branch_pool_size: int = 0,
+                 watchdog_periods: int = 0):
+        """
+        :param frame_pool: frames are captured into buffers of this pool instead of new arrays
+        :param pool_timeout: seconds to wait for a free pool buffer before dropping a frame
+        :param output_format: frame format produced by the GStreamer pipeline: RGB, BGR, GRAY8 or Y.
+            Y publishes the luma plane as a 2-D view of the captured I420 frame, without copies;
+            a frame_pool for it holds (image_h * 3 / 2, image_w) buffers
+        :param use_nvvidconv: convert with the hardware nvvidconv stage
+        :param branches: (name, width, height, output_format) of every output of a `tee` pipeline.
+            The part then outputs one frame per branch followed by the shared frame
+            sequence number and capture time; image_w, image_h, output_format and
+            frame_pool are not used.
+        :param branch_pool_size: size of the frame pool of every branch, 0 - no pools
+        :param watchdog_periods: rebuild the pipeline after this many frame periods without a frame, 0 - never
+        """
         self.sensor_id = sensor_id
         self.capture_width = capture_width
         self.capture_height = capture_height
         self.framerate = framerate
         self.gstreamer_flip = gstreamer_flip
+        self.output_format = output_format
+        self.use_nvvidconv = use_nvvidconv
+        self.branches = list(branches) if branches else None
+        self.branch_pools = None
+        if self.branches and branch_pool_size:
+            self.branch_pools = [Frame_Buffer_Pool(shape=(height, width) if output_format in ('GRAY8', 'Y') else (height, width, 3),
+                                                   size=branch_pool_size)
+                                 for name, width, height, output_format in self.branches]
 
         if image_w is None:
             self.display_width = capture_width
@@ -40,59 +589,56 @@ class Jetson_CSI_Camera(object):
         else:
             self.display_height = image_h
 
-        # The last captured image from the camera
-        self.frame = None
+        # The last captured image from the camera, its sequence number and capture time
+        Frame_Publisher.__init__(self, frame_pool=frame_pool)
+        self.pool_timeout = pool_timeout
         self.grabbed = False
+        # buffer timestamps -> capture times
+        self.pts_clock = Pts_Clock()
 
         self.gstreamer_pipeline = None
         self.video_capture = None
 
         self.running = True
+        # bumped when a hung read is abandoned, the older camera threads exit
+        self.__generation = 0
+        if watchdog_periods:
+            self.watchdog = Capture_Watchdog(name=f'CSI camera {sensor_id}',
+                                             reconnect=self.__reconnect,
+                                             timeout=watchdog_periods / framerate,
+                                             abandon=self.__abandon_read)
         self.__create_capture_device()
 
 
-    def __construct_gstreamer_pipeline(self,
-                                       sensor_id:         int = 0,
-                                       capture_width:     int = 640,
-                                       capture_height:    int = 480,
-                                       display_width:     int = 640,
-                                       display_height:    int = 480,
-                                       framerate:         int = 30,
-                                       flip_method:       int = 0,
-                                       ) -> str:
-        """
-        construct_gstreamer_pipeline returns a GStreamer pipeline for capturing from the CSI camera
-        Flip the image by setting the flip_method (most common values: 0 and 2)
-        display_width and display_height determine the size of each camera pane in the window on the screen
-        Default 1920x1080
-
-        :param sensor_id:
-        :param capture_width:
-        :param capture_height:
-        :param display_width:
-        :param display_height:
-        :param framerate:
-        :param flip_method:
-        :return:
-        """
-        return f"nvarguscamerasrc sensor-id={sensor_id} ! " \
-               f"video/x-raw(memory:NVMM), width=(int){capture_width}, height=(int){capture_height}, " \
-               f"format=(string)NV12, " \
-               f"framerate=(fraction){framerate}/1 ! " \
-               f"nvvidconv flip-method={flip_method} ! " \
-               f"nvvidconv ! " \
-               f"video/x-raw, width=(int){display_width}, height=(int){display_height}, format=(string)BGRx ! " \
-               f"videoconvert ! appsink"
+    def __reconnect(self) -> bool:
+        # camera thread, no read in progress
+        if self.video_capture is not None:
+            self.video_capture.release()
+        self.pts_clock = Pts_Clock()
+        self.__create_capture_device()
+        return self.video_capture is not None and self.video_capture.isOpened()
+
+    def __abandon_read(self) -> None:
+        # drive loop: the camera thread hangs in a read, it keeps that capture
+        self.video_capture = None
+        self.__generation += 1
+        self.watchdog.rebuild_requested = True
+        threading.Thread(target=self.__capture_loop, args=(self.__generation, ), daemon=True).start()
 
     def __create_capture_device(self):
+        if self.branches:
+            self.__create_tee_capture_device()
+            return
         try:
-            self.gstreamer_pipeline = self.__construct_gstreamer_pipeline(sensor_id=self.sensor_id,
-                                                                          capture_width=self.capture_width,
-                                                                          capture_height=self.capture_height,
-                                                                          display_width=self.display_width,
-                                                                          display_height=self.display_height,
-                                                                          framerate=self.framerate,
-                                                                          flip_method=self.gstreamer_flip)
+            self.gstreamer_pipeline = construct_gstreamer_pipeline(sensor_id=self.sensor_id,
+                                                                   capture_width=self.capture_width,
+                                                                   capture_height=self.capture_height,
+                                                                   display_width=self.display_width,
+                                                                   display_height=self.display_height,
+                                                                   framerate=self.framerate,
+                                                                   flip_method=self.gstreamer_flip,
+                                                                   output_format=self.output_format,
+                                                                   use_nvvidconv=self.use_nvvidconv)
 
             self.video_capture = cv2.VideoCapture(self.gstreamer_pipeline, cv2.CAP_GSTREAMER)
 
@@ -104,48 +650,783 @@ class Jetson_CSI_Camera(object):
             print("Pipeline: " + self.gstreamer_pipeline)
             raise Exception(f'Please check CSI camera: [{self.sensor_id}].')
 
+    def __create_tee_capture_device(self):
+        self.gstreamer_pipeline = construct_gstreamer_tee_pipeline(branches=self.branches,
+                                                                   sensor_id=self.sensor_id,
+                                                                   capture_width=self.capture_width,
+                                                                   capture_height=self.capture_height,
+                                                                   framerate=self.framerate,
+                                                                   flip_method=self.gstreamer_flip,
+                                                                   use_nvvidconv=self.use_nvvidconv)
+        try:
+            self.video_capture = GStreamer_Tee_Capture(self.gstreamer_pipeline, branch_count=len(self.branches))
+        except RuntimeError:
+            self.video_capture = None
+            print("Unable to open camera")
+            print("Pipeline: " + self.gstreamer_pipeline)
+            raise Exception(f'Please check CSI camera: [{self.sensor_id}].')
+
     def shutdown(self):
         self.running = False
         time.sleep(0.2)
-        self.video_capture.release()
+        if self.video_capture is not None:
+            self.video_capture.release()
 
-    def run(self) -> np.ndarray:
-        self.read_frame_from_device()
-        return self.frame
+    def run(self) -> tuple:
+        if self.watchdog is None or not self.watchdog.rebuild_if_requested():
+            self.read_frame_from_device()
+        return self.__outputs(self.hand_out())
+
+    def run_threaded(self) -> tuple:
+        """
+        :return: (frame, frame sequence number, capture time),
+            with branches (frame of every branch..., frame sequence number, capture time)
+        """
+        return self.__outputs(self.hand_out())
 
-    def run_threaded(self) -> np.ndarray:
-        return self.frame
+    def __outputs(self, latest: Tuple[Any, int, float]) -> tuple:
+        if not self.branches:
+            return latest
+        frames, sequence, capture_time = latest
+        if frames is None:
+            frames = (None,) * len(self.branches)
+        return (*frames, sequence, capture_time)
 
     def read_frame_from_device(self):
-        grabbed, frame = self.video_capture.read()
-        if frame is not None:
-            self.grabbed, self.frame = grabbed, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            return self.grabbed, self.frame
+        capture = self.video_capture
+        if self.watchdog is None:
+            return self.__read(capture)
+        self.watchdog.read_started()
+        try:
+            return self.__read(capture)
+        finally:
+            self.watchdog.read_finished()
+
+    def __read(self, capture):
+        if self.branches:
+            return self.__read_branches(capture)
+        # frames come out of the pipeline already in self.output_format
+        buffer = None
+        if self.frame_pool is not None:
+            buffer = self.frame_pool.acquire(timeout=self.pool_timeout)
+            if buffer is None:
+                # keep the pipeline draining while every buffer is held by consumers
+                capture.grab()
+                self.frames_dropped += 1
+                return
+        grabbed, frame = capture.read(image=buffer)
+        if not grabbed or frame is None or capture is not self.video_capture:
+            # nothing read, or the read hung and was abandoned
+            release_frame(buffer)
+            return
+        # the position of the appsink is the timestamp of the buffer just read
+        capture_time = self.pts_clock.capture_time(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.,
+                                                   read_time=time.monotonic())
+        if buffer is not None and frame is not buffer:
+            # OpenCV allocated a new array: the pipeline output does not match the pool
+            release_frame(buffer)
+            if not self.pool_mismatch_logged:
+                self.pool_mismatch_logged = True
+                logger.warning(f'capture size {frame.shape} does not match the frame pool {buffer.shape}')
+        if self.output_format == 'Y':
+            # the luma plane: a contiguous view of the first rows, the pool buffer stays its base
+            frame = frame[:self.display_height]
+        self.grabbed = grabbed
+        self.publish_frame(frame, capture_time)
+        return self.grabbed, self.frame
+
+    def __read_branches(self, capture):
+        # all branches of one source buffer are published together under one sequence number
+        buffers = None
+        if self.branch_pools is not None:
+            buffers = [pool.acquire(timeout=self.pool_timeout) for pool in self.branch_pools]
+            if any(buffer is None for buffer in buffers):
+                release_frame(tuple(buffers))
+                capture.grab()
+                self.frames_dropped += 1
+                return
+        frames, pts = capture.read(buffers)
+        if frames is None or capture is not self.video_capture:
+            if buffers is not None:
+                release_frame(tuple(buffers))
+            return
+        read_time = time.monotonic()
+        capture_time = capture.monotonic_time(pts)
+        if capture_time is None:
+            capture_time = self.pts_clock.capture_time(pts / 1e9 if pts is not None else None, read_time=read_time)
+        if buffers is not None:
+            for buffer, frame in zip(buffers, frames):
+                if frame is not buffer:
+                    release_frame(buffer)
+                    if not self.pool_mismatch_logged:
+                        self.pool_mismatch_logged = True
+                        logger.warning(f'branch frame {frame.shape} does not match its frame pool {buffer.shape}')
+        self.grabbed = True
+        self.publish_frame(tuple(frames), capture_time)
+        return self.grabbed, self.frame
 
     def update(self):
         if self.video_capture is None:
             self.__create_capture_device()
+        self.__capture_loop(self.__generation)
 
-        while self.running:
-            self.read_frame_from_device()
+    def __capture_loop(self, generation: int):
+        # the capture this thread read from last
+        capture = None
+        while self.running and generation == self.__generation:
+            if self.watchdog is not None and self.watchdog.rebuild_if_requested():
+                continue
+            if self.video_capture is None:
+                time.sleep(0.05)
+                continue
+            capture = self.video_capture
+            if self.read_frame_from_device() is None:
+                # nothing read: do not spin on a failed pipeline
+                time.sleep(0.005)
+        if capture is not None and capture is not self.video_capture:
+            # the hung read returned after all, nobody else uses this capture
+            capture.release()
 
 
-class CV_USB_Camera(CvCam):
+class CV_USB_Camera(CvCam, Frame_Publisher):
     def __init__(self,
                  camera_path:    str = '/dev/cams/usb',
                  capture_width:  int = 640,
                  capture_height: int = 480,
+                 frame_pool: Frame_Buffer_Pool = None,
+                 pool_timeout: float = 0.05,
+                 framerate: int = 30,
+                 watchdog_periods: int = 0,
+                 mjpeg: bool = False,
                  ):
-        super().__init__(iCam=camera_path,
-                         image_w=capture_width,
-                         image_h=capture_height,
-                         image_d=3)
+        """
+        :param framerate: expected frame rate, for the watchdog timeout
+        :param watchdog_periods: reopen the device after this many frame periods without a frame, 0 - never
+        :param mjpeg: negotiate MJPEG and publish the compressed frames as parts.jpeg_frame.Jpeg_Frame,
+            decoded only by consumers that need an array; frame_pool is not used
+        """
+        Frame_Publisher.__init__(self, frame_pool=frame_pool)
+        self.camera_path = camera_path
+        self.capture_width = capture_width
+        self.capture_height = capture_height
+        self.pool_timeout = pool_timeout
+        self.capture_buffer = None
+        self.mjpeg = mjpeg
+        # frames the device delivered decoded although MJPEG was requested
+        self.mjpeg_fallback_logged = False
+        # bumped when a hung read is abandoned, the older camera threads exit
+        self.__generation = 0
+        if watchdog_periods:
+            self.watchdog = Capture_Watchdog(name=f'USB camera {camera_path}',
+                                             reconnect=self.reconnect,
+                                             timeout=watchdog_periods / framerate,
+                                             abandon=self.__abandon_read)
+        CvCam.__init__(self,
+                       iCam=camera_path,
+                       image_w=capture_width,
+                       image_h=capture_height,
+                       image_d=3)
+        if self.mjpeg:
+            self.__configure_mjpeg(self.cap)
+
+    def __configure_mjpeg(self, cap) -> None:
+        # the format first: UVC cameras list their frame sizes per format
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_height)
+        # V4L2 backend: hand out the compressed buffer instead of decoding it
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    def reconnect(self) -> bool:
+        # camera thread (poll), no read in progress
+        if self.cap is not None:
+            self.cap.release()
+        self.capture_buffer = None
+        cap = cv2.VideoCapture(self.camera_path)
+        if self.mjpeg:
+            self.__configure_mjpeg(cap)
+        else:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_height)
+        self.cap = cap
+        return cap.isOpened()
+
+    def __abandon_read(self) -> None:
+        # drive loop: the camera thread hangs in a read, it keeps that capture
+        self.cap = None
+        self.capture_buffer = None
+        self.__generation += 1
+        self.watchdog.rebuild_requested = True
+        threading.Thread(target=self.__poll_loop, args=(self.__generation, ), daemon=True).start()
+
+    def update(self):
+        self.__poll_loop(self.__generation)
+
+    def __poll_loop(self, generation: int):
+        # the capture this thread read from last
+        cap = None
+        while self.running and generation == self.__generation:
+            if self.cap is not None:
+                cap = self.cap
+            self.poll()
+        if cap is not None and cap is not self.cap:
+            # the hung read returned after all, nobody else uses this capture
+            cap.release()
 
     def poll(self):
-        if self.cap.isOpened():
-            ret, frame = self.cap.read()
+        if self.watchdog is not None and self.watchdog.rebuild_if_requested():
+            return
+        cap = self.cap
+        if cap is None or not cap.isOpened():
+            # unplugged, the watchdog requests a reopen
+            time.sleep(0.05)
+            return
+        if self.watchdog is None:
+            self.__read(cap)
+            return
+        self.watchdog.read_started()
+        try:
+            self.__read(cap)
+        finally:
+            self.watchdog.read_finished()
+
+    def __read(self, cap) -> None:
+        if self.mjpeg:
+            self.__poll_mjpeg(cap)
+            return
+        if self.frame_pool is None:
+            ret, frame = cap.read()
+            if cap is not self.cap:
+                # the read hung and was abandoned
+                return
             if frame is not None:
-                self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.publish_rgb(frame, time.monotonic())
+            else:
+                time.sleep(0.005)
+            return
+
+        buffer = self.frame_pool.acquire(timeout=self.pool_timeout)
+        if buffer is None:
+            cap.grab()
+            self.frames_dropped += 1
+            return
+        ret, frame = cap.read(image=self.capture_buffer)
+        if cap is not self.cap:
+            release_frame(buffer)
+            return
+        if not ret or frame is None:
+            release_frame(buffer)
+            time.sleep(0.005)
+            return
+        capture_time = time.monotonic()
+        self.capture_buffer = frame
+        self.publish_rgb(frame, capture_time, buffer)
+
+    def __poll_mjpeg(self, cap) -> None:
+        ret, frame = cap.read()
+        if cap is not self.cap:
+            return
+        if not ret or frame is None:
+            time.sleep(0.005)
+            return
+        capture_time = time.monotonic()
+        if is_jpeg(frame):
+            self.publish_frame(Jpeg_Frame(frame.tobytes()), capture_time)
+            return
+        # the backend decoded the frame anyway (no MJPEG mode or no raw buffer support)
+        if not self.mjpeg_fallback_logged:
+            self.mjpeg_fallback_logged = True
+            logger.warning(f'USB camera {self.camera_path} delivers decoded {frame.shape} frames, not MJPEG')
+        self.publish_rgb(frame, capture_time)
+
+    def run(self) -> Tuple[np.ndarray, int, float]:
+        self.poll()
+        return self.hand_out()
+
+    def run_threaded(self) -> Tuple[np.ndarray, int, float]:
+        """
+        :return: (frame, frame sequence number, capture time)
+        """
+        return self.hand_out()
+
+
+class Replay_Camera(Frame_Publisher):
+    """
+    Camera part that replays recorded frames, so the whole vehicle graph can run
+    and be profiled without camera hardware. Same interface as Jetson_CSI_Camera:
+    threaded update(), run_threaded() -> (frame, frame sequence number, capture time).
+
+    Sources: a video file, a directory of images (sorted by name) or a tub
+    directory (the `tub_image_key` records). Frames are decoded, resized and
+    converted to `output_format` ahead of time in a background thread.
+
+    Modes:
+        realtime - the recorded pace: video timestamps, tub `_timestamp_ms`,
+                   `framerate` for a directory of images
+        fixed    - `framerate` frames per second
+        fast     - the next frame is published as soon as the vehicle loop took
+                   the previous one: every frame is processed exactly once and
+                   the replay measures the throughput of the graph
+    """
+
+    REPLAY_MODES = ('realtime', 'fixed', 'fast')
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self,
+                 path: str,
+                 mode: str = 'realtime',
+                 framerate: float = 20,
+                 image_w: int = None,
+                 image_h: int = None,
+                 output_format: str = 'RGB',
+                 loop: bool = False,
+                 tub_image_key: str = 'cam/image_array',
+                 decode_ahead: int = 8,
+                 frame_pool: Frame_Buffer_Pool = None,
+                 pool_timeout: float = 0.05):
+        """
+        :param path: video file, directory of images or tub directory
+        :param mode: one of REPLAY_MODES
+        :param framerate: frames per second of the `fixed` mode and of a directory of images
+        :param image_w: resize frames to this width, None - keep the recorded size
+        :param image_h: resize frames to this height, None - keep the recorded size
+        :param output_format: RGB, BGR, GRAY8 or Y (a 2-D luma frame, as GRAY8)
+        :param loop: start over at the end of the recording
+        :param tub_image_key: tub record key of the image to replay
+        :param decode_ahead: frames decoded ahead of publishing
+        """
+        assert mode in self.REPLAY_MODES, \
+            Exception(f'Bad value for `mode`. Must be one of {self.REPLAY_MODES}.\nGOT:\t{mode}')
+        assert output_format in GSTREAMER_OUTPUT_FORMATS, \
+            Exception(f'Bad value for `output_format`. Must be one of {GSTREAMER_OUTPUT_FORMATS}.\nGOT:\t{output_format}')
+        assert os.path.exists(path), Exception(f'Replay source does not exist:\t{os.path.abspath(path)}')
+
+        Frame_Publisher.__init__(self, frame_pool=frame_pool)
+        self.path = path
+        self.mode = mode
+        self.framerate = framerate
+        self.image_w = image_w
+        self.image_h = image_h
+        self.output_format = output_format
+        self.loop = loop
+        self.tub_image_key = tub_image_key
+        self.pool_timeout = pool_timeout
+
+        # frames published and frames published after their due time (realtime / fixed)
+        self.frames_published = 0
+        self.frames_late = 0
+        self.finished = False
+
+        self.__decoded = queue.Queue(maxsize=decode_ahead)
+        self.__taken = threading.Event()
+        self.__taken.set()
+        self.__handed_out_sequence = 0
+
+        self.running = True
+        self.__decoder = threading.Thread(target=self.__decode, daemon=True)
+        self.__decoder.start()
+
+    def shutdown(self):
+        self.running = False
+        self.__taken.set()
+        self.__decoder.join(timeout=1.)
+
+    def run(self) -> Tuple[np.ndarray, int, float]:
+        # not threaded: one recorded frame per loop, as in the `fast` mode
+        item = self.__next_item()
+        if item is not None:
+            self.__publish(item[0])
+        return self.__hand_out()
+
+    def run_threaded(self) -> Tuple[np.ndarray, int, float]:
+        """
+        :return: (frame, frame sequence number, capture time)
+        """
+        return self.__hand_out()
+
+    def update(self):
+        start_wall = None
+        previous_timestamp = None
+        while self.running:
+            item = self.__next_item()
+            if item is None:
+                if not self.finished:
+                    self.finished = True
+                    logger.info(f'replay of {self.path} finished: {self.frames_published} frames, '
+                                f'{self.frames_late} late, {self.frames_dropped} dropped')
+                time.sleep(0.05)
+                continue
+            frame, timestamp = item
+
+            if self.mode == 'fast':
+                # wait for the vehicle loop to take the previous frame
+                while self.running and not self.__taken.wait(timeout=0.1):
+                    pass
+                self.__taken.clear()
+            else:
+                if self.mode == 'fixed':
+                    timestamp = self.frames_published / self.framerate
+                if start_wall is None or timestamp < previous_timestamp:
+                    # first frame or the recording started over
+                    start_wall = time.monotonic() - timestamp
+                previous_timestamp = timestamp
+                delay = start_wall + timestamp - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.5 / self.framerate:
+                    self.frames_late += 1
+            self.__publish(frame)
+
+    def __next_item(self):
+        while self.running:
+            try:
+                item = self.__decoded.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                # end of the recording; keep the marker for later calls
+                self.__decoded.put(None)
+            return item
+        return None
+
+    def __publish(self, frame: np.ndarray) -> None:
+        self.frames_published += 1
+        self.publish_frame(frame, time.monotonic())
+
+    def __hand_out(self) -> Tuple[np.ndarray, int, float]:
+        latest = self.hand_out()
+        if latest[1] != self.__handed_out_sequence:
+            self.__handed_out_sequence = latest[1]
+            self.__taken.set()
+        return latest
+
+    def __decode(self) -> None:
+        try:
+            while self.running:
+                for frame, timestamp in self.__read_source():
+                    if not self.running:
+                        return
+                    frame = self.__convert(frame)
+                    if frame is not None:
+                        self.__put((frame, timestamp))
+                if not self.loop:
+                    break
+        except Exception as e:
+            logger.error(f'replay of {self.path} failed: {e}')
+        self.__put(None)
+
+    def __put(self, item) -> None:
+        while self.running:
+            try:
+                self.__decoded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        if item is not None:
+            release_frame(item[0])
+
+    def __convert(self, frame: np.ndarray) -> np.ndarray or None:
+        """
+        BGR frame from OpenCV -> `output_format` at the replay size, in a pool buffer if there is one.
+        """
+        if self.image_w is not None and self.image_h is not None and \
+                frame.shape[:2] != (self.image_h, self.image_w):
+            frame = cv2.resize(frame, (self.image_w, self.image_h), interpolation=cv2.INTER_AREA)
+        if self.output_format in ('GRAY8', 'Y'):
+            shape = frame.shape[:2]
+        else:
+            shape = frame.shape
+
+        buffer = None
+        if self.frame_pool is not None:
+            if self.frame_pool.shape == shape:
+                while self.running and buffer is None:
+                    buffer = self.frame_pool.acquire(timeout=self.pool_timeout)
+                if buffer is None:
+                    return None
+            elif not self.pool_mismatch_logged:
+                self.pool_mismatch_logged = True
+                logger.warning(f'replay frame {shape} does not match the frame pool {self.frame_pool.shape}')
+
+        if self.output_format == 'RGB':
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+        if self.output_format in ('GRAY8', 'Y'):
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buffer)
+        if buffer is None:
+            return frame
+        np.copyto(buffer, frame)
+        return buffer
+
+    def __read_source(self):
+        """
+        :return: iterator of (BGR frame, timestamp in seconds from the start of the recording)
+        """
+        if os.path.isdir(self.path):
+            if os.path.exists(os.path.join(self.path, 'manifest.json')):
+                return self.__read_tub()
+            return self.__read_images()
+        return self.__read_video()
+
+    def __read_video(self):
+        capture = cv2.VideoCapture(self.path)
+        assert capture.isOpened(), Exception(f'Unable to open video:\t{self.path}')
+        fps = capture.get(cv2.CAP_PROP_FPS) or self.framerate
+        try:
+            index = 0
+            while self.running:
+                grabbed, frame = capture.read()
+                if not grabbed:
+                    return
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.
+                if timestamp <= 0 and index:
+                    # containers without timestamps
+                    timestamp = index / fps
+                yield frame, timestamp
+                index += 1
+        finally:
+            capture.release()
+
+    def __read_images(self):
+        names = sorted(name for name in os.listdir(self.path)
+                       if os.path.splitext(name)[1].lower() in self.IMAGE_EXTENSIONS)
+        assert names, Exception(f'No images in:\t{os.path.abspath(self.path)}')
+        for i, name in enumerate(names):
+            frame = cv2.imread(os.path.join(self.path, name), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield frame, i / self.framerate
+
+    def __read_tub(self):
+        from donkeycar.parts.tub_v2 import Tub
+
+        tub = Tub(self.path, read_only=True)
+        start_ms = None
+        for i, record in enumerate(tub):
+            image_name = record.get(self.tub_image_key)
+            if image_name is None:
+                continue
+            frame = cv2.imread(os.path.join(tub.images_base_path, image_name), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            timestamp_ms = record.get('_timestamp_ms')
+            if timestamp_ms is None:
+                timestamp = i / self.framerate
+            else:
+                if start_ms is None:
+                    start_ms = timestamp_ms
+                timestamp = (timestamp_ms - start_ms) / 1000.
+            yield frame, timestamp
+
+
+class Stale_Camera_Flag(object):
+    """
+    True while any of the cameras is stale (see Capture_Watchdog), so the
+    drive mode can stop instead of driving on the last frame.
+    """
+
+    def __init__(self, cameras: List[Frame_Publisher]):
+        self.cameras = list(cameras)
+
+    def run(self) -> bool:
+        return any(camera.is_stale for camera in self.cameras)
+
+
+class Frame_Sequence_Gate(object):
+    """
+    Run condition part: True only when the frame sequence has advanced since the
+    previous call and the optional `condition` input is true. Lets parts such as
+    the pilot or the tub writer skip frames they have already processed.
+    """
+
+    def __init__(self):
+        self.last_sequence = None
+
+    def run(self, frame_sequence: int, condition: bool = True) -> bool:
+        if not condition or frame_sequence is None or frame_sequence == self.last_sequence:
+            return False
+        self.last_sequence = frame_sequence
+        return True
+
+
+class Synced_Camera_Pair(object):
+    """
+    Pairs frames of two cameras by capture time.
+
+    Both cameras keep a short history of published frames (enable_history).
+    On each tick the newest frame of the camera that is behind is paired with
+    the frame of the other camera closest to it in time; a pair whose skew
+    exceeds `max_skew` is dropped. Frames are passed by reference and retained
+    while they are the current pair, nothing is copied.
+
+    Outputs (first frame, second frame, first capture time, second capture time,
+    skew in ms, new pair): with no new pair in bound the last accepted pair is
+    returned again with `new pair` False, use it as the run_condition of
+    consumers that need every pair once.
+    """
+
+    def __init__(self,
+                 first: Frame_Publisher,
+                 second: Frame_Publisher,
+                 max_skew: float = 0.02,
+                 history: int = 4,
+                 log_interval: float = 10):
+        """
+        :param max_skew: largest accepted capture time difference, s
+        :param history: frames kept per camera to pick the closest one from
+        :param log_interval: seconds between pairing statistics in the log, None - do not log
+        """
+        self.first = first
+        self.second = second
+        self.max_skew = max_skew
+        self.log_interval = log_interval
+        first.enable_history(history)
+        second.enable_history(history)
+
+        self.skew_ms = Rolling_Percentiles()
+        self.pairs = 0
+        # ticks whose best pair was out of bound, ticks without a new pair
+        self.dropped = 0
+        self.repeated = 0
+
+        self.pair = (None, None, None, None, None, False)
+        self.__last_sequences = (None, None)
+        self.__next_log_time = time.monotonic() + log_interval if log_interval else None
+
+    def run(self) -> tuple:
+        first_history = self.first.history_snapshot()
+        second_history = self.second.history_snapshot()
+        try:
+            self.__update_pair(self.__match(first_history, second_history))
+        finally:
+            # the snapshot references; the accepted pair is retained separately
+            release_frame(tuple(item[0] for item in first_history + second_history))
+        if not self.pair[5]:
+            self.repeated += 1
+        self.__maybe_log()
+        return self.pair
+
+    def __update_pair(self, pair) -> None:
+        if pair is None:
+            self.pair = self.pair[:5] + (False,)
+            return
+        (first_frame, first_sequence, first_time), (second_frame, second_sequence, second_time) = pair
+        skew = abs(first_time - second_time)
+        self.__last_sequences = (first_sequence, second_sequence)
+        if skew > self.max_skew:
+            self.dropped += 1
+            self.pair = self.pair[:5] + (False,)
+            return
+        self.pairs += 1
+        self.skew_ms.add(skew * 1000)
+        retain_frame((first_frame, second_frame))
+        release_frame((self.pair[0], self.pair[1]))
+        self.pair = (first_frame, second_frame, first_time, second_time, skew * 1000, True)
+
+    def __match(self, first_history: list, second_history: list):
+        """
+        :return: ((frame, sequence, time), (frame, sequence, time)) not paired before, or None
+        """
+        if not first_history or not second_history:
+            return None
+        # anchor: the newest frame of the camera that is behind
+        if first_history[-1][2] <= second_history[-1][2]:
+            anchor, others, anchor_is_first = first_history[-1], second_history, True
+        else:
+            anchor, others, anchor_is_first = second_history[-1], first_history, False
+        closest = min(others, key=lambda item: abs(item[2] - anchor[2]))
+        pair = (anchor, closest) if anchor_is_first else (closest, anchor)
+        if (pair[0][1], pair[1][1]) == self.__last_sequences:
+            return None
+        return pair
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {'pairs': self.pairs, 'dropped': self.dropped, 'repeated': self.repeated}
+        stats.update(self.skew_ms.percentiles())
+        return stats
+
+    def __maybe_log(self) -> None:
+        if self.__next_log_time is None:
+            return
+        now = time.monotonic()
+        if now < self.__next_log_time:
+            return
+        self.__next_log_time = now + self.log_interval
+        stats = self.get_stats()
+        logger.info(f"camera pairs: {stats['pairs']} paired, {stats['dropped']} over {self.max_skew * 1000:.0f} ms, "
+                    f"{stats['repeated']} ticks without a new pair, "
+                    f"skew ms p50/p95/p99 {stats['p50']:.1f}/{stats['p95']:.1f}/{stats['p99']:.1f}")
+
+    def shutdown(self):
+        release_frame((self.pair[0], self.pair[1]))
+
+
+class Frame_Age_Probe(object):
+    """
+    Records the age of the frame a consumer has just processed in a
+    parts.latency.Frame_Age_Monitor. Add it right after the consumer, with the
+    consumer's run_condition and the camera's frame_time as input.
+    """
+
+    def __init__(self, monitor, consumer: str):
+        self.monitor = monitor
+        self.consumer = consumer
+
+    def run(self, frame_time: float) -> float:
+        """
+        :return: frame age in ms, None before the first frame
+        """
+        return self.monitor.record(self.consumer, frame_time)
+
+
+class Frame_Rate_Logger(object):
+    """
+    Logs the rate of new frames per camera instead of the vehicle loop rate.
+    `captured` counts every sequence advance (the real capture rate),
+    `seen` counts how many distinct frames the vehicle loop actually got.
+    """
+
+    def __init__(self, camera_names: List[str], debug_interval: float = 10):
+        self.camera_names = list(camera_names)
+        self.debug_interval = debug_interval
+
+        self.fps = [0.] * len(self.camera_names)
+        self.loop_rate = 0.
+
+        self.__start_time = None
+        self.__start_sequences = None
+        self.__last_sequences = [None] * len(self.camera_names)
+        self.__seen = [0] * len(self.camera_names)
+        self.__loops = 0
+
+    def run(self, *frame_sequences) -> Tuple[List[float], float]:
+        """
+        :param frame_sequences: frame sequence number of each camera, in `camera_names` order
+        :return: (new frames per second of each camera, loop rate)
+        """
+        now = time.monotonic()
+        sequences = [sequence or 0 for sequence in frame_sequences]
+        if self.__start_time is None:
+            self.__start_time, self.__start_sequences = now, sequences
+            self.__last_sequences = list(sequences)
+            return self.fps, self.loop_rate
+
+        self.__loops += 1
+        for i, sequence in enumerate(sequences):
+            if sequence != self.__last_sequences[i]:
+                self.__seen[i] += 1
+                self.__last_sequences[i] = sequence
+
+        elapsed = now - self.__start_time
+        if elapsed >= self.debug_interval:
+            self.fps = [(sequence - start) / elapsed for sequence, start in zip(sequences, self.__start_sequences)]
+            self.loop_rate = self.__loops / elapsed
+            logger.info('new frames/s: ' +
+                        ', '.join(f'{name} captured {fps:.1f} seen {seen / elapsed:.1f}'
+                                  for name, fps, seen in zip(self.camera_names, self.fps, self.__seen)) +
+                        f' (loop {self.loop_rate:.1f} Hz)')
+            self.__start_time, self.__start_sequences = now, sequences
+            self.__seen = [0] * len(self.camera_names)
+            self.__loops = 0
+        return self.fps, self.loop_rate
 
 
 class CV_Image_Display(object):
@@ -174,7 +1455,7 @@ if __name__=='__main__':
     # time.sleep(1)
 
 
-    robot.add(main_cam, outputs=['camera/main_cam'], threaded=True)
+    robot.add(main_cam, outputs=['camera/main_cam', 'camera/main_cam_seq', 'camera/main_cam_time'], threaded=True)
 
     display = CV_Image_Display()
     robot.add(display, inputs=['camera/main_cam'])
@@ -0,0 +1,128 @@
+"""
+Fixed-size pool of preallocated frame buffers with reference counting.
+
+Cameras capture into pool buffers instead of allocating a new array per frame.
+Every holder of a frame (camera, vehicle loop, detector, web streaming) retains
+it and releases it when done; a buffer goes back to the pool only when its last
+holder releases it, so memory use is bounded by the pool size.
+
+retain_frame / release_frame accept any array: for arrays that do not belong to
+a pool they do nothing, so consumers work the same with or without a pool.
+A tuple of frames (one per branch of a tee camera) is retained and released
+frame by frame, a view of a pool buffer (e.g. the luma plane of an I420
+capture) counts as the buffer itself.
+"""
+
+import threading
+import logging
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+# id(buffer) -> pool, for retain_frame / release_frame.
+# Pool buffers are never freed, so their ids can not be reused by other objects.
+_pools_by_buffer_id = {}
+
+
+class Frame_Buffer_Pool(object):
+    """
+    Preallocated frames of one shape and dtype.
+    acquire() hands out a free buffer with a reference count of 1.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.uint8, size: int = 8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+
+        self.buffers = [np.empty(self.shape, dtype=self.dtype) for _ in range(size)]
+        self.__index = {id(buffer): i for i, buffer in enumerate(self.buffers)}
+        self.__refcounts = [0] * size
+        self.__free = deque(range(size))
+        self.__condition = threading.Condition()
+
+        # acquire() calls that found no free buffer
+        self.exhausted = 0
+
+        for buffer in self.buffers:
+            _pools_by_buffer_id[id(buffer)] = self
+
+    @property
+    def free_count(self) -> int:
+        return len(self.__free)
+
+    def acquire(self, timeout: float = 0.) -> np.ndarray or None:
+        """
+        :param timeout: seconds to wait for a buffer to be released, 0 - do not wait
+        :return: a free buffer owned by the caller, or None if the pool stays exhausted
+        """
+        with self.__condition:
+            if not self.__free:
+                self.exhausted += 1
+                if not timeout or not self.__condition.wait_for(lambda: self.__free, timeout=timeout):
+                    return None
+            i = self.__free.popleft()
+            self.__refcounts[i] = 1
+            return self.buffers[i]
+
+    def retain(self, buffer: np.ndarray) -> bool:
+        """
+        :return: True if the buffer belongs to the pool and is in use
+        """
+        i = self.__index.get(id(buffer))
+        if i is None:
+            return False
+        with self.__condition:
+            if self.__refcounts[i] == 0:
+                logger.warning('retain of a released frame buffer')
+                return False
+            self.__refcounts[i] += 1
+        return True
+
+    def release(self, buffer: np.ndarray) -> bool:
+        """
+        :return: True if the buffer belongs to the pool
+        """
+        i = self.__index.get(id(buffer))
+        if i is None:
+            return False
+        with self.__condition:
+            if self.__refcounts[i] == 0:
+                logger.warning('release of a released frame buffer')
+                return True
+            self.__refcounts[i] -= 1
+            if self.__refcounts[i] == 0:
+                self.__free.append(i)
+                self.__condition.notify()
+        return True
+
+
+def _pool_buffer(frame):
+    pool = _pools_by_buffer_id.get(id(frame))
+    if pool is None and isinstance(frame, np.ndarray) and frame.base is not None:
+        frame = frame.base
+        pool = _pools_by_buffer_id.get(id(frame))
+    return pool, frame
+
+
+def retain_frame(frame) -> bool:
+    if isinstance(frame, tuple):
+        return any([retain_frame(f) for f in frame])
+    pool, buffer = _pool_buffer(frame)
+    if pool is None:
+        return False
+    return pool.retain(buffer)
+
+
+def release_frame(frame) -> bool:
+    if isinstance(frame, tuple):
+        return any([release_frame(f) for f in frame])
+    pool, buffer = _pool_buffer(frame)
+    if pool is None:
+        return False
+    return pool.release(buffer)
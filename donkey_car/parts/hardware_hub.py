@@ -0,0 +1,291 @@
+"""
+Несколько контроллеров AutoBot на одном потоке ввода-вывода.
+
+RobotHardwareHub открывает N портов и обслуживает чтение и запись всех из них одним
+потоком на `selectors`, вместо пары потоков на каждый RobotHardware. Для каждого порта
+выдается свой Hub_RobotHardware со своим состоянием сенсоров и устройств (AutoBot_Protocol),
+который можно передать в Robot:
+	hub = RobotHardwareHub(devices=['/dev/ttyUSB0', '/dev/ttyUSB1'])
+	robot = hub.get_robot('/dev/ttyUSB1')
+	robot.wheels_set(left=20, right=20)
+"""
+
+import os
+import time
+import logging
+import selectors
+import threading
+from typing import List, Dict
+
+import serial
+
+from parts.actuators import AutoBot_Protocol, Command_Slots, Robot
+from parts.telemetry_parser import Line_Framer
+
+
+logger = logging.getLogger(__name__)
+
+
+class Hub_RobotHardware(AutoBot_Protocol):
+	"""
+	- Один контроллер внутри RobotHardwareHub.
+	- Интерфейс как у RobotHardware: set_device_value, get_sensor_value, снимки состояния,
+	  flush_commands и счетчики записи. Собственных потоков нет, ввод-вывод выполняет хаб.
+	- После отключения платы (конец файла или ошибка порта) connected = False, команды не отправляются.
+	"""
+
+	def __init__(self,
+				 hub: 'RobotHardwareHub',
+				 device: str,
+				 baudrate: int = 115200,
+				 write_interval: float = 0.01,
+				 start_delay: float = 0.8,
+				 ):
+		"""
+		:param hub:            Хаб, который обслуживает порт.
+		:param device:         Порт контроллера.
+		:param baudrate:       Скорость порта.
+		:param write_interval: Минимальная пауза между записями команд в этот порт, сек.
+		:param start_delay:    Пауза перед первой записью команд, пока контроллер загружается, сек.
+		"""
+		AutoBot_Protocol.__init__(self)
+		self.hub = hub
+		self.device = device
+		self.baudrate = baudrate
+		self.write_interval = write_interval
+		self.device_names = ('WHEELS', 'FLASHLIGHT', 'UV_FLASHLIGHT', 'CAMERA_SERVO')
+
+		# timeout=0 - дескриптор неблокирующий, читаем и пишем только по готовности
+		self.serial = serial.Serial(self.device, baudrate=self.baudrate, timeout=0)
+		self.fd = self.serial.fileno()
+		os.set_blocking(self.fd, False)
+		self.line_framer = Line_Framer()
+
+		self.slots = Command_Slots(device_names=self.device_names)
+		self.out_buffer = bytearray()
+		self.next_write_time = time.monotonic() + start_delay
+		self.connected = True
+
+	def submit_command(self, device_name: str, command: str) -> None:
+		"""
+		Поставить команду в ячейку устройства. Устаревшая неотправленная команда заменяется.
+		:param device_name: Имя устройства.
+		:param command:     Команда для serial.
+		:return:            None.
+		"""
+		self.slots.submit(device_name=device_name, command=command)
+		self.hub.wakeup()
+
+	def flush_commands(self, timeout: float = 0.5) -> bool:
+		"""
+		Дождаться записи в порт всех поставленных команд.
+		:param timeout: Максимальное время ожидания, сек.
+		:return:        True, если все команды отправлены. False и после отключения платы.
+		"""
+		return self.slots.wait_idle(timeout=timeout)
+
+	def get_writer_counters(self) -> Dict[str, int]:
+		"""
+		Получить счетчики записи: отправленные, замененные до отправки и объединенные команды.
+		:return: Словарь со счетчиками.
+		"""
+		return self.slots.get_counters()
+
+	def start(self):
+		pass
+
+	def stop(self):
+		"""
+		Порты закрываются вместе с хабом (смотри RobotHardwareHub.stop).
+		"""
+		pass
+
+
+class RobotHardwareHub(threading.Thread):
+	"""
+	- Один поток `selectors` на чтение и запись всех портов.
+	- Команды копятся в ячейках устройств Hub_RobotHardware и уходят одной записью на порт
+	  не чаще `write_interval`; недописанный остаток дописывается по готовности порта на запись.
+	"""
+
+	def __init__(self,
+				 devices: List[str],
+				 baudrate: int = 115200,
+				 write_interval: float = 0.01,
+				 start_delay: float = 0.8,
+				 autostart: bool = True,
+				 daemon: bool = True,
+				 ):
+		"""
+		:param devices:        Порты контроллеров.
+		:param baudrate:       Скорость портов.
+		:param write_interval: Минимальная пауза между записями команд в один порт, сек.
+		:param start_delay:    Пауза перед первой записью команд, пока контроллеры загружаются, сек.
+		:param autostart:      Сразу запустить поток.
+		:param daemon:         Поток - демон.
+		"""
+		threading.Thread.__init__(self, daemon=daemon)
+		self.selector = selectors.DefaultSelector()
+
+		# self-pipe: submit_command из других потоков будит select
+		self.__wakeup_read_fd, self.__wakeup_write_fd = os.pipe()
+		os.set_blocking(self.__wakeup_read_fd, False)
+		os.set_blocking(self.__wakeup_write_fd, False)
+		self.selector.register(self.__wakeup_read_fd, selectors.EVENT_READ, None)
+
+		self.hardware = {}
+		for device in devices:
+			hardware = Hub_RobotHardware(hub=self,
+										 device=device,
+										 baudrate=baudrate,
+										 write_interval=write_interval,
+										 start_delay=start_delay)
+			self.hardware[device] = hardware
+			self.selector.register(hardware.fd, selectors.EVENT_READ, hardware)
+
+		self.is_active = True
+		if autostart:
+			self.start()
+
+	def get_hardware(self, device: str) -> Hub_RobotHardware:
+		"""
+		:param device: Порт контроллера.
+		:return:       Подключение к контроллеру на этом порту.
+		"""
+		return self.hardware[device]
+
+	def get_robot(self, device: str) -> Robot:
+		"""
+		:param device: Порт контроллера.
+		:return:       Robot для контроллера на этом порту.
+		"""
+		return Robot(hardware=self.hardware[device])
+
+	def wakeup(self) -> None:
+		"""
+		Разбудить поток хаба.
+		:return: None.
+		"""
+		try:
+			os.write(self.__wakeup_write_fd, b'\0')
+		except BlockingIOError:
+			# канал полон - поток и так проснется
+			pass
+
+	def stop(self):
+		"""
+		Остановить поток хаба и закрыть порты.
+		:return:
+		"""
+		self.is_active = False
+		self.wakeup()
+		if self.is_alive() and threading.current_thread() is not self:
+			self.join(timeout=1.)
+		for hardware in self.hardware.values():
+			hardware.serial.close()
+
+	def run(self):
+		"""
+		Цикл ввода-вывода: чтение готовых портов, дозапись остатков и запись новых команд.
+		:return:
+		"""
+		try:
+			while self.is_active:
+				for key, events in self.selector.select(timeout=self.__select_timeout()):
+					hardware = key.data
+					if hardware is None:
+						self.__drain_wakeup()
+						continue
+					if events & selectors.EVENT_READ:
+						self.__read(hardware)
+					if events & selectors.EVENT_WRITE:
+						self.__write(hardware)
+				self.__write_pending(now=time.monotonic())
+		finally:
+			self.selector.close()
+			os.close(self.__wakeup_read_fd)
+			os.close(self.__wakeup_write_fd)
+
+	def __select_timeout(self) -> float:
+		now = time.monotonic()
+		timeout = 0.1
+		for hardware in self.hardware.values():
+			if hardware.connected and hardware.slots.has_pending and not hardware.out_buffer:
+				timeout = min(timeout, max(0., hardware.next_write_time - now))
+		return timeout
+
+	def __drain_wakeup(self) -> None:
+		try:
+			while os.read(self.__wakeup_read_fd, 4096):
+				pass
+		except BlockingIOError:
+			pass
+
+	def __disconnect(self, hardware: Hub_RobotHardware, reason: str) -> None:
+		"""
+		Снять отключенную плату с select, иначе готовый к чтению дескриптор крутит цикл вхолостую.
+		"""
+		if not hardware.connected:
+			return
+		hardware.connected = False
+		hardware.out_buffer.clear()
+		try:
+			self.selector.unregister(hardware.fd)
+		except (KeyError, ValueError):
+			pass
+		logger.warning(f"[RobotHardwareHub]: {hardware.device} disconnected: {reason}")
+
+	def __read(self, hardware: Hub_RobotHardware) -> None:
+		try:
+			data = os.read(hardware.fd, 4096)
+		except BlockingIOError:
+			return
+		except OSError as e:
+			self.__disconnect(hardware, reason=f'read failed: {e}')
+			return
+		if not data:
+			# hangup: порт готов к чтению, но данных больше не будет
+			self.__disconnect(hardware, reason='end of file')
+			return
+		for line in hardware.line_framer.feed(data):
+			hardware.parse_message(message=line)
+
+	def __write_pending(self, now: float) -> None:
+		for hardware in self.hardware.values():
+			if not hardware.connected or hardware.out_buffer or now < hardware.next_write_time:
+				continue
+			commands, submit_times = hardware.slots.take()
+			if not commands:
+				continue
+
+			hardware.out_buffer += ''.join(commands).encode('utf-8')
+			hardware.next_write_time = now + hardware.write_interval
+			hardware.slots.count_write(commands)
+			if hardware.latency_monitor is not None:
+				payload_size = len(hardware.out_buffer)
+				self.__write(hardware)
+				hardware.latency_monitor.record_write(start_time=now,
+													  end_time=time.monotonic(),
+													  payload_size=payload_size,
+													  submit_times=submit_times)
+			else:
+				self.__write(hardware)
+
+	def __write(self, hardware: Hub_RobotHardware) -> None:
+		if not hardware.connected:
+			return
+		try:
+			written = os.write(hardware.fd, hardware.out_buffer)
+		except BlockingIOError:
+			written = 0
+		except OSError as e:
+			self.__disconnect(hardware, reason=f'write failed: {e}')
+			return
+		del hardware.out_buffer[:written]
+
+		if hardware.out_buffer:
+			self.selector.modify(hardware.fd, selectors.EVENT_READ | selectors.EVENT_WRITE, hardware)
+			return
+		if self.selector.get_key(hardware.fd).events & selectors.EVENT_WRITE:
+			self.selector.modify(hardware.fd, selectors.EVENT_READ, hardware)
+		hardware.slots.write_done()
@@ -0,0 +1,105 @@
+"""
+Состояние сенсоров и устройств контроллера AutoBot в виде неизменяемых снимков.
+
+Писатель (поток serial или вызов set_device_value) собирает новый снимок с увеличенным
+номером версии и публикует его одной заменой ссылки. Читатели получают согласованный
+снимок за O(1) без блокировок и могут спросить, появились ли данные новее версии N.
+"""
+
+import threading
+from collections import namedtuple
+from typing import Dict, Any
+
+
+# Состояние одного сенсора или устройства. Время - time.monotonic().
+Value_State = namedtuple('Value_State', ['value', 'update_time', 'last_change_time'])
+
+# version  - номер снимка, увеличивается при каждой публикации
+# sensors  - имя сенсора -> Value_State
+# devices  - имя устройства -> Value_State
+Hardware_Snapshot = namedtuple('Hardware_Snapshot', ['version', 'sensors', 'devices'])
+
+
+class Hardware_State(object):
+	"""
+	- Хранит последний опубликованный Hardware_Snapshot.
+	- Писатели сериализуются блокировкой, читатели блокировок не берут.
+	- Словари внутри снимка после публикации не изменяются.
+	"""
+
+	def __init__(self,
+				 sensors: Dict[str, Any],
+				 devices: Dict[str, Any],
+				 init_time: float = 0.):
+		"""
+		:param sensors:   Имя сенсора -> начальное значение.
+		:param devices:   Имя устройства -> начальное значение.
+		:param init_time: Время начальных значений.
+		"""
+		self.__write_lock = threading.Lock()
+		self.__snapshot = Hardware_Snapshot(
+			version=0,
+			sensors={name: Value_State(value, init_time, init_time) for name, value in sensors.items()},
+			devices={name: Value_State(value, init_time, init_time) for name, value in devices.items()},
+		)
+
+	@property
+	def snapshot(self) -> Hardware_Snapshot:
+		"""
+		Последний опубликованный снимок.
+		"""
+		return self.__snapshot
+
+	@property
+	def version(self) -> int:
+		"""
+		Номер последнего опубликованного снимка.
+		"""
+		return self.__snapshot.version
+
+	def changed_since(self, version: int) -> Hardware_Snapshot or None:
+		"""
+		Получить снимок, если он новее версии `version`.
+		:param version: Номер снимка, который уже обработан читателем.
+		:return:        Новый снимок или None, если новых данных нет.
+		"""
+		snapshot = self.__snapshot
+		if snapshot.version == version:
+			return None
+		return snapshot
+
+	def publish_sensor(self, name: str, value: Any, update_time: float) -> Hardware_Snapshot:
+		"""
+		Опубликовать новое значение сенсора.
+		:param name:        Имя сенсора.
+		:param value:       Значение сенсора. Не должно изменяться после публикации.
+		:param update_time: Время получения значения.
+		:return:            Опубликованный снимок.
+		"""
+		with self.__write_lock:
+			snapshot = self.__snapshot
+			sensors = dict(snapshot.sensors)
+			sensors[name] = self.__next_state(sensors[name], value, update_time)
+			self.__snapshot = Hardware_Snapshot(snapshot.version + 1, sensors, snapshot.devices)
+			return self.__snapshot
+
+	def publish_device(self, name: str, value: Any, update_time: float) -> Hardware_Snapshot:
+		"""
+		Опубликовать новое значение устройства.
+		:param name:        Имя устройства.
+		:param value:       Значение устройства. Не должно изменяться после публикации.
+		:param update_time: Время установки значения.
+		:return:            Опубликованный снимок.
+		"""
+		with self.__write_lock:
+			snapshot = self.__snapshot
+			devices = dict(snapshot.devices)
+			devices[name] = self.__next_state(devices[name], value, update_time)
+			self.__snapshot = Hardware_Snapshot(snapshot.version + 1, snapshot.sensors, devices)
+			return self.__snapshot
+
+	@staticmethod
+	def __next_state(state: Value_State, value: Any, update_time: float) -> Value_State:
+		if value != state.value:
+			return Value_State(value, update_time, update_time)
+		return Value_State(value, update_time, state.last_change_time)
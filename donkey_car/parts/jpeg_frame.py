@@ -0,0 +1,101 @@
+"""
+Compressed camera frames.
+
+A USB camera in MJPEG mode publishes Jpeg_Frame objects instead of arrays:
+the JPEG bytes go to the MJPEG web stream and to the tub as they came from
+the camera, and a frame is decoded only when a consumer asks for the array
+(Jpeg_Decoder part or Jpeg_Frame.array()).
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+JPEG_START = b'\xff\xd8'
+
+
+class Jpeg_Frame(object):
+    """
+    JPEG file content as captured. array() decodes it on first use and caches
+    the result, so consumers on several threads decode a frame at most once.
+    """
+
+    def __init__(self, jpeg: bytes, rgb: bool = True):
+        """
+        :param rgb: array() returns RGB like the other cameras, False - BGR
+        """
+        self.jpeg = jpeg
+        self.rgb = rgb
+        self.__array = None
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.jpeg)
+
+    def array(self) -> np.ndarray or None:
+        with self.__lock:
+            if self.__array is None:
+                frame = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is not None and self.rgb:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+                self.__array = frame
+            return self.__array
+
+
+def is_jpeg(data: np.ndarray) -> bool:
+    """
+    True for a raw capture buffer (1 x N bytes) holding a JPEG image.
+    """
+    return data is not None and data.ndim <= 2 and data.dtype == np.uint8 and \
+        data.size > 2 and data.reshape(-1)[:2].tobytes() == JPEG_START
+
+
+class Jpeg_Decoder(object):
+    """
+    Part that turns a Jpeg_Frame into an array for consumers that need one;
+    give it their run_condition so frames nobody uses are not decoded.
+    Arrays pass through.
+    """
+
+    def run(self, frame):
+        if isinstance(frame, Jpeg_Frame):
+            return frame.array()
+        return frame
+
+
+class Jpeg_Tub_Image(object):
+    """
+    Writes the JPEG bytes of a frame into the images of a tub under the name
+    the tub writer would give an image, and returns that name for a 'str'
+    record field; tub readers load it like any image record. Add it right
+    before the TubWriter with the same run_condition so the record index
+    matches. Arrays are encoded here as the tub writer would do.
+    """
+
+    def __init__(self, tub, key: str = 'cam/image_array'):
+        """
+        :param tub: donkeycar.parts.tub_v2.Tub of the TubWriter
+        :param key: record key of the image
+        """
+        self.tub = tub
+        self.key = key
+
+    def run(self, frame) -> str or None:
+        from donkeycar.parts.tub_v2 import Tub
+
+        if frame is None:
+            return None
+        if isinstance(frame, Jpeg_Frame):
+            jpeg = frame.jpeg
+        else:
+            encoded, jpeg = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            if not encoded:
+                return None
+            jpeg = jpeg.tobytes()
+        name = Tub._image_file_name(self.tub.manifest.current_index, self.key)
+        with open(os.path.join(self.tub.images_base_path, name), 'wb') as f:
+            f.write(jpeg)
+        return name
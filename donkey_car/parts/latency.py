@@ -0,0 +1,254 @@
+"""
+Скользящие перцентили задержек: обмен с контроллером AutoBot и возраст кадров камер.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class Rolling_Percentiles(object):
+	"""
+	- Последние `window` значений в кольцевом буфере.
+	- Перцентили считаются по запросу, добавление значения - O(1) без выделения памяти.
+	"""
+
+	def __init__(self, window: int = 1024):
+		self.window = window
+		self.__values = np.zeros(window, dtype=np.float64)
+		self.__count = 0
+
+	def add(self, value: float) -> None:
+		self.__values[self.__count % self.window] = value
+		self.__count += 1
+
+	@property
+	def count(self) -> int:
+		"""
+		Сколько значений добавлено за все время.
+		"""
+		return self.__count
+
+	def percentiles(self, q: Tuple[float, ...] = (50, 95, 99)) -> Dict[str, float]:
+		"""
+		Получить перцентили по значениям в окне.
+		:param q: Перцентили.
+		:return:  {'p50': ..., 'p95': ..., 'p99': ..., 'count': ...}. Без значений перцентили равны nan.
+		"""
+		values = self.__values[:min(self.__count, self.window)]
+		result = {'count': self.__count}
+		if len(values):
+			for _q, _value in zip(q, np.percentile(values, q)):
+				result[f'p{_q:g}'] = float(_value)
+		else:
+			result.update({f'p{_q:g}': float('nan') for _q in q})
+		return result
+
+
+class Serial_Latency_Monitor(object):
+	"""
+	- Инструментирование обмена с контроллером.
+	- Записи команд: длительность serial.write, задержка в очереди от постановки команды до записи
+	  и расчетное время передачи по линии при заданной скорости порта.
+	- Телеметрия: интервал между строками по каждому префиксу и возраст значения в момент чтения частью Vehicle.
+	- Перцентили доступны через get_stats() и раз в `log_interval` секунд пишутся в лог одной строкой.
+	"""
+
+	def __init__(self,
+				 baudrate: int = 115200,
+				 window: int = 1024,
+				 log_interval: float = 10.):
+		"""
+		:param baudrate:     Скорость порта, для расчетного времени передачи.
+		:param window:       Размер окна перцентилей.
+		:param log_interval: Период строки в логе, сек. None - не писать в лог.
+		"""
+		self.baudrate = baudrate
+		self.window = window
+		self.log_interval = log_interval
+
+		self.write_ms = Rolling_Percentiles(window)
+		self.queue_ms = Rolling_Percentiles(window)
+		self.wire_ms = Rolling_Percentiles(window)
+		self.interarrival_ms = {}
+		self.read_age_ms = {}
+
+		self.last_write_time = None
+		self.last_line_times = {}
+
+		self.__histograms_lock = threading.Lock()
+		self.__next_log_time = time.monotonic() + log_interval if log_interval else None
+
+	def __histogram(self, histograms: Dict[str, Rolling_Percentiles], name: str) -> Rolling_Percentiles:
+		histogram = histograms.get(name)
+		if histogram is None:
+			with self.__histograms_lock:
+				histogram = histograms.setdefault(name, Rolling_Percentiles(self.window))
+		return histogram
+
+	def record_write(self, start_time: float, end_time: float, payload_size: int, submit_times: list) -> None:
+		"""
+		Учесть одну запись в порт.
+		:param start_time:   time.monotonic() перед serial.write.
+		:param end_time:     time.monotonic() после serial.write.
+		:param payload_size: Размер записи, байт.
+		:param submit_times: Время постановки каждой команды из записи.
+		:return:             None.
+		"""
+		self.last_write_time = end_time
+		self.write_ms.add((end_time - start_time) * 1000)
+		# 8N1: 10 бит на байт
+		self.wire_ms.add(payload_size * 10 / self.baudrate * 1000)
+		for submit_time in submit_times:
+			self.queue_ms.add((start_time - submit_time) * 1000)
+		self.maybe_log(now=end_time)
+
+	def record_line(self, sensor_name: str, line_time: float) -> None:
+		"""
+		Учесть одну разобранную строку телеметрии.
+		:param sensor_name: Имя сенсора.
+		:param line_time:   time.monotonic() разбора строки.
+		:return:            None.
+		"""
+		last_time = self.last_line_times.get(sensor_name)
+		self.last_line_times[sensor_name] = line_time
+		if last_time is not None:
+			self.__histogram(self.interarrival_ms, sensor_name).add((line_time - last_time) * 1000)
+		self.maybe_log(now=line_time)
+
+	def record_read_age(self, sensor_name: str, age_ms: float) -> None:
+		"""
+		Учесть возраст значения сенсора в момент, когда его прочитала часть Vehicle.
+		:param sensor_name: Имя сенсора.
+		:param age_ms:      Возраст значения, мс.
+		:return:            None.
+		"""
+		self.__histogram(self.read_age_ms, sensor_name).add(age_ms)
+
+	def get_stats(self) -> Dict[str, Dict]:
+		"""
+		Получить перцентили всех задержек.
+		:return: {'write_ms': {...}, 'queue_ms': {...}, 'wire_ms': {...},
+				  'interarrival_ms': {sensor: {...}}, 'read_age_ms': {sensor: {...}}}.
+		"""
+		return {
+			'write_ms': self.write_ms.percentiles(),
+			'queue_ms': self.queue_ms.percentiles(),
+			'wire_ms': self.wire_ms.percentiles(),
+			'interarrival_ms': {name: histogram.percentiles() for name, histogram in list(self.interarrival_ms.items())},
+			'read_age_ms': {name: histogram.percentiles() for name, histogram in list(self.read_age_ms.items())},
+		}
+
+	def format_stats(self) -> str:
+		"""
+		Одна строка с перцентилями p50/p95/p99 в мс.
+		"""
+		def fmt(stats: Dict[str, float]) -> str:
+			return f"{stats['p50']:.2f}/{stats['p95']:.2f}/{stats['p99']:.2f}"
+
+		stats = self.get_stats()
+		parts = [f"write {fmt(stats['write_ms'])}",
+				 f"queue {fmt(stats['queue_ms'])}",
+				 f"wire {fmt(stats['wire_ms'])}"]
+		parts += [f"{name} gap {fmt(_stats)}" for name, _stats in sorted(stats['interarrival_ms'].items())]
+		parts += [f"{name} age {fmt(_stats)}" for name, _stats in sorted(stats['read_age_ms'].items())]
+		return '[serial latency ms p50/p95/p99]: ' + ', '.join(parts)
+
+	def maybe_log(self, now: float = None) -> None:
+		"""
+		Написать строку со статистикой в лог, если прошел `log_interval`.
+		:param now: time.monotonic(), если уже известно.
+		:return:    None.
+		"""
+		if self.__next_log_time is None:
+			return
+		if now is None:
+			now = time.monotonic()
+		if now < self.__next_log_time:
+			return
+		self.__next_log_time = now + self.log_interval
+		logger.info(self.format_stats())
+
+
+class Frame_Age_Monitor(object):
+	"""
+	- Возраст кадра у каждого потребителя: от захвата кадра камерой (frame_time камеры,
+	  time.monotonic()) до момента, когда потребитель его обработал.
+	- Потребители (детектор ArUco, пилот, запись в tub, MJPEG-поток) пишут возраст под своим именем,
+	  по разнице перцентилей видно, какой этап добавляет задержку.
+	- Перцентили доступны через get_stats() и раз в `log_interval` секунд пишутся в лог одной строкой.
+	"""
+
+	def __init__(self,
+				 window: int = 1024,
+				 log_interval: float = 10.):
+		"""
+		:param window:       Размер окна перцентилей.
+		:param log_interval: Период строки в логе, сек. None - не писать в лог.
+		"""
+		self.window = window
+		self.log_interval = log_interval
+		self.age_ms = {}
+
+		self.__lock = threading.Lock()
+		self.__next_log_time = time.monotonic() + log_interval if log_interval else None
+
+	def record(self, consumer: str, frame_time: float, now: float = None) -> float or None:
+		"""
+		Учесть обработку кадра потребителем.
+		:param consumer:   Имя потребителя.
+		:param frame_time: Время захвата кадра, time.monotonic(). None - кадра еще нет.
+		:param now:        time.monotonic(), если уже известно.
+		:return:           Возраст кадра, мс, или None.
+		"""
+		if frame_time is None:
+			return None
+		if now is None:
+			now = time.monotonic()
+		age_ms = (now - frame_time) * 1000
+		# потребители пишут из потоков Vehicle и веб-сервера
+		with self.__lock:
+			histogram = self.age_ms.get(consumer)
+			if histogram is None:
+				histogram = self.age_ms[consumer] = Rolling_Percentiles(self.window)
+			histogram.add(age_ms)
+		self.maybe_log(now=now)
+		return age_ms
+
+	def get_stats(self) -> Dict[str, Dict[str, float]]:
+		"""
+		Получить перцентили возраста кадров.
+		:return: {consumer: {'p50': ..., 'p95': ..., 'p99': ..., 'count': ...}}.
+		"""
+		with self.__lock:
+			return {name: histogram.percentiles() for name, histogram in self.age_ms.items()}
+
+	def format_stats(self) -> str:
+		"""
+		Одна строка с перцентилями p50/p95/p99 в мс.
+		"""
+		stats = self.get_stats()
+		return '[frame age ms p50/p95/p99]: ' + \
+			   ', '.join(f"{name} {_stats['p50']:.1f}/{_stats['p95']:.1f}/{_stats['p99']:.1f}"
+						 for name, _stats in sorted(stats.items()))
+
+	def maybe_log(self, now: float = None) -> None:
+		"""
+		Написать строку со статистикой в лог, если прошел `log_interval`.
+		:param now: time.monotonic(), если уже известно.
+		:return:    None.
+		"""
+		if self.__next_log_time is None:
+			return
+		if now is None:
+			now = time.monotonic()
+		if now < self.__next_log_time:
+			return
+		self.__next_log_time = now + self.log_interval
+		logger.info(self.format_stats())
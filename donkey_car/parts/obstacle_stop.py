@@ -0,0 +1,93 @@
+"""
+Аварийная остановка перед препятствием по УЗ сенсорам.
+
+Проверка выполняется в потоке чтения serial на каждой строке `SU`, поэтому реакция
+не ждет следующего цикла Vehicle: команда колесам уходит сразу после разбора строки.
+"""
+
+import logging
+from typing import Tuple, Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+class Obstacle_Stop(object):
+	"""
+	- Срабатывает, когда хотя бы один УЗ сенсор показывает меньше своего порога.
+	- Пока сработка активна, движение колес вперед ограничивается `max_forward`, назад - не ограничивается.
+	- Сбрасывается после `release_count` строк подряд, в которых все сенсоры дальше порога на `release_margin`.
+	"""
+
+	def __init__(self,
+				 thresholds: Tuple[int or None, ...],
+				 max_forward: int = 0,
+				 release_margin: int = 5,
+				 release_count: int = 3,
+				 ):
+		"""
+		:param thresholds:     Пороги УЗ сенсоров 0-4 в единицах телеметрии. None - сенсор не проверяется.
+		:param max_forward:    Максимальная мощность колеса вперед во время сработки, от 0 до 100.
+		:param release_margin: Запас над порогом для сброса сработки.
+		:param release_count:  Сколько строк подряд без препятствия нужно для сброса.
+		"""
+		assert len(thresholds) == 5, Exception(f"Bad value for argument `thresholds`. Must be 5 values for US sensors 0-4.\n"
+											   f"GOT:\t{thresholds}")
+		assert 0 <= max_forward <= 100, Exception(f"Bad value for argument `max_forward`. Must be int from 0 to 100.\n"
+												  f"GOT:\t{max_forward}")
+		self.thresholds = tuple(thresholds)
+		self.max_forward = max_forward
+		self.release_margin = release_margin
+		self.release_count = release_count
+
+		self.is_triggered = False
+		# time.monotonic() последней сработки и значения сенсоров, по которым она произошла
+		self.trigger_time = None
+		self.trigger_values = None
+		self.triggers = 0
+
+		self.__clear_count = 0
+
+	def update(self, us_values: Tuple[int, ...], update_time: float) -> bool:
+		"""
+		Проверить новые значения УЗ сенсоров.
+		:param us_values:   Значения УЗ сенсоров 0-4.
+		:param update_time: time.monotonic() получения значений.
+		:return:            True, если сработка произошла на этих значениях.
+		"""
+		is_blocked = False
+		is_clear = True
+		for value, threshold in zip(us_values, self.thresholds):
+			if threshold is None or value is None:
+				continue
+			if value < threshold:
+				is_blocked = True
+			if value < threshold + self.release_margin:
+				is_clear = False
+
+		if is_blocked:
+			self.__clear_count = 0
+			if not self.is_triggered:
+				self.trigger_time = update_time
+				self.trigger_values = tuple(us_values)
+				self.triggers += 1
+				self.is_triggered = True
+				return True
+			return False
+
+		if self.is_triggered:
+			self.__clear_count = self.__clear_count + 1 if is_clear else 0
+			if self.__clear_count >= self.release_count:
+				self.is_triggered = False
+				self.__clear_count = 0
+				logger.info(f"[Obstacle_Stop]: released, US: {tuple(us_values)}")
+		return False
+
+	def clamp_wheels(self, value: Dict[str, int]) -> Dict[str, int]:
+		"""
+		Ограничить мощность колес вперед.
+		:param value: {'left': int, 'right': int}.
+		:return:      Новое значение колес.
+		"""
+		return {'left': min(value['left'], self.max_forward),
+				'right': min(value['right'], self.max_forward)}
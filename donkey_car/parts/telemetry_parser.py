@@ -0,0 +1,143 @@
+"""
+Разбор телеметрии контроллера AutoBot прямо из байтов, принятых с serial.
+
+Формат строк:
+	SI014012012013013E  - 5 ИК сенсоров, по 3 цифры на значение
+	SU175065023048047E  - 5 УЗ сенсоров, по 3 цифры на значение
+	SA87E               - аккумулятор
+	SF<tag>E            - RFID метка
+Каждая строка завершается переводом строки.
+Line_Framer выделяет строки из данных, прочитанных с serial крупными блоками.
+"""
+
+import struct
+from typing import Tuple, Any, Callable, Dict, List
+
+
+MESSAGE_END = ord('E')
+LINE_END = b'\n'
+
+# 5 полей по 3 цифры сразу после двухбайтового префикса
+_FIELDS_COUNT = 5
+_FIELDS_WIDTH = 3
+_FIELDS_STRUCT = struct.Struct(f'{_FIELDS_COUNT * _FIELDS_WIDTH}B')
+_FIELDS_END = 2 + _FIELDS_COUNT * _FIELDS_WIDTH
+# ord('0') * 111 - поправка на ASCII код '0' в каждой из трех цифр
+_ASCII_ZERO_OFFSET = ord('0') * 111
+
+
+def decode_fixed_width_fields(message: bytes) -> Tuple[int, int, int, int, int] or None:
+	"""
+	Декодировать 5 трехзначных полей после префикса одним вызовом struct.
+	:param message: Строка с serial, начинающаяся с префикса.
+	:return:        Значения 5 сенсоров или None, если строка повреждена.
+	"""
+	fields = message[2:_FIELDS_END]
+	if len(fields) != _FIELDS_END - 2 or not fields.isdigit():
+		return None
+	d = _FIELDS_STRUCT.unpack(fields)
+	return (d[0] * 100 + d[1] * 10 + d[2] - _ASCII_ZERO_OFFSET,
+			d[3] * 100 + d[4] * 10 + d[5] - _ASCII_ZERO_OFFSET,
+			d[6] * 100 + d[7] * 10 + d[8] - _ASCII_ZERO_OFFSET,
+			d[9] * 100 + d[10] * 10 + d[11] - _ASCII_ZERO_OFFSET,
+			d[12] * 100 + d[13] * 10 + d[14] - _ASCII_ZERO_OFFSET)
+
+
+def _payload(message: bytes) -> bytes:
+	"""
+	Получить данные между префиксом и завершающим символом `E`.
+	:param message: Строка с serial.
+	:return:        Данные сообщения.
+	"""
+	payload = message[2:].rstrip(b'\r\n')
+	if payload and payload[-1] == MESSAGE_END:
+		payload = payload[:-1]
+	return payload
+
+
+def decode_battery(message: bytes) -> int or None:
+	"""
+	Декодировать уровень аккумулятора.
+	:param message: Строка с serial.
+	:return:        Уровень аккумулятора или None, если строка повреждена.
+	"""
+	payload = _payload(message)
+	if not payload.isdigit():
+		return None
+	return int(payload)
+
+
+def decode_rfid(message: bytes) -> str:
+	"""
+	Декодировать RFID метку.
+	:param message: Строка с serial.
+	:return:        RFID метка.
+	"""
+	return _payload(message).decode('ascii', errors='ignore')
+
+
+# двухбайтовый префикс -> (имя сенсора, декодер)
+TELEMETRY_DECODERS: Dict[bytes, Tuple[str, Callable[[bytes], Any]]] = {
+	b'SI': ('IR', decode_fixed_width_fields),
+	b'SU': ('US', decode_fixed_width_fields),
+	b'SA': ('BATTERY', decode_battery),
+	b'SF': ('RFID', decode_rfid),
+}
+
+
+def parse_telemetry_line(message: bytes) -> Tuple[str, Any] or None:
+	"""
+	Разобрать строку телеметрии, выбрав декодер по двухбайтовому префиксу.
+	:param message: Байты, принятые `serial.readline()`.
+	:return:        (имя сенсора, значение) или None для неизвестных и поврежденных строк.
+	"""
+	decoder = TELEMETRY_DECODERS.get(message[:2])
+	if decoder is None:
+		return None
+	sensor_name, decode = decoder
+	value = decode(message)
+	if value is None:
+		return None
+	return sensor_name, value
+
+
+class Line_Framer(object):
+	"""
+	- Выделяет завершенные строки из потока байтов, прочитанного с serial блоками любого размера.
+	- Неполная строка остается в буфере до следующего чтения.
+	- Буфер без перевода строки длиннее `max_line_length` отбрасывается, чтобы мусор на линии не копился.
+	"""
+
+	def __init__(self, max_line_length: int = 256):
+		"""
+		:param max_line_length: Максимальная длина строки, байт.
+		"""
+		self.max_line_length = max_line_length
+		self.__buffer = bytearray()
+		self.lines = 0
+		self.dropped_bytes = 0
+
+	def feed(self, data: bytes) -> List[bytes]:
+		"""
+		Добавить прочитанные байты и получить завершенные строки.
+		:param data: Байты, прочитанные с serial.
+		:return:     Строки вместе с переводом строки, как у `serial.readline()`.
+		"""
+		buffer = self.__buffer
+		buffer += data
+		lines = []
+		start = 0
+		while True:
+			end = buffer.find(LINE_END, start)
+			if end < 0:
+				break
+			lines.append(bytes(buffer[start:end + 1]))
+			start = end + 1
+		# сдвигаем буфер один раз за чтение, а не на каждую строку
+		if start:
+			del buffer[:start]
+		if len(buffer) > self.max_line_length:
+			self.dropped_bytes += len(buffer)
+			buffer.clear()
+		self.lines += len(lines)
+		return lines
@@ -13,6 +13,7 @@ import json
 import logging
 import time
 import asyncio
+import threading
 
 import requests
 from tornado.ioloop import IOLoop
@@ -25,6 +26,8 @@ from socket import gethostname
 
 # from ... import utils
 from parts.web_controller import utils
+from parts.frame_pool import retain_frame, release_frame
+from parts.jpeg_frame import Jpeg_Frame
 
 logger = logging.getLogger(__name__)
 
@@ -102,10 +105,15 @@ class RemoteWebServer():
 
 class LocalWebController(tornado.web.Application):
 
-    def __init__(self, port=8887, mode='user'):
+    def __init__(self, port=8887, mode='user', hardware=None, frame_age_monitor=None):
         '''
         Create and publish variables needed on many of
         the web handlers.
+        hardware: optional parts.async_serial.Async_RobotHardware, started
+        on this server's IOLoop so handlers can send actuator commands and
+        stream telemetry without crossing threads.
+        frame_age_monitor: optional parts.latency.Frame_Age_Monitor, the
+        VideoAPI handlers record the age of every frame they encode.
         '''
 
         print('Starting Donkey Server...', end='')
@@ -123,8 +131,18 @@ class LocalWebController(tornado.web.Application):
         self.port = port
 
         self.num_records = 0
+        self.telemetry = None
         self.wsclients = []
         self.loop = None
+        self.hardware = hardware
+        # guards swapping images against VideoAPI handlers retaining them for encoding
+        self.images_lock = threading.Lock()
+        self.img_arr_top = None
+        self.img_arr_bot = None
+        self.img_arr_aruco = None
+        # capture time of each served image
+        self.image_times = {}
+        self.frame_age_monitor = frame_age_monitor
 
 
         handlers = [
@@ -132,6 +150,7 @@ class LocalWebController(tornado.web.Application):
             (r"/drive", DriveAPI),
             (r"/wsDrive", WebSocketDriveAPI),
             (r"/wsCalibrate", WebSocketCalibrateAPI),
+            (r"/wsTelemetry", WebSocketTelemetryAPI),
             (r"/video_top", VideoAPI_Top),
             (r"/video_bot", VideoAPI_Bot),
             (r"/video_aruco", VideoAPI_Detected_Aruco),
@@ -148,9 +167,12 @@ class LocalWebController(tornado.web.Application):
 
     def update(self):
         ''' Start the tornado webserver. '''
-        asyncio.set_event_loop(asyncio.new_event_loop())
+        asyncio_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(asyncio_loop)
         self.listen(self.port)
         self.loop = IOLoop.instance()
+        if self.hardware is not None:
+            self.hardware.start(loop=asyncio_loop)
         self.loop.start()
 
     def update_wsclients(self, data):
@@ -164,18 +186,26 @@ class LocalWebController(tornado.web.Application):
                     logger.warn("Error writing websocket message", exc_info=e)
                     pass
 
-    def run_threaded(self, img_arr_top=None, img_arr_bot=None, img_arr_aruco=None, num_records=0, mode=None, recording=None):
+    def run_threaded(self, img_arr_top=None, img_arr_bot=None, img_arr_aruco=None, num_records=0, mode=None, recording=None,
+                     telemetry=None, frame_time_top=None, frame_time_bot=None, frame_time_aruco=None):
         """
         :param img_arr: current camera top image or None
         :param img_arr: current camera bot image or None
         :param num_records: current number of data records
         :param mode: default user/mode
         :param recording: default recording mode
+        :param telemetry: telemetry vector from Sensor_Telemetry or None
+        :param frame_time_top: capture time of the top camera frame
+        :param frame_time_bot: capture time of the bottom camera frame
+        :param frame_time_aruco: capture time of the frame the aruco image is drawn on,
+            older than frame_time_top when detection runs on its own thread; defaults to frame_time_top
         """
         # self.img_arr = img_arr
-        self.img_arr_top = img_arr_top
-        self.img_arr_bot = img_arr_bot
-        self.img_arr_aruco = img_arr_aruco
+        self.set_image('img_arr_top', img_arr_top, frame_time_top)
+        self.set_image('img_arr_bot', img_arr_bot, frame_time_bot)
+        if frame_time_aruco is None:
+            frame_time_aruco = frame_time_top
+        self.set_image('img_arr_aruco', img_arr_aruco, frame_time_aruco)
         self.num_records = num_records
 
         #
@@ -197,6 +227,13 @@ class LocalWebController(tornado.web.Application):
             self.recording_latch = None;
             changes["recording"] = self.recording;
 
+        # Send telemetry vector to websocket clients when it changes
+        if telemetry is not None:
+            telemetry = telemetry.tolist()
+            if telemetry != self.telemetry:
+                self.telemetry = telemetry
+                changes['telemetry'] = telemetry
+
         # Send record count to websocket clients
         if (self.num_records is not None and self.recording is True):
             if self.num_records % 10 == 0:
@@ -219,11 +256,44 @@ class LocalWebController(tornado.web.Application):
 
         return self.angle, self.throttle, self.mode, self.recording, buttons
 
-    def run(self, img_arr_top=None, img_arr_bot=None, img_arr_aruco=None, num_records=0, mode=None, recording=None):
-        return self.run_threaded(img_arr_top, img_arr_bot, img_arr_aruco, num_records, mode, recording)
+    def set_image(self, name, img_arr, frame_time=None):
+        '''
+        Keep a reference to a pool frame (parts.frame_pool) while it is the
+        image served by the VideoAPI handlers.
+        '''
+        with self.images_lock:
+            previous = getattr(self, name)
+            if img_arr is previous:
+                return
+            retain_frame(img_arr)
+            setattr(self, name, img_arr)
+            self.image_times[name] = frame_time
+            release_frame(previous)
+
+    def record_frame_age(self, name, consumer):
+        '''
+        Record the age of the image `name` just encoded by a VideoAPI handler.
+        '''
+        if self.frame_age_monitor is not None:
+            self.frame_age_monitor.record(consumer, self.image_times.get(name))
+
+    def hold_image(self, name):
+        '''
+        Current image, retained for the caller until release_frame(image).
+        '''
+        with self.images_lock:
+            img_arr = getattr(self, name)
+            retain_frame(img_arr)
+            return img_arr
+
+    def run(self, img_arr_top=None, img_arr_bot=None, img_arr_aruco=None, num_records=0, mode=None, recording=None,
+            telemetry=None, frame_time_top=None, frame_time_bot=None, frame_time_aruco=None):
+        return self.run_threaded(img_arr_top, img_arr_bot, img_arr_aruco, num_records, mode, recording, telemetry,
+                                 frame_time_top, frame_time_bot, frame_time_aruco)
 
     def shutdown(self):
-        pass
+        if self.hardware is not None and self.loop is not None:
+            self.loop.add_callback(self.hardware.stop)
 
 
 class DriveAPI(RequestHandler):
@@ -350,6 +420,43 @@ class WebSocketCalibrateAPI(tornado.websocket.WebSocketHandler):
         print("Client disconnected")
 
 
+class WebSocketTelemetryAPI(tornado.websocket.WebSocketHandler):
+    '''
+    Streams AutoBot telemetry from the async hardware transport
+    as JSON messages: {"US": [...], "IR": [...], "BATTERY": int}.
+    '''
+    sensor_names = ('US', 'IR', 'BATTERY')
+
+    def check_origin(self, origin):
+        return True
+
+    def open(self):
+        self.stream_task = None
+        if self.application.hardware is None:
+            self.close()
+            return
+        self.stream_task = asyncio.ensure_future(self.stream(self.application.hardware))
+
+    async def stream(self, hardware):
+        try:
+            async for snapshot in hardware.subscribe(self.sensor_names):
+                data = {name: snapshot.sensors[name].value for name in self.sensor_names}
+                try:
+                    await self.write_message(json.dumps(data))
+                except tornado.websocket.WebSocketClosedError:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # the serial port failed, hardware.error holds the exception
+            logger.warning(f'telemetry stream stopped: {e}')
+            self.close()
+
+    def on_close(self):
+        if self.stream_task is not None:
+            self.stream_task.cancel()
+
+
 class VideoAPI_Top(RequestHandler):
     '''
     Serves a MJPEG of the images posted from the vehicle.
@@ -365,10 +472,17 @@ class VideoAPI_Top(RequestHandler):
         while True:
 
             interval = .01
-            if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr_top'):
-
-                img = utils.arr_to_binary(self.application.img_arr_top)
+            # hold first: the image may be reset to None between a check and the hold
+            img_arr = None
+            if served_image_timestamp + interval < time.time():
+                img_arr = self.application.hold_image('img_arr_top')
+            if img_arr is not None:
+                try:
+                    # MJPEG camera frames are served as captured
+                    img = img_arr.jpeg if isinstance(img_arr, Jpeg_Frame) else utils.arr_to_binary(img_arr)
+                finally:
+                    release_frame(img_arr)
+                self.application.record_frame_age('img_arr_top', 'mjpeg/top')
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))
@@ -397,10 +511,17 @@ class VideoAPI_Bot(RequestHandler):
         while True:
 
             interval = .01
-            if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr_bot'):
-
-                img = utils.arr_to_binary(self.application.img_arr_bot)
+            # hold first: the image may be reset to None between a check and the hold
+            img_arr = None
+            if served_image_timestamp + interval < time.time():
+                img_arr = self.application.hold_image('img_arr_bot')
+            if img_arr is not None:
+                try:
+                    # MJPEG camera frames are served as captured
+                    img = img_arr.jpeg if isinstance(img_arr, Jpeg_Frame) else utils.arr_to_binary(img_arr)
+                finally:
+                    release_frame(img_arr)
+                self.application.record_frame_age('img_arr_bot', 'mjpeg/bot')
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))
@@ -429,10 +550,17 @@ class VideoAPI_Detected_Aruco(RequestHandler):
         while True:
 
             interval = .01
-            if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr_aruco'):
-
-                img = utils.arr_to_binary(self.application.img_arr_aruco)
+            # hold first: the image may be reset to None between a check and the hold
+            img_arr = None
+            if served_image_timestamp + interval < time.time():
+                img_arr = self.application.hold_image('img_arr_aruco')
+            if img_arr is not None:
+                try:
+                    # MJPEG camera frames are served as captured
+                    img = img_arr.jpeg if isinstance(img_arr, Jpeg_Frame) else utils.arr_to_binary(img_arr)
+                finally:
+                    release_frame(img_arr)
+                self.application.record_frame_age('img_arr_aruco', 'mjpeg/aruco')
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))